@@ -1,25 +1,15 @@
 import streamlit as st
-import os
-from datetime import datetime, timedelta
-import pandas as pd
+from datetime import timedelta
+from src.utils.loaders import resale_last_modified
 
 st.set_page_config(
     page_title="Housing prices",
     page_icon="🏠",
     layout="wide",
 )
-@st.cache_data
-def load_csv():
-    return pd.read_csv("assets/data/geo_coords_2017.csv", index_col=0)
-
-
-if "data" not in st.session_state:
-    st.session_state.data = load_csv()
 
 st.write("# Welcome to HDB Resale app! (Beta)")
-timestamp = os.path.getmtime("assets/data/geo_coords_2017.csv")
-
-mod_date = datetime.fromtimestamp(timestamp)
+mod_date = resale_last_modified()
 mod_date += timedelta(hours=8)
 mod_date = mod_date.strftime("%d %m %Y %H:%M:%S")
 st.markdown(
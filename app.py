@@ -1,33 +1,54 @@
-from flask import Flask, request, url_for, redirect, render_template, jsonify
-from xgboost import XGBRegressor
-from datetime import datetime
-import numpy as np
+from flask import Flask, request, render_template, jsonify
 from src.utils.common_func import info_parser
+from src.utils.prediction import BatchPredictor
 
-model = XGBRegressor()
-hdb_details = pd.read_csv('resale-flat-prices/hdb-property-information.csv',
-                          usecols=['blk_no', 'street', 'year_completed'])
-
-model.load_model('model_xgb.json')
+# loaded once in the gunicorn master (preload_app) and shared by the forked workers,
+# requests only do in-memory lookups and a predict call
+predictor = BatchPredictor()
 
 app = Flask(__name__)
 
 
-@app.route('/')
+@app.route("/")
 def home():
-    return render_template('index.html')
+    return render_template("index.html")
 
 
 # predict function, POST method to take in inputs
-@app.route('/predict', methods=['POST', 'GET'])
+@app.route("/predict", methods=["POST", "GET"])
 def predict():
     feature_list = request.form.to_dict()
     print(feature_list)
-    new_features = info_parser(feature_list, mrt_array, malls_array, hdb_details)
-
-    prediction = model.predict(new_features)
-    return render_template('index.html',
-                           prediction_text=f"Your house is predicted to be valued at ${prediction[0]:.2f}")
+    new_features = info_parser(
+        feature_list, predictor.blocks, predictor.address_features
+    )
+    if new_features is None:
+        return render_template(
+            "index.html", prediction_text="The postal code could not be found"
+        )
+
+    prediction = predictor.model.predict(new_features)
+    return render_template(
+        "index.html",
+        prediction_text=f"Your house is predicted to be valued at ${prediction[0]:.2f}",
+    )
+
+
+# batch predictions, takes {"flats": [...]} and returns one price per flat
+@app.route("/api/predict", methods=["POST"])
+def predict_batch():
+    payload = request.get_json(force=True, silent=True)
+    flats = payload.get("flats") if isinstance(payload, dict) else payload
+    try:
+        predictions, timings = predictor.predict(flats)
+    except ValueError as err:
+        return jsonify(error=str(err)), 400
+
+    response = jsonify(predictions=predictions.tolist(), timings_ms=timings)
+    response.headers["Server-Timing"] = ", ".join(
+        f"{stage};dur={ms:.2f}" for stage, ms in timings.items()
+    )
+    return response
 
 
 if __name__ == "__main__":
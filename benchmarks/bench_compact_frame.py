@@ -0,0 +1,66 @@
+"""
+Memory per row of the resale frame held by the Streamlit app.
+
+Builds a frame shaped like the stored resale dataset from the 2012-2016 resale CSVs
+(synthetic coordinates and amenity features), then compares the default dtypes the
+pages used to get from ``pd.read_csv`` with the compact ``RESALE_SCHEMA`` dtypes.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_compact_frame.py
+"""
+import io
+import time
+import numpy as np
+import pandas as pd
+from src.utils.features import AMENITY_COLS
+from src.utils.preprocessing import Preprocessor
+from src.utils.storage import RESALE_SCHEMA, apply_compact_dtypes
+
+CSV_PATHS = [
+    "assets/resale-flat-prices/resale-flat-prices-based-on-registration-date-from-mar-2012-to-dec-2014.csv",
+    "assets/resale-flat-prices/resale-flat-prices-based-on-registration-date-from-jan-2015-to-dec-2016.csv",
+]
+
+
+def load_history() -> pd.DataFrame:
+    """
+    Returns the history as the legacy CSV stored it, read back with default dtypes.
+    """
+    df = pd.concat([pd.read_csv(path) for path in CSV_PATHS], ignore_index=True)
+    df = Preprocessor()(df)
+    rng = np.random.default_rng(0)
+    codes, uniques = pd.factorize(df["address"])
+    df["latitude"] = (1.25 + rng.random(len(uniques)) * 0.2)[codes]
+    df["longitude"] = (103.65 + rng.random(len(uniques)) * 0.35)[codes]
+    for col in AMENITY_COLS:
+        df[col] = rng.random(len(uniques))[codes] * 10
+    df["mrt"] = df["mrt"].round().astype(int)
+    df["malls"] = df["malls"].round().astype(int)
+    df["flat_cat"] = df["flat_type"].factorize()[0]
+    buffer = io.StringIO()
+    df.to_csv(buffer)
+    buffer.seek(0)
+    return pd.read_csv(buffer, index_col=0)
+
+
+def bytes_per_row(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / len(df)
+
+
+if __name__ == "__main__":
+    default = load_history()
+    start = time.perf_counter()
+    compacted = apply_compact_dtypes(default.copy(), RESALE_SCHEMA)
+    elapsed = time.perf_counter() - start
+
+    print(f"rows: {len(default)}")
+    print(f"default dtypes: {bytes_per_row(default):8.1f} bytes/row")
+    print(f"compact dtypes: {bytes_per_row(compacted):8.1f} bytes/row")
+    print(f"reduction:      {bytes_per_row(default) / bytes_per_row(compacted):8.1f}x")
+    print(f"apply_compact_dtypes() took {elapsed * 1000:.0f} ms")
+    print()
+    print(f"{'column':<24}{'default':>10}{'compact':>10}  bytes/row")
+    for col in default.columns:
+        before = default[col].memory_usage(deep=True, index=False) / len(default)
+        after = compacted[col].memory_usage(deep=True, index=False) / len(default)
+        print(f"{col:<24}{before:>10.1f}{after:>10.1f}")
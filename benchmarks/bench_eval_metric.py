@@ -0,0 +1,79 @@
+"""
+Time per boosting round with the old Python R² metric and the built-in metrics.
+
+``train.py`` used to pass a Python ``eval_metric`` calling ``sklearn.r2_score``,
+which xgboost calls on every round after copying the predictions of the eval set
+to NumPy. The same model is trained on the synthetic history of
+``bench_compact_frame`` with each metric, and with no eval set at all as a floor.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_eval_metric.py
+"""
+import time
+import numpy as np
+import xgboost as xgb
+from sklearn.metrics import r2_score
+from sklearn.model_selection import train_test_split
+from benchmarks.bench_compact_frame import load_history
+from src.utils.training import PARAMS, to_features
+
+ROUNDS = 100
+
+
+def custom_r2(predt: np.ndarray, dtrain: xgb.DMatrix):
+    # the metric train.py used, arguments in its original order
+    return -r2_score(predt, dtrain)
+
+
+class RoundTimer(xgb.callback.TrainingCallback):
+    def __init__(self):
+        self.times = []
+        self.start = None
+
+    def before_iteration(self, model, epoch, evals_log):
+        self.start = time.perf_counter()
+        return False
+
+    def after_iteration(self, model, epoch, evals_log):
+        self.times.append(time.perf_counter() - self.start)
+        return False
+
+
+def run(X_train, X_test, y_train, y_test, eval_metric, with_eval=True):
+    timer = RoundTimer()
+    params = {**PARAMS, "eval_metric": eval_metric}
+    if not with_eval:
+        params.pop("eval_metric")
+    model = xgb.XGBRegressor(**params, n_estimators=ROUNDS, callbacks=[timer], n_jobs=1)
+    start = time.perf_counter()
+    model.fit(
+        X_train,
+        y_train,
+        eval_set=[(X_test, y_test)] if with_eval else None,
+        verbose=False,
+    )
+    return np.array(timer.times), time.perf_counter() - start, model
+
+
+if __name__ == "__main__":
+    X, y = to_features(load_history())
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42
+    )
+    print(f"train rows: {len(X_train)}, eval rows: {len(X_test)}, rounds: {ROUNDS}")
+    print(f"{'metric':<16}{'ms/round':>10}{'p95 ms':>10}{'total s':>10}")
+    for name, metric, with_eval in [
+        ("custom_r2", custom_r2, True),
+        ("rmse", "rmse", True),
+        ("mae", "mae", True),
+        ("no eval set", None, False),
+    ]:
+        times, total, model = run(X_train, X_test, y_train, y_test, metric, with_eval)
+        print(
+            f"{name:<16}{times.mean() * 1000:>10.1f}"
+            f"{np.percentile(times, 95) * 1000:>10.1f}{total:>10.2f}"
+        )
+        if name == "custom_r2":
+            # the swapped arguments score the labels against the predictions
+            history = model.evals_result()["validation_0"]["custom_r2"]
+            print(f"{'':<16}swapped R2 after the last round: {-history[-1]:.3f}")
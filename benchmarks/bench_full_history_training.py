@@ -0,0 +1,90 @@
+"""
+Full-history training against the 10000 row baseline.
+
+Both models are scored on the same holdout, the latest ``HOLDOUT_MONTHS`` of the
+store. The baseline is trained like ``train.py`` always has: the last 10000 rows
+before the holdout with a random 80/20 split for early stopping. Every mode runs in
+its own process so that the peak RSS is its own.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_full_history_training.py [--root DIR] [--features PATH]
+"""
+import sys
+import json
+import argparse
+import subprocess
+
+RUN_MODE = """
+import sys, json, time
+import numpy as np
+import xgboost as xgb
+from sklearn.model_selection import train_test_split
+from src.utils.features import AddressFeatureTable
+from src.utils.storage import PartitionedStore
+from src.utils.training import (
+    NUM_ROUNDS, PARAMS, peak_rss_mb, r2, split_partitions,
+    store_chunks, to_features, train_full_history,
+)
+
+mode, root, features_path, nthread = sys.argv[1:5]
+nthread = int(nthread)
+store = PartitionedStore(root=root)
+address_features = AddressFeatureTable(path=features_path)
+start = time.perf_counter()
+if mode == "baseline":
+    train_partitions, validation, holdout = split_partitions(store)
+    rows = store.read(partitions=train_partitions + validation).tail(10000)
+    X, y = to_features(rows)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42
+    )
+    params = {k: v for k, v in PARAMS.items() if k != "eval_metric"}
+    model = xgb.XGBRegressor(
+        **params, n_estimators=NUM_ROUNDS, early_stopping_rounds=10,
+        eval_metric="rmse", n_jobs=nthread,
+    )
+    model.fit(X_train, y_train, eval_set=[(X_test, y_test)], verbose=False)
+    X_hold, y_hold = zip(*store_chunks(store, holdout))
+    y_hold = np.concatenate(y_hold)
+    score = r2(y_hold, model.predict(np.concatenate(X_hold)))
+else:
+    booster, report = train_full_history(
+        store, address_features, nthread=nthread,
+        external_memory=mode == "external",
+    )
+    score = report["r2"]
+print(json.dumps({
+    "wall": time.perf_counter() - start, "rss": peak_rss_mb(), "r2": score,
+}))
+"""
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", default="assets/data/resale")
+    parser.add_argument("--features", default="assets/data/address_features.parquet")
+    parser.add_argument("--nthread", type=int, default=-1)
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}{'wall':>10}{'peak RSS':>12}{'holdout R2':>12}")
+    for mode in ["baseline", "full", "external"]:
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                RUN_MODE,
+                mode,
+                args.root,
+                args.features,
+                str(args.nthread),
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            print(f"{mode:<12}{result.stderr.strip().splitlines()[-1]}")
+            continue
+        stats = json.loads(result.stdout.strip().splitlines()[-1])
+        print(
+            f"{mode:<12}{stats['wall']:>8.1f} s{stats['rss']:>9.0f} MB"
+            f"{stats['r2']:>12.3f}"
+        )
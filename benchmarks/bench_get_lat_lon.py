@@ -0,0 +1,77 @@
+"""
+Benchmark of Preprocessor.get_lat_lon against the previous iterrows loop.
+
+Uses the 2012-2016 resale CSVs. Every address gets a synthetic coordinate, then the
+newest rows are treated as the new batch so that all addresses are already known,
+which is the common case for the weekly update.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_get_lat_lon.py [batch_size]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from src.utils.geocode import GeocodeCache, GeocodeResolver
+from src.utils.preprocessing import Preprocessor
+
+CSV_PATHS = [
+    "assets/resale-flat-prices/resale-flat-prices-based-on-registration-date-from-mar-2012-to-dec-2014.csv",
+    "assets/resale-flat-prices/resale-flat-prices-based-on-registration-date-from-jan-2015-to-dec-2016.csv",
+]
+
+
+def load_history() -> pd.DataFrame:
+    df = pd.concat([pd.read_csv(path) for path in CSV_PATHS], ignore_index=True)
+    Preprocessor.get_address(df)
+    codes, uniques = pd.factorize(df["address"])
+    rng = np.random.default_rng(0)
+    lat = 1.25 + rng.random(len(uniques)) * 0.2
+    lon = 103.65 + rng.random(len(uniques)) * 0.35
+    df["latitude"], df["longitude"] = lat[codes], lon[codes]
+    return df
+
+
+def legacy_get_lat_lon(old_df: pd.DataFrame, new_df: pd.DataFrame):
+    """
+    The loop get_lat_lon used before it was vectorized, minus the network calls.
+    """
+    dict_lat_lon = (
+        old_df[["address", "latitude", "longitude"]]
+        .drop_duplicates(subset=["address"])
+        .set_index("address")
+        .to_dict()
+    )
+    for idx, row in new_df.iterrows():
+        new_df.loc[idx, ["latitude", "longitude"]] = (
+            dict_lat_lon["latitude"][row["address"]],
+            dict_lat_lon["longitude"][row["address"]],
+        )
+
+
+def timeit(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    BATCH_SIZE = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    history = load_history()
+    new_df = history.iloc[-BATCH_SIZE:].drop(columns=["latitude", "longitude"])
+    # every batch address is in the history, the in-memory cache is never consulted
+    preprocessor = Preprocessor(GeocodeResolver(GeocodeCache(":memory:")))
+
+    print(f"history rows: {len(history)}, batch rows: {len(new_df)}")
+    legacy_df = new_df.copy()
+    legacy = timeit(legacy_get_lat_lon, history, legacy_df)
+    vectorized_df = new_df.copy()
+    vectorized = timeit(preprocessor.get_lat_lon, history, vectorized_df)
+
+    assert np.allclose(
+        legacy_df[["latitude", "longitude"]].astype(float),
+        vectorized_df[["latitude", "longitude"]],
+    )
+    print(f"iterrows loop: {legacy:.3f}s")
+    print(f"vectorized:    {vectorized:.3f}s ({legacy / vectorized:.0f}x faster)")
@@ -0,0 +1,31 @@
+"""
+Size of the data sent to the browser by the map page.
+
+Compares the JSON of every transaction, which the ``HexagonLayer`` used to receive,
+with the JSON of the hexagonal cells binned on the server. Uses the synthetic
+history of ``bench_compact_frame``.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_map_payload.py
+"""
+import time
+from benchmarks.bench_compact_frame import load_history
+from src.utils.hexbin import bin_prices
+from src.utils.storage import RESALE_SCHEMA, apply_compact_dtypes
+
+if __name__ == "__main__":
+    df = apply_compact_dtypes(load_history(), RESALE_SCHEMA)
+    full = df.to_json(orient="records")
+
+    start = time.perf_counter()
+    cells = bin_prices(df)
+    elapsed = time.perf_counter() - start
+    payload = cells[["latitude", "longitude", "count", "median"]].to_json(
+        orient="records"
+    )
+
+    print(f"rows: {len(df)}, cells: {len(cells)}")
+    print(f"every row:   {len(full) / 1e6:8.2f} MB")
+    print(f"cells:       {len(payload) / 1e6:8.2f} MB")
+    print(f"reduction:   {len(full) / len(payload):8.0f}x")
+    print(f"bin_prices() took {elapsed * 1000:.0f} ms")
@@ -0,0 +1,144 @@
+"""
+Model load time by format, and the memory of forked workers with and without
+preloading.
+
+A depth-12, 200-round model is trained on the synthetic history of
+``bench_compact_frame`` unless ``--model`` is given, and saved as JSON and UBJSON.
+The workers are forked like gunicorn's: with ``preload`` the parent loads the model
+and the workers share it, with ``per-worker`` every worker loads its own copy.
+Each worker predicts once, then reports its resident memory, its proportional
+share (PSS) and the pages only it holds from ``/proc/self/smaps_rollup``.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_model_loading.py [--model PATH] [--workers N]
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import xgboost as xgb
+
+REPEATS = 5
+
+
+def smaps_mb() -> dict:
+    fields = {}
+    with open("/proc/self/smaps_rollup", "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "private": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def train_model(path: str):
+    from benchmarks.bench_compact_frame import load_history
+    from src.utils.training import PARAMS, to_features
+
+    X, y = to_features(load_history())
+    params = {**PARAMS, "max_depth": 12}
+    booster = xgb.train(params, xgb.DMatrix(X, y), num_boost_round=200)
+    booster.save_model(path)
+
+
+def run_workers(mode: str, path: str, workers: int):
+    """
+    Forks the workers and prints their memory as JSON, run in its own process.
+    """
+    booster = None
+    if mode == "preload":
+        booster = xgb.Booster()
+        booster.load_model(path)
+        gc.freeze()
+    batch = np.random.default_rng(0).random((10, 10), dtype=np.float32)
+    pipes = []
+    for _ in range(workers):
+        read_end, write_end = os.pipe()
+        if os.fork() == 0:
+            os.close(read_end)
+            if booster is None:
+                booster = xgb.Booster()
+                booster.load_model(path)
+            booster.inplace_predict(batch)
+            os.write(write_end, json.dumps(smaps_mb()).encode())
+            os._exit(0)
+        os.close(write_end)
+        pipes.append(read_end)
+    stats = []
+    for read_end in pipes:
+        with os.fdopen(read_end, "r") as f:
+            stats.append(json.loads(f.read()))
+    while True:
+        try:
+            os.wait()
+        except ChildProcessError:
+            break
+    print(json.dumps({"parent": smaps_mb(), "workers": stats}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", help="an xgboost model, trained if not given")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--run-workers", choices=["preload", "per-worker"])
+    args = parser.parse_args()
+    if args.run_workers:
+        run_workers(args.run_workers, args.model, args.workers)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = args.model
+        if source is None:
+            source = os.path.join(tmp_dir, "trained.json")
+            train_model(source)
+        booster = xgb.Booster()
+        booster.load_model(source)
+        print(f"model: {booster.num_boosted_rounds()} rounds")
+        print(f"{'format':<10}{'size':>10}{'load':>10}")
+        paths = {}
+        for fmt in ["json", "ubj"]:
+            paths[fmt] = os.path.join(tmp_dir, f"model.{fmt}")
+            booster.save_model(paths[fmt])
+            times = []
+            for _ in range(REPEATS):
+                start = time.perf_counter()
+                xgb.Booster().load_model(paths[fmt])
+                times.append(time.perf_counter() - start)
+            size = os.path.getsize(paths[fmt]) / 2**20
+            print(f"{fmt:<10}{size:>7.1f} MB{np.median(times) * 1000:>7.0f} ms")
+
+        print(f"\n{args.workers} workers, MB per worker")
+        print(f"{'mode':<12}{'RSS':>8}{'PSS':>8}{'private':>9}{'total PSS':>11}")
+        for mode in ["per-worker", "preload"]:
+            result = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--run-workers",
+                    mode,
+                    "--model",
+                    paths["ubj"],
+                    "--workers",
+                    str(args.workers),
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            workers = stats["workers"]
+            total = stats["parent"]["pss"] + sum(w["pss"] for w in workers)
+            print(
+                f"{mode:<12}{np.mean([w['rss'] for w in workers]):>8.0f}"
+                f"{np.mean([w['pss'] for w in workers]):>8.0f}"
+                f"{np.mean([w['private'] for w in workers]):>9.0f}{total:>11.0f}"
+            )
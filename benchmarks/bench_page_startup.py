@@ -0,0 +1,48 @@
+"""
+Time to first render of every Streamlit page on a cold start.
+
+Every page runs in a fresh interpreter, like the first visit after a dyno wakes up,
+through Streamlit's ``AppTest`` harness. The first run includes importing the page's
+modules and loading its datasets; the rerun shows the cost once the cached loaders
+are warm. Needs the stores, rollups and model built by the update workflow.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_page_startup.py
+"""
+import os
+import sys
+import glob
+import subprocess
+
+PAGES = ["Resale_App.py"] + sorted(glob.glob("pages/*.py"))
+
+RUN_PAGE = """
+import sys, time, resource
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=300)
+app.run()
+first = time.perf_counter() - start
+assert not app.exception, app.exception
+start = time.perf_counter()
+app.run()
+rerun = time.perf_counter() - start
+print(first, rerun, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+"""
+
+if __name__ == "__main__":
+    env = {**os.environ, "PYTHONPATH": os.getcwd()}
+    print(f"{'page':<30}{'first render':>14}{'rerun':>10}{'peak RSS':>12}")
+    for page in PAGES:
+        result = subprocess.run(
+            [sys.executable, "-c", RUN_PAGE, page],
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+        if result.returncode != 0:
+            error = result.stderr.strip().splitlines()[-1:] or ["failed"]
+            print(f"{page:<30}{error[0]}")
+            continue
+        first, rerun, rss = map(float, result.stdout.split()[-3:])
+        print(f"{page:<30}{first:>12.2f} s{rerun * 1000:>7.0f} ms{rss:>9.0f} MB")
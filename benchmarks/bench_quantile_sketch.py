@@ -0,0 +1,83 @@
+"""
+Accuracy of the medians merged from the rollup digests.
+
+Builds the rollup cells of the 2012-2016 resale CSVs at several compressions, merges
+them into coarser slices and compares the medians with exact pandas medians. The
+rank error is how far the estimate's rank in the slice is from one half. Cells are
+small enough that their digests are nearly exact, so the error bound itself is shown
+by a single digest of every price. Prices are heavily tied (multiples of 1000), so a
+centroid mean between two tied prices costs the rank of the whole tie and the rank
+error of that digest stops improving around 0.4% while the value error stays small.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_quantile_sketch.py
+"""
+import time
+import numpy as np
+import pandas as pd
+from src.utils.preprocessing import Preprocessor
+from src.utils.rollup import QUANTILES, ResaleRollup, summarize
+from src.utils.sketch import TDigest
+
+CSV_PATHS = [
+    "assets/resale-flat-prices/resale-flat-prices-based-on-registration-date-from-mar-2012-to-dec-2014.csv",
+    "assets/resale-flat-prices/resale-flat-prices-based-on-registration-date-from-jan-2015-to-dec-2016.csv",
+]
+COMPRESSIONS = [25, 50, 100, 200]
+SLICES = [["year"], ["town"], ["flat_type"], ["year", "flat_type"], ["year", "month"]]
+
+
+def rank_error(prices: np.ndarray, estimate: float, q: float = 0.5) -> float:
+    below = np.searchsorted(prices, estimate, side="left")
+    above = np.searchsorted(prices, estimate, side="right")
+    # any rank between below and above is consistent with the estimate
+    target = len(prices) * q
+    return max(0, below - target, target - above) / len(prices)
+
+
+if __name__ == "__main__":
+    df = pd.concat([pd.read_csv(path) for path in CSV_PATHS], ignore_index=True)
+    df = Preprocessor()(df)
+    print(f"rows: {len(df)}")
+    print(
+        f"{'compression':>11}{'slice':>18}{'groups':>8}{'mean rel':>10}"
+        f"{'max rel':>10}{'max rank':>10}{'slice ms':>10}"
+    )
+    for compression in COMPRESSIONS:
+        start = time.perf_counter()
+        rollup = ResaleRollup(path="", compression=compression)
+        rollup.table = summarize(df, compression)
+        build = time.perf_counter() - start
+        centroids = rollup.table["centroids"].map(len)
+        for by in SLICES:
+            start = time.perf_counter()
+            estimates = rollup.slice(by).set_index(by)["median"]
+            elapsed = time.perf_counter() - start
+            groups = df.groupby(by, observed=True)["resale_price"]
+            exact = groups.median()
+            relative = (estimates - exact.reindex(estimates.index)).abs() / exact
+            ranks = [
+                rank_error(np.sort(prices.to_numpy()), estimates.loc[key])
+                for key, prices in groups
+            ]
+            print(
+                f"{compression:>11}{'x'.join(by):>18}{len(exact):>8}"
+                f"{relative.mean():>10.2%}{relative.max():>10.2%}"
+                f"{max(ranks):>10.2%}{elapsed * 1000:>10.1f}"
+            )
+        print(
+            f"{'':>11} build {build:.2f} s, {len(rollup)} cells, "
+            f"{centroids.mean():.1f} centroids/cell (max {centroids.max()})"
+        )
+        prices = np.sort(df["resale_price"].to_numpy())
+        digest = TDigest.from_values(prices, compression)
+        levels = np.array(list(QUANTILES.values()))
+        estimates = digest.quantile(levels)
+        worst_rank = max(map(rank_error, [prices] * len(levels), estimates, levels))
+        worst_relative = np.max(
+            np.abs(estimates - np.quantile(prices, levels)) / estimates
+        )
+        print(
+            f"{'':>11} one digest of every price: {len(digest)} centroids, "
+            f"max rel {worst_relative:.2%}, max rank {worst_rank:.2%}"
+        )
@@ -0,0 +1,75 @@
+"""
+Benchmark and accuracy check of StreetIndex against difflib.get_close_matches.
+
+Every street in the HDB property information is expanded to the long form OneMap
+returns ("AVE" -> "AVENUE"), then matched back by both methods. difflib is run the way
+info_parser used to run it, against the street column with duplicates. The same
+accuracy checks are asserted in ``tests/test_streets.py``.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_street_index.py
+"""
+import time
+import difflib as dl
+import numpy as np
+import pandas as pd
+from src.utils.features import HDB_INFO_PATH
+from src.utils.streets import ABBREVIATIONS, StreetIndex
+
+EXPANSIONS = {abbreviation: word for word, abbreviation in ABBREVIATIONS.items()}
+
+
+def expand(street: str) -> str:
+    return " ".join(EXPANSIONS.get(word, word) for word in street.split())
+
+
+if __name__ == "__main__":
+    streets = pd.read_csv(HDB_INFO_PATH, usecols=["street"])["street"].values
+    unique_streets = sorted(set(streets))
+    queries = [expand(street) for street in unique_streets]
+
+    start = time.perf_counter()
+    index = StreetIndex(streets)
+    build = time.perf_counter() - start
+
+    difflib_times, index_times, cached_times = [], [], []
+    difflib_matches, index_matches = [], []
+    for query in queries:
+        start = time.perf_counter()
+        close = dl.get_close_matches(query, streets)
+        difflib_times.append(time.perf_counter() - start)
+        difflib_matches.append(close[0] if close else None)
+
+        start = time.perf_counter()
+        index_matches.append(index.match(query))
+        index_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        index.match(query)
+        cached_times.append(time.perf_counter() - start)
+
+    truth = np.array(unique_streets, dtype=object)
+    difflib_matches = np.array(difflib_matches, dtype=object)
+    index_matches = np.array(index_matches, dtype=object)
+    agree = difflib_matches == index_matches
+    print(f"streets: {len(streets)} ({len(unique_streets)} unique)")
+    print(f"index build: {build * 1000:.1f}ms")
+    for name, times in [
+        ("difflib", difflib_times),
+        ("index", index_times),
+        ("index (cached)", cached_times),
+    ]:
+        print(
+            f"{name:15s} mean {np.mean(times) * 1e6:10.1f}us "
+            f"p99 {np.percentile(times, 99) * 1e6:10.1f}us"
+        )
+    print(f"agreement with difflib: {agree.mean():.2%}")
+    print(f"difflib correct: {(difflib_matches == truth).mean():.2%}")
+    print(f"index correct:   {(index_matches == truth).mean():.2%}")
+    for query, expected, old, new in zip(
+        np.array(queries, dtype=object)[~agree],
+        truth[~agree],
+        difflib_matches[~agree],
+        index_matches[~agree],
+    ):
+        print(f"  {query!r}: difflib={old!r} index={new!r} expected={expected!r}")
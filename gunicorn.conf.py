@@ -0,0 +1,20 @@
+"""
+Gunicorn settings for the Flask app.
+
+With ``preload_app`` the app is imported once in the master, so the model, the
+address feature table and the block registry are loaded once and every forked worker
+shares their pages copy-on-write instead of loading its own copy. A model published
+while serving is loaded by each worker on its own.
+"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+preload_app = True
+
+
+def when_ready(server):
+    # the objects loaded by the app live as long as the workers; freezing them
+    # keeps the garbage collector of every worker from writing to their pages
+    gc.freeze()
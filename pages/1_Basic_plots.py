@@ -1,20 +1,20 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
+from src.utils.loaders import resale_rollup
 
 
 st.title("Resale prices at a glance")
 
 
-@st.cache_data
-def load_csv():
-    return pd.read_csv("assets/data/geo_coords_2017.csv", index_col=0)
+def load_rollup():
+    # median, quantiles and counts per year, month, town and flat type, kept up to
+    # date by update_csv.py so the page never groups the full history
+    return resale_rollup()
 
 
-if "data" not in st.session_state:
-    st.session_state.data = load_csv()
+if "rollup" not in st.session_state:
+    st.session_state.rollup = load_rollup()
 
 with st.expander("About this page"):
     st.markdown(
@@ -22,38 +22,40 @@ with st.expander("About this page"):
         "The plot will automatically update with there is new data from data.gov.sg"
     )
 
+rollup = st.session_state.rollup
+if len(rollup) == 0:
+    st.info("There are no resale transactions yet.")
+    st.stop()
+flat_types = sorted(rollup.table["flat_type"].unique())
+flat_type = st.selectbox("Flat type", ["All"] + flat_types)
+filters = {} if flat_type == "All" else {"flat_type": flat_type}
 
 fig, axarr = plt.subplots(2, 2, figsize=(10, 10))
 
-# Example plots - adjust as needed based on your CSV data
-avg = st.session_state.data.groupby("year").agg({"resale_price": "median"})
-sns.lineplot(data=avg, x="year", y="resale_price", ax=axarr[0][0])
+by_year = rollup.slice(["year"], **filters)
+sns.lineplot(data=by_year, x="year", y="median", ax=axarr[0][0])
 axarr[0][0].set_title("Resale Price by Year")
+axarr[0][0].set_ylabel("resale_price")
 
-year_subset = st.session_state.data[
-    st.session_state.data["year"] == st.session_state.data["year"].max()
-]
-ytd_avg = year_subset.groupby("month").agg({"resale_price": "median"})
-sns.lineplot(data=ytd_avg, x="month", y="resale_price", ax=axarr[0][1])
-axarr[0][1].set_title(
-    "YTD Median Resale Price by Month in {}".format(st.session_state.data["year"].max())
-)
+latest_year = by_year["year"].max()
+ytd_avg = rollup.slice(["month"], year=latest_year, **filters)
+sns.lineplot(data=ytd_avg, x="month", y="median", ax=axarr[0][1])
+axarr[0][1].set_title("YTD Median Resale Price by Month in {}".format(latest_year))
+axarr[0][1].set_ylabel("resale_price")
 # PLOT 3
-avg_town_price = st.session_state.data.groupby("town")["resale_price"].median()
-avg_town_price = avg_town_price.to_frame()
+avg_town_price = rollup.slice(["town"], **filters).set_index("town")
 sns.barplot(
     data=avg_town_price,
     x=avg_town_price.index,
-    y="resale_price",
-    order=avg_town_price.sort_values(by="resale_price", ascending=True).index,
+    y="median",
+    order=avg_town_price.sort_values(by="median", ascending=True).index,
     ax=axarr[1][0],
 )
 axarr[1][0].xaxis.set_tick_params(rotation=90)
 axarr[1][0].set_title("Median Resale Price by Town")
+axarr[1][0].set_ylabel("resale_price")
 ## PLOT 4
-mop_resale = st.session_state.data[st.session_state.data["remaining_lease_year"] > 93]
-mop_resale = mop_resale.groupby("year").agg({"town": "count"})
-sns.lineplot(data=mop_resale, x="year", y="town", ax=axarr[1][1])
+sns.lineplot(data=by_year, x="year", y="mop_count", ax=axarr[1][1])
 axarr[1][1].set_title("Number of Resale Flats sold < 2 years of MOP")
 axarr[1][1].set_ylabel("Number of Resale Flats")
 plt.tight_layout()
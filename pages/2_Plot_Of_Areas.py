@@ -1,58 +1,82 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import pydeck as pdk
+from src.utils.hexbin import RADIUS
+from src.utils.loaders import map_tiles
 
 
 st.title("Resale prices on a map")
 
+st.markdown("This might not look great as it is just an experiment.")
 
-@st.cache_data
-def load_csv():
-    return pd.read_csv("assets/data/geo_coords_2017.csv", index_col=0)
-
-
-if "data" not in st.session_state:
-    st.session_state.data = load_csv()
 
-st.markdown("This might not look great as it is just an experiment.")
+@st.cache_data(ttl=60 * 60 * 24)
+def load_cells(year: int = None, month: int = None, flat_type: str = None):
+    # the tiles hold the cells of every month and flat type, built by update_csv.py,
+    # so a change of filters only slices them; the browser gets one row per cell
+    filters = {"year": year, "month": month, "flat_type": flat_type}
+    cells = map_tiles().map_cells(
+        **{name: value for name, value in filters.items() if value is not None}
+    )
+    if cells.empty:
+        return cells
+    low, high = np.percentile(cells["median"], [5, 95])
+    scaled = np.clip((cells["median"] - low) / max(high - low, 1), 0, 1)
+    cells["color"] = [[int(255 * s), 0, int(255 - 255 * s), 200] for s in scaled]
+    cells["median_price"] = cells["median"].map("${:,.0f}".format)
+    return cells
 
 
-@st.cache_resource(ttl=60 * 60 * 24)
-def load_pdk():
+def load_pdk(cells: pd.DataFrame) -> pdk.Deck:
     view_state = pdk.ViewState(
-        latitude=st.session_state.data["latitude"].mean(),
-        longitude=st.session_state.data["longitude"].mean(),
+        latitude=cells["latitude"].mean(),
+        longitude=cells["longitude"].mean(),
         zoom=10,
         pitch=50,
         bearing=-27.36,
     )
 
-    # Create a hexagon layer
-    min_price = st.session_state.data["resale_price"].min()
-    max_price = st.session_state.data["resale_price"].max()
-    resale_price = st.session_state.data["resale_price"]
-    st.session_state["normalized_price"] = (resale_price - min_price) / (
-        max_price - min_price
-    )
-
+    # one column per hexagonal cell, its height is the number of transactions
     layer = pdk.Layer(
-        "HexagonLayer",
-        st.session_state.data,
+        "ColumnLayer",
+        cells[["latitude", "longitude", "count", "median_price", "color"]],
         get_position=["longitude", "latitude"],
+        get_elevation="count",
+        elevation_scale=3000 / cells["count"].max(),
+        radius=RADIUS * 0.9,
+        disk_resolution=6,
         auto_highlight=True,
-        elevation_scale=10,
         pickable=True,
-        elevation_range=[0, 3000],
         extruded=True,
-        coverage=1,
-        radius=500,
-        get_fill_color=f"[255 * (resale_price - {min_price}) / ({max_price} - {min_price}), 0, 255 - 255 * (resale_price - {min_price}) / ({max_price} - {min_price})]",
+        get_fill_color="color",
     )
     return pdk.Deck(
         map_style="mapbox://styles/mapbox/light-v9",
         layers=[layer],
         initial_view_state=view_state,
+        tooltip={"text": "{count} resales, median {median_price}"},
     )
 
 
-st.pydeck_chart(load_pdk())
+tiles = map_tiles().table
+years = sorted(tiles["year"].unique().tolist(), reverse=True)
+flat_types = sorted(tiles["flat_type"].unique())
+
+col1, col2 = st.columns(2)
+year = col1.selectbox("Year", ["All"] + years)
+flat_type = col2.selectbox("Flat type", ["All"] + flat_types)
+month = None
+if year != "All":
+    months = sorted(tiles.loc[tiles["year"] == year, "month"].unique().tolist())
+    month = st.select_slider("Month", options=["All"] + months)
+
+cells = load_cells(
+    year=None if year == "All" else int(year),
+    month=None if month in (None, "All") else int(month),
+    flat_type=None if flat_type == "All" else flat_type,
+)
+if cells.empty:
+    st.info("No resales for this selection")
+else:
+    st.pydeck_chart(load_pdk(cells))
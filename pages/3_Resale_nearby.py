@@ -1,17 +1,22 @@
 import streamlit as st
-import os
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from src.utils.common_func import getcoordinates, find_nearest
+from src.utils.common_func import getcoordinates
+from src.utils.spatial import AddressIndex
+from src.utils.loaders import resale_frame
 
 
 st.title("Search nearby houses that were sold")
 
 
-@st.cache_data
 def load_csv():
-    return pd.read_csv("assets/data/geo_coords_2017.csv", index_col=0)
+    # one compact frame shared by every page and session
+    return resale_frame()
+
+
+@st.cache_resource
+def load_index():
+    # row positions refer to the shared frame of load_csv()
+    return AddressIndex(load_csv())
 
 
 if "data" not in st.session_state:
@@ -23,8 +28,7 @@ address = st.text_input(
 
 if address:
     lat, lon = getcoordinates(address)
-    find_nearest(st.session_state.data, lat, lon)
-    results = st.session_state.data.query("distance <= 1")
+    results = load_index().nearby(st.session_state.data, lat, lon, radius_km=1)
 
 else:
     results = st.session_state.data
@@ -1,4 +1,5 @@
 import streamlit as st
+from src.utils.loaders import hdb_blocks
 
 st.title("Prediction")
 
@@ -16,3 +17,19 @@ st.markdown(
             ## To be implemented:
             """
 )
+
+
+st.markdown("### Look up a block")
+col_blk, col_street = st.columns([1, 3])
+blk_no = col_blk.text_input("Block", placeholder="e.g. 174")
+street = col_street.text_input("Street", placeholder="e.g. Ang Mo Kio Avenue 4")
+if blk_no and street:
+    block = hdb_blocks().get(blk_no, street)
+    if block is None:
+        st.warning("This block could not be found in the HDB property information.")
+    else:
+        st.markdown(
+            f"**{block.blk_no} {block.street}** was completed in "
+            f"{block.year_completed}, has {block.max_floor_lvl} floors and "
+            f"{block.total_dwelling_units} dwelling units."
+        )
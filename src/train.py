@@ -1,12 +1,13 @@
-import os
 import sys
 import logging
+import time
+import argparse
 from sklearn.model_selection import train_test_split
-from sklearn.neighbors import KDTree
-from sklearn.metrics import r2_score
-import numpy as np
 import pandas as pd
 import xgboost as xgb
+from src.utils.features import AMENITY_COLS, MODEL_FEATURES, AddressFeatureTable
+from src.utils.registry import ModelRegistry, SchemaMismatch
+from src.utils.storage import PartitionedStore
 
 THRESHOLD = 0.9
 
@@ -17,154 +18,130 @@ logger = logging.getLogger(__name__)
 
 
 class PredictProcessor:
-    RADIUS_KM = 2
-    CONVERSION = 111.1
-    METRIC = "manhattan"
-
-    def __init__(self):
-        self.load_mrt_malls_tree()
-
-    def load_mrt_malls_tree(self):
-        """
-        Load as tree objects
-        """
-        mrt = pd.read_csv("assets/amenities/mrt.csv")
-        malls = pd.read_csv("assets/amenities/malls.csv")
-        mrt.reset_index(drop=True, inplace=True)
-        mrt_array = mrt[["latitude", "longitude"]].to_numpy()
-        malls_array = malls[["LAT", "LONG"]].to_numpy()
-        # manhattan is used to assume the longest distance
-        self.mrt_tree = KDTree(mrt_array, metric=self.METRIC)
-        self.malls_tree = KDTree(malls_array, metric=self.METRIC)
+    """
+    Builds the model features of a dataframe.
+
+    Amenity features come from the shared per-address feature table so that training
+    and serving see the same values.
+    """
+
+    FLAT_CATEGORIES = {
+        "2 ROOM": 2,
+        "3 ROOM": 3,
+        "4 ROOM": 4,
+        "5 ROOM": 5,
+        "1 ROOM": 1,
+        "EXECUTIVE": 6,
+        "MULTI-GENERATION": 7,
+    }
+
+    def __init__(self, address_features: AddressFeatureTable = None):
+        if address_features is None:
+            address_features = AddressFeatureTable()
+        self.address_features = address_features
 
     def __call__(self, input_df: pd.DataFrame) -> pd.DataFrame:
         """
         Process the dataframe
         """
-        addresses = self.get_addresses(input_df)
-        input_df = input_df.drop(
-            columns=["dist_mrt", "dist_malls", "distance_to_town", "mrt", "malls"]
-        )
-        data_points = addresses[["latitude", "longitude"]].values
-        indices_mrt, indices_malls = self.get_indices(data_points)
-        dist_mrt, dist_malls = self.get_distance(data_points)
-        dist_town = self.get_distance_to_town(data_points)
-
-        addresses["mrt"] = indices_mrt
-        addresses["malls"] = indices_malls
-        addresses["dist_mrt"] = dist_mrt
-        addresses["dist_malls"] = dist_malls
-        addresses["distance_to_town"] = dist_town
-
-        input_df = input_df.merge(
-            addresses, on=["address", "latitude", "longitude"], how="left"
-        )
+        input_df = input_df.drop(columns=AMENITY_COLS, errors="ignore")
+        self.address_features.update(input_df)
+        input_df = input_df.join(self.address_features.lookup(input_df))
 
         features = self.numerical_features(input_df)
         assert features.shape[1] == 11, "Features are not 11"
         return features
 
-    def get_addresses(self, input_df: pd.DataFrame) -> pd.DataFrame:
-        """
-        Get the addresses of the dataframe
-        """
-        addresses = input_df[["address", "latitude", "longitude"]].drop_duplicates()
-        return addresses.reset_index(drop=True)
-
-    def get_indices(self, data_points: np.ndarray) -> np.ndarray:
-        """
-        Get the indices of the nearest points
-        """
-        radius = self.RADIUS_KM / self.CONVERSION
-        indices_mrt = self.mrt_tree.query_radius(
-            data_points,
-            r=radius,
-            count_only=True,
-        )
-        indices_malls = self.malls_tree.query_radius(
-            data_points, r=radius, count_only=True
-        )
-        return indices_mrt, indices_malls
-
-    def get_distance(self, data_points: np.ndarray) -> np.ndarray:
-        """
-        Get the distance of the nearest points
-        """
-        dist_mrt, _ = self.mrt_tree.query(data_points, k=1, return_distance=True)
-        dist_malls, _ = self.malls_tree.query(data_points, k=1, return_distance=True)
-        return dist_mrt * self.CONVERSION, dist_malls * self.CONVERSION
-
-    def get_distance_to_town(self, input_df) -> np.ndarray:
-        """
-        Get the distance to town
-        """
-        town = np.array([1.300556, 103.821667])
-        if isinstance(input_df, pd.DataFrame):
-            dist_town = np.linalg.norm(
-                input_df[["latitude", "longitude"]] - town, axis=1
-            )
-        else:
-            dist_town = np.linalg.norm(input_df - town, axis=1)
-        return dist_town * self.CONVERSION
-
     def numerical_features(self, input_df: pd.DataFrame) -> pd.DataFrame:
         """
         Get the numerical features
         """
-        input_df["flat_cat"] = input_df.flat_type.map(
-            {
-                "2 ROOM": 2,
-                "3 ROOM": 3,
-                "4 ROOM": 4,
-                "5 ROOM": 5,
-                "1 ROOM": 1,
-                "EXECUTIVE": 6,
-                "MULTI-GENERATION": 7,
-            }
-        )
-        features = input_df[
-            [
-                "storey_range",
-                "floor_area_sqm",
-                "flat_cat",
-                "remaining_lease_year",
-                "resale_price",
-                "mrt",
-                "malls",
-                "year",
-                "dist_mrt",
-                "dist_malls",
-                "distance_to_town",
-            ]
-        ]
+        # the store keeps flat_type as a category, map the strings to get integers
+        flat_type = input_df.flat_type.astype(str)
+        input_df["flat_cat"] = flat_type.map(self.FLAT_CATEGORIES)
+        features = input_df[MODEL_FEATURES + ["resale_price"]]
         return features
 
 
-if __name__ == "__main__":
-    # Load the old model first
-    MODEL_PATH = "./assets/models/xgb_model.json"
-    DATA_PATH = "./assets/data/geo_coords_2017.csv"
-    if os.path.exists("./assets/models/xgb_model.json"):
-        xgb_model = xgb.XGBRegressor()
-        xgb_model.load_model(MODEL_PATH)
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Train the resale price model")
+    parser.add_argument(
+        "--full-history",
+        action="store_true",
+        help="stream every transaction since 2012 instead of the last 10000",
+    )
+    parser.add_argument(
+        "--nthread", type=int, default=-1, help="xgboost threads, -1 for every core"
+    )
+    parser.add_argument(
+        "--external-memory",
+        action="store_true",
+        help="with --full-history, cache the training matrix on disk",
+    )
+    return parser.parse_args()
 
-        # Load the newest 100
 
-        data = pd.read_csv(DATA_PATH, index_col=0).tail(100)
-        processor = PredictProcessor()
+if __name__ == "__main__":
+    args = parse_args()
+    # imported here, src.utils.training imports this module
+    from src.utils.training import (
+        GROUP_COLS,
+        data_watermark,
+        evaluation_report,
+        peak_rss_mb,
+        r2,
+        save_report,
+        train_full_history,
+        tuned_params,
+    )
+
+    store = PartitionedStore()
+    processor = PredictProcessor()
+    registry = ModelRegistry()
+    if args.full_history:
+        start = time.perf_counter()
+        booster, report = train_full_history(
+            store,
+            processor.address_features,
+            nthread=args.nthread,
+            external_memory=args.external_memory,
+        )
+        logging.info(
+            "Trained on the full history in %.1f s, peak RSS %.0f MB, holdout R2 %.3f",
+            time.perf_counter() - start,
+            peak_rss_mb(),
+            report["r2"],
+        )
+        if report["r2"] < THRESHOLD:
+            logging.error("Score is not above threshold, exiting...")
+            sys.exit(1)
+        version = registry.publish(booster, report, data_watermark(store))
+        registry.prune()
+        save_report(report)
+        logging.info("Published model %s", version)
+        sys.exit(0)
+
+    # Load the current model first and score it on the newest 100, the model saved
+    # before the registry is imported as the first version to compare against
+    registry.import_legacy()
+    try:
+        booster, _ = registry.load()
+    except (KeyError, SchemaMismatch) as err:
+        logging.info("No current model to score: %s", err)
+        score = 0
+    else:
+        data = store.tail(100)
         data = processor(data)
+        processor.address_features.save()
         y = data.pop("resale_price")
-
-        # Score the old model
-        score = xgb_model.score(data, y)
-    else:
-        score = 0
+        score = r2(y.to_numpy(), booster.inplace_predict(data))
 
     if score < THRESHOLD:
         # if lower we retrain the model with the past 10000
         logging.info("Current score is %.3f, retraining model...", score)
-        data = pd.read_csv(DATA_PATH, index_col=0).tail(10000)
-        data = processor(data)
+        raw = store.tail(10000)
+        data = processor(raw)
+        processor.address_features.save()
         # the values chosen are all just proof of concept, they may not be statistically
         # significant
         y = data.pop("resale_price")
@@ -173,29 +150,14 @@ if __name__ == "__main__":
             X, y, test_size=0.2, random_state=42
         )
 
-        def custom_r2(predt: np.ndarray, dtrain: xgb.DMatrix):
-            """
-            Calculates the negative R-squared score for a given set of predictions and training data.
-            Needed for r2 in xgboost.
-            Args:
-            predt (np.ndarray): The predicted values.
-            dtrain (xgb.DMatrix): The training data.
-
-            Returns:
-            float: The negative R-squared score.
-            """
-            return -r2_score(predt, dtrain)
-
-        # no hyperparameter tuning is done as this will be done on github actions
+        # the configuration found by tune.py, the usual defaults until it has run;
+        # early stopping uses the built-in rmse, R2 is computed once afterwards
+        params, num_rounds = tuned_params()
         xgb_model = xgb.XGBRegressor(
-            objective="reg:squarederror",
-            colsample_bytree=0.8,
-            learning_rate=0.1,
-            max_depth=12,
-            n_estimators=200,
-            subsample=0.6,
+            **params,
+            n_estimators=num_rounds,
             early_stopping_rounds=10,
-            eval_metric=custom_r2,
+            n_jobs=args.nthread,
         )
 
         training = xgb_model.fit(
@@ -205,7 +167,10 @@ if __name__ == "__main__":
             verbose=True,
         )
 
-        score = -training.best_score
+        report = evaluation_report(
+            y_test, xgb_model.predict(X_test), raw.loc[X_test.index, GROUP_COLS]
+        )
+        score = report["r2"]
         print(score)
         try:
             assert score > THRESHOLD, "Score is not above threshold"
@@ -213,5 +178,12 @@ if __name__ == "__main__":
             logging.error("Score is not above threshold, exiting...")
             # raise to github actions
             sys.exit(1)
-        logging.info("New score is %.3f.", score)
-        xgb_model.save_model(MODEL_PATH)
+        # keep the rounds up to the best one, which the booster predicts with
+        booster = xgb_model.get_booster()[: xgb_model.best_iteration + 1]
+        report["training_rows"] = len(X_train)
+        version = registry.publish(booster, report, data_watermark(store))
+        registry.prune()
+        save_report(report)
+        logging.info(
+            "Published model %s, score %.3f, MAPE %.3f.", version, score, report["mape"]
+        )
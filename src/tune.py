@@ -0,0 +1,279 @@
+"""
+Hyperparameter search for the resale price model.
+
+Configurations are sampled at random and raced with successive halving: every
+configuration is trained for ``MIN_ROUNDS`` boosting rounds, the best third is
+trained three times longer, and so on up to ``MAX_ROUNDS``. Trials run in a process
+pool, each with a fixed number of xgboost threads so that the pool never runs more
+threads than there are cores.
+
+Scores are the mean validation RMSE over time-ordered folds: each fold trains on
+every month before a block of ``FOLD_MONTHS`` months and validates on that block,
+like the model is used on months it has not seen. Every worker quantizes the folds
+once and reuses the matrices for all its trials.
+
+``--budget`` caps the CPU seconds of the worker processes, including building the
+folds. Only as many trials as there are workers are submitted at a time, and only
+while the CPU already used plus the expected cost of the running trials is within
+the budget, so a run ends near the budget instead of finishing a whole rung past
+it. It writes every trial to ``assets/models/leaderboard.csv`` and the best
+configuration to ``assets/models/best_params.json``, which training picks up::
+
+    python ./src/tune.py --budget 1200
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from src.utils.storage import PartitionedStore
+from src.utils.training import (
+    BEST_PARAMS_PATH,
+    EARLY_STOPPING_ROUNDS,
+    PARAMS,
+    store_chunks,
+)
+
+LEADERBOARD_PATH = "assets/models/leaderboard.csv"
+N_FOLDS = 3
+FOLD_MONTHS = 3
+MIN_ROUNDS = 25
+MAX_ROUNDS = 675
+ETA = 3
+MAX_BIN = 256
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s [%(filename)s:%(lineno)d] - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+Fold = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+# quantized folds of a worker process, built once by init_worker
+FOLDS: List[Tuple[xgb.DMatrix, xgb.DMatrix]] = []
+# CPU time of the worker process already reported to the search
+REPORTED_CPU = 0.0
+
+
+def time_folds(
+    store: PartitionedStore, n_folds: int = N_FOLDS, fold_months: int = FOLD_MONTHS
+) -> List[Fold]:
+    """
+    Splits the stored months into expanding-window folds.
+
+    Returns:
+        list: (X_train, y_train, X_valid, y_valid) of every fold, oldest first.
+    """
+    partitions = store.partitions()
+    if len(partitions) <= n_folds * fold_months:
+        raise ValueError(f"Need more than {n_folds * fold_months} months to tune")
+    chunks = list(store_chunks(store, partitions))
+    X = np.concatenate([features.to_numpy() for features, _ in chunks])
+    y = np.concatenate([label.to_numpy() for _, label in chunks])
+    months = np.repeat(np.arange(len(chunks)), [len(label) for _, label in chunks])
+
+    folds = []
+    for k in range(n_folds, 0, -1):
+        start = len(partitions) - k * fold_months
+        train = months < start
+        valid = (months >= start) & (months < start + fold_months)
+        folds.append((X[train], y[train], X[valid], y[valid]))
+    return folds
+
+
+def init_worker(folds: List[Fold], nthread: int):
+    for X_train, y_train, X_valid, y_valid in folds:
+        dtrain = xgb.QuantileDMatrix(X_train, y_train, max_bin=MAX_BIN, nthread=nthread)
+        dvalid = xgb.QuantileDMatrix(X_valid, y_valid, ref=dtrain, nthread=nthread)
+        FOLDS.append((dtrain, dvalid))
+
+
+def run_trial(trial: int, params: Dict, rounds: int, nthread: int) -> Dict:
+    """
+    Trains a configuration on every fold of the worker.
+
+    Returns:
+        dict: The trial, its parameters, mean validation RMSE, mean best number of
+            rounds and the CPU seconds it used. ``worker_cpu_seconds`` also counts
+            the CPU the worker used since its last trial, such as building its folds.
+    """
+    global REPORTED_CPU
+    start = time.process_time()
+    scores, best_rounds = [], []
+    for dtrain, dvalid in FOLDS:
+        booster = xgb.train(
+            {**PARAMS, **params, "nthread": nthread},
+            dtrain,
+            num_boost_round=rounds,
+            evals=[(dvalid, "valid")],
+            early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+            verbose_eval=False,
+        )
+        scores.append(booster.best_score)
+        best_rounds.append(booster.best_iteration + 1)
+    end = time.process_time()
+    worker_cpu, REPORTED_CPU = end - REPORTED_CPU, end
+    return {
+        "trial": trial,
+        "rounds": rounds,
+        "rmse": float(np.mean(scores)),
+        "best_rounds": int(np.mean(best_rounds)),
+        "cpu_seconds": end - start,
+        "worker_cpu_seconds": worker_cpu,
+        **params,
+    }
+
+
+def sample_params(rng: np.random.Generator) -> Dict:
+    """
+    Samples a configuration around the parameters train.py has always used.
+    """
+    return {
+        "max_depth": int(rng.integers(4, 13)),
+        "learning_rate": float(np.exp(rng.uniform(np.log(0.03), np.log(0.3)))),
+        "subsample": float(rng.uniform(0.5, 1.0)),
+        "colsample_bytree": float(rng.uniform(0.5, 1.0)),
+        "min_child_weight": float(np.exp(rng.uniform(0, np.log(20)))),
+        "reg_lambda": float(np.exp(rng.uniform(np.log(0.1), np.log(10)))),
+    }
+
+
+def successive_halving(
+    folds: List[Fold],
+    n_trials: int,
+    budget: float,
+    workers: int,
+    nthread: int,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Races ``n_trials`` random configurations until ``MAX_ROUNDS`` or the budget.
+
+    Args:
+        folds (List[Fold]): The time-ordered folds.
+        n_trials (int): Configurations in the first rung.
+        budget (float): CPU seconds the workers may use.
+        workers (int): Processes in the pool.
+        nthread (int): xgboost threads per trial.
+        seed (int): Seed of the sampler.
+
+    Returns:
+        pd.DataFrame: One row per finished trial and rung.
+    """
+    rng = np.random.default_rng(seed)
+    configs = {trial: sample_params(rng) for trial in range(n_trials)}
+    results, cpu_used, rounds = [], 0.0, MIN_ROUNDS
+    # CPU seconds per boosting round of the finished trials, to estimate the cost of
+    # the running ones
+    trial_cpu, trial_rounds = 0.0, 0
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(folds, nthread)
+    ) as pool:
+        while configs:
+            queued = list(configs.items())
+            running, rung = set(), []
+            estimate = trial_cpu / trial_rounds * rounds if trial_rounds else 0.0
+            while queued or running:
+                while (
+                    queued
+                    and len(running) < workers
+                    and cpu_used + (len(running) + 1) * estimate < budget
+                ):
+                    trial, params = queued.pop(0)
+                    running.add(pool.submit(run_trial, trial, params, rounds, nthread))
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    cpu_used += result.pop("worker_cpu_seconds")
+                    trial_cpu += result["cpu_seconds"]
+                    trial_rounds += rounds
+                    estimate = trial_cpu / trial_rounds * rounds
+                    rung.append(result)
+                    logger.info(
+                        "trial %d, %d rounds: rmse %.0f (%.0f of %.0f CPU s)",
+                        result["trial"],
+                        rounds,
+                        result["rmse"],
+                        cpu_used,
+                        budget,
+                    )
+            results.extend(rung)
+            if queued or rounds * ETA > MAX_ROUNDS or len(rung) < ETA:
+                break
+            survivors = sorted(rung, key=lambda result: result["rmse"])
+            survivors = survivors[: len(rung) // ETA]
+            configs = {
+                result["trial"]: configs[result["trial"]] for result in survivors
+            }
+            rounds *= ETA
+    return pd.DataFrame(results)
+
+
+def best_config(leaderboard: pd.DataFrame) -> Dict:
+    """
+    Returns the best configuration of the longest rung that finished.
+    """
+    top = leaderboard.sort_values(["rounds", "rmse"], ascending=[False, True]).iloc[0]
+    template = sample_params(np.random.default_rng(0))
+    return {
+        "params": {name: type(value)(top[name]) for name, value in template.items()},
+        "num_rounds": int(top["best_rounds"]),
+        "rmse": float(top["rmse"]),
+        "trial": int(top["trial"]),
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Tune the resale price model")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=1200,
+        help="CPU seconds of the trials and the setup of the workers",
+    )
+    parser.add_argument("--trials", type=int, default=27)
+    parser.add_argument(
+        "--threads-per-trial",
+        type=int,
+        default=1,
+        help="xgboost threads of every trial, the pool runs cores / threads trials",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    workers = max(1, (os.cpu_count() or 1) // args.threads_per_trial)
+    folds = time_folds(PartitionedStore())
+    logger.info(
+        "Tuning %d configurations on %d folds, %d workers x %d threads",
+        args.trials,
+        len(folds),
+        workers,
+        args.threads_per_trial,
+    )
+    leaderboard = successive_halving(
+        folds, args.trials, args.budget, workers, args.threads_per_trial, args.seed
+    )
+    if leaderboard.empty:
+        logger.error("No trial finished within the budget")
+        sys.exit(1)
+
+    leaderboard = leaderboard.sort_values(["rounds", "rmse"], ascending=[False, True])
+    os.makedirs(os.path.dirname(LEADERBOARD_PATH), exist_ok=True)
+    leaderboard.to_csv(LEADERBOARD_PATH, index=False)
+    best = best_config(leaderboard)
+    tmp_path = BEST_PARAMS_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(best, f, indent=2)
+    os.replace(tmp_path, BEST_PARAMS_PATH)
+    logger.info("Best trial %d: rmse %.0f, %s", best["trial"], best["rmse"], best)
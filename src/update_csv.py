@@ -1,99 +1,132 @@
 import sys
-import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List
 import pandas as pd
-import requests
+from src.utils.datastore import Datastore
+from src.utils.features import KEY_COLS, AddressFeatureTable
+from src.utils.hexbin import MapTiles
 from src.utils.preprocessing import Preprocessor
+from src.utils.rollup import ResaleRollup
+from src.utils.storage import PartitionedStore
+from src.utils.sync import DatastoreSync, parse_args
 
+BATCH_SIZE = 5000
 
-class HDBDataset:
+
+class HDBDataset(Datastore):
 
     """
     A class for fetching JSON data from the HDB resale price dataset API.
     """
 
-    def __init__(self):
-        """
-        Initializes a new instance of the HDBDataset class.
-        """
-        self._resource_id = self.get_first_dataset()
-
-    def fetch_json_response(self, **params):
-        """
-        Fetches JSON data from a given URL with the specified parameters.
+    COLLECTION_ID = 189
 
-        Args:
-            params (dict, optional): Dictionary of query parameters.
+    def first_month(self, child_dataset: str) -> str:
+        records = self.fetch_json_response(resource_id=child_dataset, limit=1)
+        return records[0]["month"] if records else None
 
-        Returns:
-            dict: JSON data as a Python dictionary.
-        """
-        if params.get("resource_id", None) is None:
-            params["resource_id"] = self._resource_id
-        response = requests.get(
-            "https://data.gov.sg/api/action/datastore_search", params=params, timeout=5
-        )
-
-        # Check if the request was successful
-        if response.status_code == 200:
-            return response.json()["result"]["records"]
-        response.raise_for_status()
-
-    def get_first_dataset(self):
+    def select_dataset(self, child_datasets: List[str]) -> str:
         """
         Gets the resource ID of the first dataset that contains data from January 2017.
+        The child datasets are probed concurrently.
 
         Returns:
             str: The resource ID of the first dataset that contains data from January 2017.
         """
-        metadata = requests.get(
-            "https://api-production.data.gov.sg/v2/public/api/collections/189/metadata",
-            timeout=5,
-        )
-        resource_id = None
-        # sanity check
-        for child_dataset in metadata.json()["data"]["collectionMetadata"][
-            "childDatasets"
-        ]:
-            resp = self.fetch_json_response(resource_id=child_dataset, limit=1)
-            if resp[0]["month"] == "2017-01":
-                resource_id = child_dataset
-                break
-            time.sleep(1)
-        return resource_id
-
-
-if __name__ == "__main__":
-    dataset = HDBDataset()
-    preprocessor = Preprocessor()
+        with ThreadPoolExecutor(max_workers=len(child_datasets) or 1) as pool:
+            months = list(pool.map(self.first_month, child_datasets))
+        for child_dataset, month in zip(child_datasets, months):
+            if month == "2017-01":
+                return child_dataset
+        return None
+
+
+def prepare_batch(
+    new_data: pd.DataFrame,
+    preprocessor: Preprocessor,
+    features: AddressFeatureTable,
+) -> pd.DataFrame:
+    """
+    Preprocesses a page of records and adds their coordinates and amenities.
 
-    CSV_PATH = "assets/data/geo_coords_2017.csv"
+    Args:
+        new_data (pd.DataFrame): The records fetched from the datastore.
+        preprocessor (Preprocessor): Used to clean and geocode the records.
+        features (AddressFeatureTable): The coordinates and amenity features of
+            every known address.
 
-    # 1. Load the current data
-    old_df = pd.read_csv(CSV_PATH, index_col=0)
+    Returns:
+        pd.DataFrame: The preprocessed records.
+    """
+    new_data = preprocessor(df=new_data)
+    preprocessor.get_lat_lon(features.table.reset_index()[KEY_COLS], new_data)
+    return preprocessor.get_nearest_amenities(new_data, features)
 
-    # 2. Fetch the new data
 
-    # 1000 is usually safe, it will usually not return more than 1000 records
-    sample = dataset.fetch_json_response(limit=5000, offset=len(old_df))
+def recompute_features(
+    store: PartitionedStore, preprocessor: Preprocessor, features: AddressFeatureTable
+):
+    """
+    Recomputes the amenity features of every month, one month at a time.
+    """
+    for key in store.partitions():
+        rows = store.read(partitions=[key])
+        store.write(preprocessor.get_nearest_amenities(rows, features))
+    features.save()
 
-    # 2a. Check if the new data is empty
 
-    if len(sample) == 0:
+if __name__ == "__main__":
+    # a local datastore and resource can be given to test against a fake server
+    args = parse_args("Update the resale dataset from data.gov.sg")
+    dataset = HDBDataset(resource_id=args.resource_id, base_url=args.base_url)
+    preprocessor = Preprocessor()
+    store = PartitionedStore()
+
+    # 1. Build the store from the legacy csv on first run
+    if not store.exists():
+        store.import_csv()
+
+    # 2. Recompute the features of the stored months if the amenities changed, the
+    # feature table also holds the coordinates used to geocode the new records
+    features = AddressFeatureTable()
+    if features.stale:
+        print("Amenities changed, recomputing features for every address")
+        recompute_features(store, preprocessor, features)
+
+    # the store index is _id - 1
+    sync = DatastoreSync(
+        dataset,
+        store,
+        prepare=partial(prepare_batch, preprocessor=preprocessor, features=features),
+        id_offset=1,
+    )
+
+    # 3. Refetch the months that were corrected or deleted upstream
+    num_changed = 0
+    if args.diff:
+        months = sync.diff(checksum=args.checksum)
+        print(f"{len(months)} months differ from upstream")
+        counts = sync.refresh(months)
+        num_changed = counts["inserted"] + counts["updated"] + counts["deleted"]
+
+    # 4. Fetch, preprocess and upsert the new data one page at a time, resuming
+    # after the last stored record
+    counts = sync.run(batch_size=BATCH_SIZE)
+    num_new = counts["inserted"] + counts["updated"]
+    features.save()
+
+    # 5. Merge the part files of months appended to many times
+    store.compact()
+
+    # 6. Recompute the plot statistics and map tiles of the months that changed
+    for rollup in (ResaleRollup(), MapTiles()):
+        rollup.update(store)
+        rollup.save()
+
+    if num_new + num_changed == 0:
         print("No new data to update")
+        print(dataset.client.metrics.summary())
         sys.exit(0)
-
-    # 3. Convert the new data to a DataFrame
-    print(f"New data fetched successfully, num differences = {len(sample)}")
-    new_data = pd.DataFrame(sample)
-    new_data["_id"] = new_data["_id"] - 1
-    new_data.set_index("_id", inplace=True)
-
-    # 4. Preprocess the new data
-    new_data = preprocessor(df=new_data)
-
-    # 5. Merge the new data with the old data
-    appended = preprocessor.add_new_to_old(old_df, new_data)
-    appended = preprocessor.get_nearest_amenities(appended)
-
-    # 6. Save the merged data
-    appended.to_csv(CSV_PATH)
+    print(f"New data fetched successfully, num differences = {num_new + num_changed}")
+    print(dataset.client.metrics.summary())
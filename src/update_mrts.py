@@ -1,9 +1,8 @@
-import time
 from typing import Tuple, Dict
 import pandas as pd
 import numpy as np
 from bs4 import BeautifulSoup
-import requests
+from src.utils.http_client import default_client
 
 
 def mrt_geo_data() -> Dict:
@@ -30,14 +29,14 @@ def mrt_geo_data() -> Dict:
         "Sec-Fetch-Dest": "empty",
     }
 
-    response = requests.post(
+    client = default_client()
+    response = client.post(
         "https://kjo15bc7zd.execute-api.ap-southeast-1.amazonaws.com/api/public/resources/d_af90df38d609c426c73bc9acea366786/generate-download-link",
         headers=headers,
-        timeout=30,
     )
     url = response.json()["url"]
-    time.sleep(1)  # prevent 429
-    return requests.get(url, timeout=30).json()
+    # throttled requests are retried by the client
+    return client.get(url).json()
 
 
 def process_mrt(data) -> Tuple[str, float, float]:
@@ -92,3 +91,4 @@ if __name__ == "__main__":
         print(f"Updating MRT stations from {len(df)} to {len(mrt_stations)}")
         df = pd.DataFrame(mrt_stations)
         df.to_csv(CSV_PATH, index=False)
+    print(default_client().metrics.summary())
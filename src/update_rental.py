@@ -1,88 +1,111 @@
 import sys
-import time
+from functools import partial
 import pandas as pd
-import requests
+from src.utils.datastore import Datastore
+from src.utils.features import KEY_COLS
 from src.utils.preprocessing import Preprocessor
+from src.utils.storage import PartitionedStore, rental_store
+from src.utils.sync import DatastoreSync, parse_args
 
+BATCH_SIZE = 1000
 
-class RentalDataset:
+
+class RentalDataset(Datastore):
 
     """
     A class for fetching JSON data from the HDB resale price dataset API.
     """
 
-    def __init__(self):
-        """
-        Initializes a new instance of the HDBDataset class.
-        """
-        self._resource_id = self.get_first_dataset()
+    COLLECTION_ID = 166
 
-    def fetch_json_response(self, **params):
+    def select_dataset(self, child_datasets):
         """
-        Fetches JSON data from a given URL with the specified parameters.
-
-        Args:
-            params (dict, optional): Dictionary of query parameters.
+        Gets the resource ID of the first dataset of the collection.
 
         Returns:
-            dict: JSON data as a Python dictionary.
+            str: The resource ID of the first child dataset.
         """
-        if params.get("resource_id", None) is None:
-            params["resource_id"] = self._resource_id
-        response = requests.get(
-            "https://data.gov.sg/api/action/datastore_search", params=params, timeout=5
-        )
-
-        # Check if the request was successful
-        if response.status_code == 200:
-            return response.json()["result"]["records"]
-        response.raise_for_status()
-
-    def get_first_dataset(self):
-        """
-        Gets the resource ID of the first dataset that contains data from January 2017.
-
-        Returns:
-            str: The resource ID of the first dataset that contains data from January 2017.
-        """
-        metadata = requests.get(
-            "https://api-production.data.gov.sg/v2/public/api/collections/166/metadata",
-            timeout=5,
-        )
-        return metadata.json()["data"]["collectionMetadata"]["childDatasets"][0]
-
-
-if __name__ == "__main__":
-    dataset = RentalDataset()
-    preprocessor = Preprocessor()
-
-    CSV_PATH = "assets/data/rental_flats.csv"
+        return child_datasets[0]
 
-    # 1. Load the current data
-    old_df = pd.read_csv(CSV_PATH, index_col=0)
 
-    # 2. Fetch the new data
+class KnownAddresses:
+    """
+    The coordinates of every stored address, kept in memory so that a page does not
+    read the store. The store is read once, a month at a time, and every page adds
+    its new addresses.
+    """
 
-    # 1000 is usually safe, it will usually not return more than 1000 records
-    sample = dataset.fetch_json_response(limit=1000, offset=len(old_df))
+    def __init__(self, store: PartitionedStore):
+        frames = [
+            store.read(columns=KEY_COLS, partitions=[key])
+            .dropna()
+            .drop_duplicates(subset=["address"])
+            for key in store.partitions()
+        ]
+        self.coords = pd.DataFrame(columns=KEY_COLS)
+        if frames:
+            self.coords = pd.concat(frames, ignore_index=True)
+            self.coords = self.coords.drop_duplicates(subset=["address"])
+
+    def add(self, df: pd.DataFrame):
+        new = df.loc[~df["address"].isin(self.coords["address"]), KEY_COLS]
+        new = new.dropna().drop_duplicates(subset=["address"])
+        if not new.empty:
+            self.coords = pd.concat([self.coords, new], ignore_index=True)
+
+
+def prepare_batch(
+    new_data: pd.DataFrame, preprocessor: Preprocessor, known: KnownAddresses
+) -> pd.DataFrame:
+    """
+    Adds the address and coordinates of a page of rental records.
+    """
+    preprocessor.get_address(new_data)
+    preprocessor.get_lat_lon(known.coords, new_data)
+    known.add(new_data)
+    new_data["flat_type"] = new_data["flat_type"].str.replace("-", " ")
+    return new_data
 
-    # 2a. Check if the new data is empty
 
-    if len(sample) == 0:
+if __name__ == "__main__":
+    # a local datastore and resource can be given to test against a fake server
+    args = parse_args("Update the rental dataset from data.gov.sg")
+    dataset = RentalDataset(resource_id=args.resource_id, base_url=args.base_url)
+    preprocessor = Preprocessor()
+    store = rental_store()
+
+    # 1. Build the store from the legacy csv on first run
+    if not store.exists():
+        store.import_csv()
+
+    sync = DatastoreSync(
+        dataset,
+        store,
+        prepare=partial(
+            prepare_batch, preprocessor=preprocessor, known=KnownAddresses(store)
+        ),
+        month_field="rent_approval_date",
+    )
+
+    # 2. Refetch the months that were corrected or deleted upstream
+    num_changed = 0
+    if args.diff:
+        months = sync.diff(checksum=args.checksum)
+        print(f"{len(months)} months differ from upstream")
+        counts = sync.refresh(months)
+        num_changed = counts["inserted"] + counts["updated"] + counts["deleted"]
+
+    # 3. Fetch, preprocess and upsert the new data one page at a time, resuming
+    # after the last stored record
+    counts = sync.run(batch_size=BATCH_SIZE)
+    num_new = counts["inserted"] + counts["updated"]
+
+    # 4. Merge the part files of months appended to many times
+    store.compact()
+
+    if num_new + num_changed == 0:
         print("No new data to update")
+        print(dataset.client.metrics.summary())
         sys.exit(0)
-
-    # 3. Convert the new data to a DataFrame
-    print(f"New data fetched successfully, num differences = {len(sample)}")
-    new_data = pd.DataFrame(sample)
-    new_data.set_index("rent_approval_date", inplace=True)
-    # 4. Preprocess the new data
-    preprocessor.get_address(new_data)
-
-    # 5. Merge the new data with the old data
-    appended = preprocessor.add_new_to_old(old_df, new_data)
-
-    # 6. Save the merged data
-    appended["flat_type"] = appended["flat_type"].str.replace("-", " ")
-
-    appended.to_csv(CSV_PATH)
+    print(f"New data fetched successfully, num differences = {num_new + num_changed}")
+    print(dataset.client.metrics.summary())
@@ -0,0 +1,149 @@
+"""
+Registry of HDB blocks from ``hdb-property-information.csv``.
+
+Blocks are keyed by (block number, normalized street) so a lookup is a dict access
+instead of two boolean masks over the whole table. Rows are returned as ``Block``
+named tuples so callers use field names rather than column positions.
+"""
+from functools import lru_cache
+from typing import NamedTuple, Optional
+import numpy as np
+import pandas as pd
+from src.utils.features import HDB_INFO_PATH
+from src.utils.streets import StreetIndex, normalize_street
+
+# the csv's count columns start with a digit, which cannot be a field name
+RENAMED_COLUMNS = {
+    "1room_sold": "sold_1room",
+    "2room_sold": "sold_2room",
+    "3room_sold": "sold_3room",
+    "4room_sold": "sold_4room",
+    "5room_sold": "sold_5room",
+    "exec_sold": "sold_exec",
+    "multigen_sold": "sold_multigen",
+    "studio_apartment_sold": "sold_studio_apartment",
+    "1room_rental": "rental_1room",
+    "2room_rental": "rental_2room",
+    "3room_rental": "rental_3room",
+    "other_room_rental": "rental_other_room",
+}
+FLAG_COLUMNS = [
+    "residential",
+    "commercial",
+    "market_hawker",
+    "miscellaneous",
+    "multistorey_carpark",
+    "precinct_pavilion",
+]
+COUNT_COLUMNS = [
+    "max_floor_lvl",
+    "year_completed",
+    "total_dwelling_units",
+] + list(RENAMED_COLUMNS.values())
+
+
+class Block(NamedTuple):
+    blk_no: str
+    street: str
+    max_floor_lvl: int
+    year_completed: int
+    residential: bool
+    commercial: bool
+    market_hawker: bool
+    miscellaneous: bool
+    multistorey_carpark: bool
+    precinct_pavilion: bool
+    bldg_contract_town: str
+    total_dwelling_units: int
+    sold_1room: int
+    sold_2room: int
+    sold_3room: int
+    sold_4room: int
+    sold_5room: int
+    sold_exec: int
+    sold_multigen: int
+    sold_studio_apartment: int
+    rental_1room: int
+    rental_2room: int
+    rental_3room: int
+    rental_other_room: int
+
+
+def load_blocks(path: str = HDB_INFO_PATH) -> pd.DataFrame:
+    """
+    Reads the property information with compact dtypes.
+    """
+    df = pd.read_csv(path, dtype={"blk_no": str, "street": str})
+    df = df.rename(columns=RENAMED_COLUMNS)
+    for col in FLAG_COLUMNS:
+        df[col] = df[col] == "Y"
+    df[COUNT_COLUMNS] = df[COUNT_COLUMNS].astype(np.int16)
+    df["bldg_contract_town"] = df["bldg_contract_town"].astype("category")
+    return df[list(Block._fields)]
+
+
+def block_key(blk_no, street: str) -> tuple:
+    return str(blk_no).strip().upper(), normalize_street(street)
+
+
+class BlockRegistry:
+    """
+    Loaded-once index of HDB blocks.
+
+    Methods:
+    --------
+    get(blk_no, street):
+        Returns the ``Block`` at the address, or None. Streets that are not an exact
+        match after normalization are matched through the street index.
+
+    lookup(df):
+        Returns the blocks of a dataframe with ``blk_no`` and ``street`` columns as a
+        dataframe aligned to its index. Unknown blocks are NaN.
+    """
+
+    def __init__(self, path: str = HDB_INFO_PATH):
+        self.table = load_blocks(path)
+        self.streets = StreetIndex(self.table["street"].values)
+        keys = map(block_key, self.table["blk_no"], self.table["street"])
+        self.positions = {}
+        for position, key in enumerate(keys):
+            self.positions.setdefault(key, position)
+        self.blocks = [
+            Block(*row) for row in self.table.itertuples(index=False, name=None)
+        ]
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def position(self, blk_no, street: str) -> int:
+        key = block_key(blk_no, street)
+        if key not in self.positions:
+            matched = self.streets.match(street)
+            if matched is None:
+                return -1
+            key = block_key(blk_no, matched)
+        return self.positions.get(key, -1)
+
+    def get(self, blk_no, street: str) -> Optional[Block]:
+        position = self.position(blk_no, street)
+        return self.blocks[position] if position >= 0 else None
+
+    def lookup(self, df: pd.DataFrame) -> pd.DataFrame:
+        positions = np.fromiter(
+            map(self.position, df["blk_no"], df["street"]),
+            dtype=np.int64,
+            count=len(df),
+        )
+        # unknown blocks point one past the end, which reindex fills with NaN
+        positions[positions < 0] = len(self.table)
+        blocks = self.table.reindex(positions)
+        blocks.index = df.index
+        return blocks
+
+
+@lru_cache(maxsize=None)
+def default_registry() -> BlockRegistry:
+    """
+    Returns the registry shared within a process.
+    """
+    return BlockRegistry()
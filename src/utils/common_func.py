@@ -1,37 +1,20 @@
-import requests
 import pandas as pd
 import numpy as np
-import difflib as dl
 from datetime import datetime
-from ast import literal_eval
+from src.utils.blocks import BlockRegistry
+from src.utils.features import MODEL_FEATURES, AddressFeatureTable
+from src.utils.geocode import ONEMAP_URL, default_resolver
+from src.utils.http_client import default_client
+from src.utils.streets import normalize_street
 
 # function gets the lat and lon details from the given address
-# it's a free API with a rate limit of 250 per min
+# it's a free API with a rate limit of 250 per min, results are cached on disk
 
 
 def getcoordinates(address):
-    req = requests.get(
-            "https://www.onemap.gov.sg/api/common/elastic/search?searchVal="
-            + address
-            + "&returnGeom=Y&getAddrDetails=Y&pageNum=1",
-            timeout=30,
-        )
-    resultsdict = literal_eval(req.text)
-    if len(resultsdict["results"]) > 0:
-        return [
-            resultsdict["results"][0]["LATITUDE"],
-            resultsdict["results"][0]["LONGITUDE"],
-        ]
-    else:
-        pass
-
-
-def find_nearest(df, lat, long, col_name="distance", conversion=111):
-    lat = float(lat)
-    long = float(long)
-    df[col_name] = (
-        np.linalg.norm(df[["latitude", "longitude"]] - (lat, long), axis=1) * conversion
-    )
+    coords = default_resolver().resolve(address)
+    if coords is not None:
+        return list(coords)
 
 
 def create_lat_lon(new_df):
@@ -44,88 +27,70 @@ def create_lat_lon(new_df):
     return new_df
 
 
-def load_mrt_malls():
-    mrt = pd.read_csv("assets/amenities/mrt.csv")
-    malls = pd.read_csv("assets/amenities/malls.csv")
-    convert_mrt_array = mrt[["latitude", "longitude"]].to_numpy()
-    convert_malls_array = malls[["LAT", "LONG"]].to_numpy()
-    return convert_mrt_array, convert_malls_array
+def info_parser(
+    features: dict, blocks: BlockRegistry, address_features: AddressFeatureTable
+) -> pd.DataFrame:
+    """
+    Builds the model features of one flat from the prediction form.
 
+    Args:
+        features (dict): Form values, Postal, Lease, floor_area_sqm, flat_cat and
+            storey_range.
+        blocks (BlockRegistry): HDB property information.
+        address_features (AddressFeatureTable): Shared per-address feature table.
 
-def info_parser(features: dict, mrt, malls, hdb_details_df: pd.DataFrame):
+    Returns:
+        pd.DataFrame: A single row in the column order expected by the model, or None
+            if the postal code cannot be found.
+    """
     postal = features["Postal"]
-    req = requests.get(
-        "https://developers.onemap.sg/commonapi/search?searchVal="
-        + str(postal)
-        + "&returnGeom=Y&getAddrDetails=Y&pageNum=1"
+    req = default_client().get(
+        ONEMAP_URL,
+        params={
+            "searchVal": postal,
+            "returnGeom": "Y",
+            "getAddrDetails": "Y",
+            "pageNum": 1,
+        },
     )
-    resultsdict = eval(req.text)
+    resultsdict = req.json()
     if len(resultsdict["results"]) > 0:
-        blk, street = (
-            resultsdict["results"][0]["BLK_NO"],
-            resultsdict["results"][0]["ROAD_NAME"],
-        )
-
-        ignore_short_forms = dl.get_close_matches(
-            street, hdb_details_df["street"].values
-        )[0]
-
-        row = hdb_details_df[
-            (hdb_details_df["blk_no"] == blk)
-            & (hdb_details_df["street"] == ignore_short_forms)
-        ]
+        result = resultsdict["results"][0]
+        blk, street = result["BLK_NO"], result["ROAD_NAME"]
+
+        # onemap spells out the street, the registry matches it to the hdb short form;
+        # a street it cannot match keeps onemap's name, abbreviated the hdb way, so
+        # the address is never built from a missing match
+        block = blocks.get(blk, street)
+        if block is not None:
+            ignore_short_forms = block.street
+        else:
+            ignore_short_forms = normalize_street(street)
 
-        # build dict of features
+        # build dict of features, remaining lease follows the 99 year lease used
+        # in training
         features["year"] = datetime.now().year
         if features["Lease"] == "":
-            features["remaining_lease_year"] = features["year"] - row.iloc[0, -1]
+            lease_start = block.year_completed if block is not None else np.nan
         else:
-            features["remaining_lease_year"] = features["year"] - int(features["Lease"])
+            lease_start = int(features["Lease"])
+        features["remaining_lease_year"] = 99 - (features["year"] - lease_start)
 
         if features["floor_area_sqm"] == "":
             features["floor_area_sqm"] = avg_area[int(features["flat_cat"])]
 
-        coords = np.array(
-            [
-                float(resultsdict["results"][0]["LATITUDE"]),
-                float(resultsdict["results"][0]["LONGITUDE"]),
-            ]
+        features.update(
+            address_features.get(
+                f"{blk} {ignore_short_forms}",
+                float(result["LATITUDE"]),
+                float(result["LONGITUDE"]),
+            )
         )
-        features["distance_to_town"] = (
-            np.linalg.norm(coords - np.array([1.300556, 103.821667])) * conversion
-        )
-        features["distance_to_mrt"] = (
-            min(np.linalg.norm(coords - mrt_array, axis=1)) * conversion
-        )
-        features["distance_to_mall"] = (
-            min(np.linalg.norm(coords - malls_array, axis=1)) * conversion
-        )
-        features["number_of_malls"] = (
-            np.linalg.norm(coords - malls_array, axis=1) < radius / conversion
-        ).sum()
-
-        final_features = np.array(
-            [features[i] for i in reorder_list], dtype=object
-        ).reshape(1, len(reorder_list))
-        return final_features
+        return pd.DataFrame([features])[MODEL_FEATURES].astype(np.float64)
 
 
 # helper variables for calculations
 
-mrt_array, malls_array = load_mrt_malls()
-
-reorder_list = [
-    "storey_range",
-    "floor_area_sqm",
-    "remaining_lease_year",
-    "distance_to_town",
-    "distance_to_mrt",
-    "distance_to_mall",
-    "number_of_malls",
-    "year",
-    "flat_cat",
-]
-
 avg_area = {
     1: 31.0,
     2: 45.82892057026476,
@@ -135,7 +100,3 @@ avg_area = {
     6: 144.3410299943407,
     7: 160.15217391304347,
 }
-
-conversion = 111
-central = np.array([1.300556, 103.821667])
-radius = 3
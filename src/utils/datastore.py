@@ -0,0 +1,191 @@
+"""
+Paginated access to data.gov.sg datastore resources.
+
+Records are fetched in pages sorted by ``_id`` and yielded one batch at a time so
+that an update can process and store each batch before fetching the next. An
+interrupted update resumes after the last ``_id`` committed to the store.
+
+Finding the resource of a collection can take a probe per child dataset, so the
+resource found is cached in ``assets/data/datastore_resources.json`` together with a
+hash of the collection's child datasets. Later runs only fetch the collection
+metadata and reuse the cached resource unless the child datasets changed.
+"""
+import os
+import abc
+import json
+import hashlib
+from typing import Dict, Iterator, List
+from src.utils.http_client import HttpClient, default_client
+
+DATASTORE_URL = "https://data.gov.sg/api/action/datastore_search"
+METADATA_URL = (
+    "https://api-production.data.gov.sg/v2/public/api/collections/{}/metadata"
+)
+RESOURCES_PATH = "assets/data/datastore_resources.json"
+
+
+def read_json(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_json(path: str, state: Dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class Datastore(abc.ABC):
+    """
+    Base class for a datastore resource.
+
+    Subclasses set ``COLLECTION_ID`` and implement ``select_dataset`` to pick their
+    resource among the child datasets of the collection.
+
+    Methods:
+    --------
+    get_first_dataset():
+        Returns the resource ID, from the cache if the collection is unchanged.
+
+    fetch_json_response(**params):
+        Fetches one page of records.
+
+    iter_batches(last_id=0, batch_size=5000):
+        Yields pages of records with an ``_id`` above ``last_id`` until the
+        resource is exhausted.
+    """
+
+    COLLECTION_ID = None
+
+    def __init__(
+        self,
+        resource_id: str = None,
+        base_url: str = DATASTORE_URL,
+        client: HttpClient = None,
+        metadata_url: str = METADATA_URL,
+        resources_path: str = RESOURCES_PATH,
+    ):
+        """
+        Args:
+            resource_id (str, optional): Resource to read, discovered if not given.
+            base_url (str): Datastore search endpoint, can point at a local server.
+            client (HttpClient, optional): Shared client by default.
+            metadata_url (str): Collection metadata endpoint, formatted with the
+                collection ID.
+            resources_path (str): Cache of the discovered resource IDs.
+        """
+        self.base_url = base_url
+        self.client = client if client is not None else default_client()
+        self.metadata_url = metadata_url
+        self.resources_path = resources_path
+        if resource_id is None:
+            resource_id = self.get_first_dataset()
+        self._resource_id = resource_id
+
+    def child_datasets(self) -> List[str]:
+        response = self.client.get(self.metadata_url.format(self.COLLECTION_ID))
+        response.raise_for_status()
+        return response.json()["data"]["collectionMetadata"]["childDatasets"]
+
+    @abc.abstractmethod
+    def select_dataset(self, child_datasets: List[str]) -> str:
+        """
+        Returns the resource ID to read among the child datasets of the collection.
+        """
+
+    def get_first_dataset(self) -> str:
+        child_datasets = self.child_datasets()
+        digest = hashlib.sha256(json.dumps(child_datasets).encode()).hexdigest()
+        resources = read_json(self.resources_path)
+        key = str(self.COLLECTION_ID)
+        cached = resources.get(key, {})
+        if cached.get("hash") == digest:
+            return cached["resource_id"]
+
+        resource_id = self.select_dataset(child_datasets)
+        if resource_id is not None:
+            resources[key] = {"hash": digest, "resource_id": resource_id}
+            write_json(self.resources_path, resources)
+        return resource_id
+
+    def fetch_result(self, **params) -> Dict:
+        """
+        Fetches the result of a datastore search with the specified parameters.
+        """
+        if params.get("resource_id", None) is None:
+            params["resource_id"] = self._resource_id
+        if isinstance(params.get("filters"), dict):
+            params["filters"] = json.dumps(params["filters"])
+        response = self.client.get(self.base_url, params=params)
+
+        # Check if the request was successful
+        if response.status_code == 200:
+            return response.json()["result"]
+        response.raise_for_status()
+
+    def fetch_json_response(self, **params) -> List[Dict]:
+        """
+        Fetches JSON data from a given URL with the specified parameters.
+
+        Args:
+            params (dict, optional): Dictionary of query parameters.
+
+        Returns:
+            list: The records of the page.
+        """
+        return self.fetch_result(**params)["records"]
+
+    def count(self, **filters) -> int:
+        """
+        Returns the number of records matching the equality filters.
+        """
+        return int(self.fetch_result(filters=filters, limit=0)["total"])
+
+    def iter_records(self, filters: Dict, batch_size: int = 5000) -> Iterator[Dict]:
+        """
+        Yields every record matching the equality filters.
+        """
+        offset = 0
+        while True:
+            records = self.fetch_json_response(
+                filters=filters, offset=offset, limit=batch_size, sort="_id asc"
+            )
+            yield from records
+            if len(records) < batch_size:
+                return
+            offset += len(records)
+
+    def iter_batches(
+        self, last_id: int = 0, batch_size: int = 5000
+    ) -> Iterator[List[Dict]]:
+        """
+        Yields the records after ``last_id`` in pages of ``batch_size``.
+
+        ``_id`` starts at 1, so without deletions the records after ``last_id``
+        start at that offset. If records were deleted upstream the first page starts
+        past ``last_id + 1`` and the offset steps back by the gap. Records at or
+        below ``last_id`` are dropped in case the resource shifted between pages.
+        """
+        offset = last_id
+        first_page = True
+        while True:
+            records = self.fetch_json_response(
+                offset=offset, limit=batch_size, sort="_id asc"
+            )
+            if first_page and records and offset > 0:
+                gap = int(records[0]["_id"]) - last_id - 1
+                if gap > 0:
+                    offset = max(0, offset - gap)
+                    continue
+            first_page = False
+            batch = [record for record in records if int(record["_id"]) > last_id]
+            if batch:
+                last_id = max(int(record["_id"]) for record in batch)
+                yield batch
+            if len(records) < batch_size:
+                return
+            offset += len(records)
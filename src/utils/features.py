@@ -0,0 +1,305 @@
+"""
+Per-address amenity features shared by training, updating and serving.
+
+The amenity features (MRT and mall counts within the radius, distance to the nearest
+MRT and mall, distance to town) only depend on where an address is. They are kept in
+``assets/data/address_features.parquet`` with one row per address so that an update
+only computes them for addresses it has not seen before, and a prediction only has to
+look them up. The table records a hash of the amenity CSVs and is rebuilt from
+scratch when either file changes.
+
+The table is seeded with every block in ``hdb-property-information.csv`` as well as
+every geocoded address in the resale dataset::
+
+    python -m src.utils.features
+"""
+import os
+import hashlib
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sklearn.neighbors import KDTree
+from src.utils.geocode import GeocodeResolver, default_resolver
+
+MRT_PATH = "assets/amenities/mrt.csv"
+MALLS_PATH = "assets/amenities/malls.csv"
+AMENITY_PATHS = [MRT_PATH, MALLS_PATH]
+HDB_INFO_PATH = "assets/resale-flat-prices/hdb-property-information.csv"
+FEATURES_PATH = "assets/data/address_features.parquet"
+
+KEY_COLS = ["address", "latitude", "longitude"]
+AMENITY_COLS = ["mrt", "malls", "dist_mrt", "dist_malls", "distance_to_town"]
+# column order expected by the model
+MODEL_FEATURES = [
+    "storey_range",
+    "floor_area_sqm",
+    "flat_cat",
+    "remaining_lease_year",
+    "mrt",
+    "malls",
+    "year",
+    "dist_mrt",
+    "dist_malls",
+    "distance_to_town",
+]
+HASH_KEY = b"amenities_hash"
+
+
+def amenities_hash(paths: List[str] = None) -> str:
+    """
+    Returns a content hash of the amenity files.
+    """
+    digest = hashlib.sha256()
+    for path in paths or AMENITY_PATHS:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def empty_table() -> pd.DataFrame:
+    dtypes = {"address": object, "mrt": np.int64, "malls": np.int64}
+    return pd.DataFrame(
+        {
+            col: pd.Series(dtype=dtypes.get(col, np.float64))
+            for col in KEY_COLS + AMENITY_COLS
+        }
+    ).set_index("address")
+
+
+class AmenityIndex:
+    """
+    KD trees over the MRT stations and malls.
+
+    Coordinates are compared in degrees and converted to km with ``CONVERSION``.
+    """
+
+    RADIUS_KM = 2
+    CONVERSION = 111.1
+    METRIC = "manhattan"
+    TOWN = np.array([1.300556, 103.821667])
+
+    def __init__(self):
+        self.load_mrt_malls_tree()
+
+    def load_mrt_malls_tree(self):
+        """
+        Load as tree objects
+        """
+        mrt = pd.read_csv(MRT_PATH)
+        malls = pd.read_csv(MALLS_PATH)
+        mrt.reset_index(drop=True, inplace=True)
+        mrt_array = mrt[["latitude", "longitude"]].to_numpy()
+        malls_array = malls[["LAT", "LONG"]].to_numpy()
+        # manhattan is used to assume the longest distance
+        self.mrt_tree = KDTree(mrt_array, metric=self.METRIC)
+        self.malls_tree = KDTree(malls_array, metric=self.METRIC)
+
+    def get_indices(self, data_points: np.ndarray) -> np.ndarray:
+        """
+        Get the number of MRT stations and malls within the radius
+        """
+        radius = self.RADIUS_KM / self.CONVERSION
+        indices_mrt = self.mrt_tree.query_radius(
+            data_points,
+            r=radius,
+            count_only=True,
+        )
+        indices_malls = self.malls_tree.query_radius(
+            data_points, r=radius, count_only=True
+        )
+        return indices_mrt, indices_malls
+
+    def get_distance(self, data_points: np.ndarray) -> np.ndarray:
+        """
+        Get the distance of the nearest points
+        """
+        dist_mrt, _ = self.mrt_tree.query(data_points, k=1, return_distance=True)
+        dist_malls, _ = self.malls_tree.query(data_points, k=1, return_distance=True)
+        return dist_mrt.ravel() * self.CONVERSION, dist_malls.ravel() * self.CONVERSION
+
+    def get_distance_to_town(self, data_points: np.ndarray) -> np.ndarray:
+        """
+        Get the distance to town
+        """
+        return np.linalg.norm(data_points - self.TOWN, axis=1) * self.CONVERSION
+
+    def __call__(self, data_points: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Computes every amenity feature for an (n, 2) array of latitude, longitude.
+        """
+        data_points = np.asarray(data_points, dtype=np.float64).reshape(-1, 2)
+        indices_mrt, indices_malls = self.get_indices(data_points)
+        dist_mrt, dist_malls = self.get_distance(data_points)
+        return {
+            "mrt": indices_mrt,
+            "malls": indices_malls,
+            "dist_mrt": dist_mrt,
+            "dist_malls": dist_malls,
+            "distance_to_town": self.get_distance_to_town(data_points),
+        }
+
+
+class AddressFeatureTable:
+    """
+    A persisted table of amenity features keyed by address.
+
+    Methods:
+    --------
+    update(df):
+        Computes features for the addresses in ``df`` that are new or whose
+        coordinates changed. Returns the number of addresses computed.
+
+    lookup(df):
+        Returns the amenity features of every row of ``df``, aligned to its index.
+
+    get(address, latitude=None, longitude=None):
+        Returns the amenity features of a single address as a dict. Unknown
+        addresses are computed from the coordinates if they are given, and added
+        to the table in one batch the next time it is read.
+
+    add_hdb_blocks(resolver=None, path=HDB_INFO_PATH):
+        Geocodes and adds every block of the HDB property information file.
+
+    save():
+        Writes the table if it was modified.
+    """
+
+    def __init__(self, path: str = FEATURES_PATH, amenities: AmenityIndex = None):
+        self.path = path
+        self.amenities = amenities
+        self.hash = amenities_hash()
+        # stale means the persisted features cannot be reused, either because there
+        # are none or because the amenities have changed since they were computed
+        self.stale = True
+        self.modified = False
+        # rows computed by get, concatenated to the table when it is next read
+        self._pending: Dict[str, Dict] = {}
+        self.table = empty_table()
+        if os.path.exists(path):
+            metadata = pq.read_schema(path).metadata or {}
+            if metadata.get(HASH_KEY, b"").decode() == self.hash:
+                self.table = pd.read_parquet(path).set_index("address")
+                self.stale = False
+
+    def __len__(self):
+        return len(self.table)
+
+    @property
+    def table(self) -> pd.DataFrame:
+        if self._pending:
+            computed = pd.DataFrame.from_dict(self._pending, orient="index")
+            computed = computed.rename_axis("address").astype(self._table.dtypes)
+            self._pending = {}
+            self._table = pd.concat(
+                [self._table.drop(index=computed.index, errors="ignore"), computed]
+            )
+        return self._table
+
+    @table.setter
+    def table(self, table: pd.DataFrame):
+        self._pending = {}
+        self._table = table
+
+    def update(self, df: pd.DataFrame) -> int:
+        addresses = (
+            df[KEY_COLS]
+            .dropna()
+            .drop_duplicates(subset=["address"])
+            .set_index("address")
+        )
+        known = self.table.reindex(addresses.index)
+        moved = ~np.isclose(
+            known[["latitude", "longitude"]].to_numpy(dtype=np.float64),
+            addresses[["latitude", "longitude"]].to_numpy(dtype=np.float64),
+            atol=1e-6,
+        ).all(axis=1)
+        pending = addresses[moved]
+        if pending.empty:
+            return 0
+
+        if self.amenities is None:
+            self.amenities = AmenityIndex()
+        computed = pending.assign(
+            **self.amenities(pending[["latitude", "longitude"]].to_numpy())
+        )
+        self.table = pd.concat(
+            [self.table.drop(index=pending.index, errors="ignore"), computed]
+        )
+        self.modified = True
+        return len(computed)
+
+    def lookup(self, df: pd.DataFrame) -> pd.DataFrame:
+        features = self.table[AMENITY_COLS].reindex(df["address"].to_numpy())
+        features.index = df.index
+        return features
+
+    def get(
+        self, address: str, latitude: float = None, longitude: float = None
+    ) -> Dict[str, float]:
+        if address in self._pending:
+            return {col: float(self._pending[address][col]) for col in AMENITY_COLS}
+        if address in self._table.index:
+            return self._table.loc[address, AMENITY_COLS].to_dict()
+        if latitude is None or longitude is None:
+            raise KeyError(f"No features for {address} and no coordinates given")
+
+        if self.amenities is None:
+            self.amenities = AmenityIndex()
+        computed = self.amenities([latitude, longitude])
+        self._pending[address] = {
+            "latitude": float(latitude),
+            "longitude": float(longitude),
+            **{col: computed[col][0].item() for col in AMENITY_COLS},
+        }
+        self.modified = True
+        return {col: float(self._pending[address][col]) for col in AMENITY_COLS}
+
+    def add_hdb_blocks(
+        self, resolver: GeocodeResolver = None, path: str = HDB_INFO_PATH
+    ):
+        """
+        Adds every HDB block, geocoding the ones that are not in the table yet.
+
+        Returns:
+            int: The number of addresses computed.
+        """
+        blocks = pd.read_csv(path, usecols=["blk_no", "street"], dtype=str)
+        addresses = (blocks["blk_no"] + " " + blocks["street"]).unique()
+        missing = [address for address in addresses if address not in self.table.index]
+        resolver = resolver if resolver is not None else default_resolver()
+        coords = {
+            address: lat_lon
+            for address, lat_lon in resolver.resolve_many(missing).items()
+            if lat_lon is not None
+        }
+        if not coords:
+            return 0
+        located = pd.DataFrame.from_dict(
+            coords, orient="index", columns=["latitude", "longitude"]
+        )
+        return self.update(located.rename_axis("address").reset_index())
+
+    def save(self):
+        if not self.modified:
+            return
+        table = pa.Table.from_pandas(self.table.reset_index(), preserve_index=False)
+        metadata = {**(table.schema.metadata or {}), HASH_KEY: self.hash.encode()}
+        tmp_path = self.path + ".tmp"
+        pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+        os.replace(tmp_path, self.path)
+        self.stale = False
+        self.modified = False
+
+
+if __name__ == "__main__":
+    from src.utils.storage import load_resale
+
+    address_features = AddressFeatureTable()
+    print(f"Loaded {len(address_features)} addresses, stale={address_features.stale}")
+    computed = address_features.update(load_resale(columns=KEY_COLS))
+    print(f"Computed {computed} addresses from the resale dataset")
+    computed = address_features.add_hdb_blocks()
+    print(f"Computed {computed} HDB blocks")
+    address_features.save()
@@ -0,0 +1,245 @@
+"""
+Geocoding of addresses through OneMap with a persistent cache.
+
+OneMap's search API is free but rate limited to 250 requests per minute. Resolved
+addresses are kept in a SQLite file so each address is only looked up once across
+runs of the updaters and the Streamlit pages. Addresses OneMap cannot find are cached
+as negative results for a shorter time so they are retried eventually.
+
+The scheduled update workflow starts from a fresh checkout, so the cache file is
+committed along with the datasets it helped build; otherwise every run would start
+with an empty cache and the negative TTL would never apply.
+"""
+import os
+import time
+import sqlite3
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+import requests
+from src.utils.http_client import HttpClient, default_client
+
+ONEMAP_URL = "https://www.onemap.gov.sg/api/common/elastic/search"
+CACHE_PATH = "assets/data/geocode_cache.sqlite"
+RATE_LIMIT = 250  # requests per minute
+NEGATIVE_TTL = 7 * 24 * 60 * 60  # seconds
+
+Coords = Optional[Tuple[float, float]]
+
+
+def normalize_address(address: str) -> str:
+    """
+    Upper cases the address and collapses whitespace so equivalent strings share a key.
+    """
+    return " ".join(str(address).upper().split())
+
+
+class GeocodeCache:
+    """
+    A SQLite backed cache of address to coordinates.
+
+    Negative results are stored with empty coordinates. Entries older than their TTL
+    are treated as missing. A ``positive_ttl`` of None keeps found addresses forever.
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        positive_ttl: Optional[float] = None,
+        negative_ttl: Optional[float] = NEGATIVE_TTL,
+    ):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        # streamlit serves sessions from several threads
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            "address TEXT PRIMARY KEY, latitude REAL, longitude REAL, "
+            "updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+
+    def _is_fresh(self, latitude, updated_at, now) -> bool:
+        ttl = self.positive_ttl if latitude is not None else self.negative_ttl
+        return ttl is None or now - updated_at <= ttl
+
+    def get_many(self, addresses: Iterable[str]) -> Dict[str, Coords]:
+        """
+        Looks up normalized addresses.
+
+        Args:
+            addresses (Iterable[str]): Normalized addresses.
+
+        Returns:
+            Dict[str, Coords]: Fresh entries only. Negative results map to None.
+        """
+        addresses = list(addresses)
+        found, now = {}, time.time()
+        with self._lock:
+            # stay below sqlite's limit on bound parameters
+            for start in range(0, len(addresses), 500):
+                chunk = addresses[start : start + 500]
+                rows = self._conn.execute(
+                    "SELECT address, latitude, longitude, updated_at FROM geocode "
+                    f"WHERE address IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for address, lat, lon, updated_at in rows:
+                    if self._is_fresh(lat, updated_at, now):
+                        found[address] = None if lat is None else (lat, lon)
+        return found
+
+    def put_many(self, results: Dict[str, Coords]):
+        """
+        Stores results keyed by normalized address, None for not found.
+        """
+        now = time.time()
+        rows = [
+            (address, *(coords if coords is not None else (None, None)), now)
+            for address, coords in results.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+
+class TokenBucket:
+    """
+    A thread safe token bucket allowing ``rate`` acquisitions every ``per`` seconds.
+    """
+
+    def __init__(self, rate: float, per: float = 60.0, capacity: float = None):
+        self.fill_rate = rate / per
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a token is available.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated_at) * self.fill_rate,
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+
+class GeocodeResolver:
+    """
+    Resolves addresses to coordinates through the cache, then OneMap.
+
+    Addresses are normalized and deduplicated before any lookup, and cache misses
+    are fetched concurrently from a thread pool while a token bucket keeps the
+    request rate within OneMap's limit. ``base_url`` can point at a local stub server.
+
+    Methods:
+    --------
+    fetch(address):
+        Queries OneMap for a single address, bypassing the cache.
+
+    resolve_many(addresses):
+        Returns a dict of address to coordinates (or None if not found).
+
+    resolve(address):
+        Returns the coordinates of a single address (or None if not found).
+    """
+
+    def __init__(
+        self,
+        cache: GeocodeCache = None,
+        base_url: str = ONEMAP_URL,
+        rate: float = RATE_LIMIT,
+        per: float = 60.0,
+        max_workers: int = 8,
+        timeout: float = 30,
+        client: HttpClient = None,
+    ):
+        self.cache = cache if cache is not None else GeocodeCache()
+        self.base_url = base_url
+        self.client = client if client is not None else default_client()
+        self.bucket = TokenBucket(rate, per)
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+    def fetch(self, address: str) -> Coords:
+        self.bucket.acquire()
+        response = self.client.get(
+            self.base_url,
+            params={
+                "searchVal": address,
+                "returnGeom": "Y",
+                "getAddrDetails": "Y",
+                "pageNum": 1,
+            },
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        results = response.json()["results"]
+        if len(results) > 0:
+            return float(results[0]["LATITUDE"]), float(results[0]["LONGITUDE"])
+        return None
+
+    def _fetch_or_error(self, address: str):
+        try:
+            return self.fetch(address)
+        except (requests.RequestException, ValueError, KeyError) as err:
+            return err
+
+    def resolve_many(self, addresses: Iterable[str]) -> Dict[str, Coords]:
+        """
+        Resolves many addresses with one lookup per unique normalized address.
+
+        Args:
+            addresses (Iterable[str]): Raw addresses, duplicates allowed.
+
+        Returns:
+            Dict[str, Coords]: Coordinates keyed by the raw addresses. Addresses that
+                could not be found, or failed to fetch, map to None.
+        """
+        keys = {address: normalize_address(address) for address in addresses}
+        unique = set(keys.values())
+        results = self.cache.get_many(unique)
+        missing = sorted(unique - results.keys())
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                fetched = dict(zip(missing, pool.map(self._fetch_or_error, missing)))
+            # errors are not cached so that they are retried on the next run
+            fetched = {
+                key: value
+                for key, value in fetched.items()
+                if not isinstance(value, Exception)
+            }
+            self.cache.put_many(fetched)
+            results.update(fetched)
+        return {address: results.get(key) for address, key in keys.items()}
+
+    def resolve(self, address: str) -> Coords:
+        return self.resolve_many([address])[address]
+
+
+@lru_cache(maxsize=None)
+def default_resolver() -> GeocodeResolver:
+    """
+    Returns the resolver shared by the updaters and the Streamlit pages.
+    """
+    return GeocodeResolver()
@@ -0,0 +1,163 @@
+"""
+Hexagonal binning of transactions over Singapore.
+
+The map used to send every transaction to the browser and let pydeck's
+``HexagonLayer`` aggregate them. Binning on the server instead sends a few hundred
+cells with their count and median price, which are small enough to cache per filter
+combination.
+
+The grid is a fixed pointy-top hexagonal grid on an equirectangular projection
+centred on Singapore, where the distortion over the island is well below a metre
+per kilometre. Cells are identified by their axial coordinates ``(q, r)``.
+
+``MapTiles`` persists the cells of every month and flat type in
+``assets/data/map_tiles.parquet``, updated by ``update_csv.py`` like the resale
+rollup, so the map filters and animates by slicing the tiles instead of binning the
+transactions::
+
+    python -m src.utils.hexbin
+"""
+import os
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+from src.utils.rollup import ResaleRollup
+from src.utils.sketch import COMPRESSION
+from src.utils.storage import DATA_DIR
+
+TILES_PATH = os.path.join(DATA_DIR, "map_tiles.parquet")
+ORIGIN = (1.3521, 103.8198)
+RADIUS = 500  # metres from the centre of a cell to its corners
+METRES_PER_DEGREE = 111_320
+CELL_COLS = ["q", "r"]
+
+
+def to_xy(latitude: np.ndarray, longitude: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    x = (longitude - ORIGIN[1]) * METRES_PER_DEGREE * np.cos(np.radians(ORIGIN[0]))
+    y = (latitude - ORIGIN[0]) * METRES_PER_DEGREE
+    return x, y
+
+
+def to_latlon(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    latitude = ORIGIN[0] + y / METRES_PER_DEGREE
+    longitude = ORIGIN[1] + x / (METRES_PER_DEGREE * np.cos(np.radians(ORIGIN[0])))
+    return latitude, longitude
+
+
+def hex_index(
+    latitude: np.ndarray, longitude: np.ndarray, radius: float = RADIUS
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the axial coordinates of the cells containing the points, which must
+    be finite, see ``located``.
+    """
+    x, y = to_xy(np.asarray(latitude, float), np.asarray(longitude, float))
+    q = (np.sqrt(3) / 3 * x - y / 3) / radius
+    r = (2 / 3 * y) / radius
+    # round in cube coordinates and fix the component with the largest error
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype(np.int32), rr.astype(np.int32)
+
+
+def located(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the rows with a finite latitude and longitude. Other rows have no cell,
+    ``hex_index`` would cast their NaN coordinates to the smallest int32.
+    """
+    coords = df[["latitude", "longitude"]].to_numpy(dtype=np.float64)
+    return df[np.isfinite(coords).all(axis=1)]
+
+
+def hex_center(
+    q: np.ndarray, r: np.ndarray, radius: float = RADIUS
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the latitude and longitude of the centres of the cells.
+    """
+    x = radius * np.sqrt(3) * (q + r / 2)
+    y = radius * 1.5 * r
+    return to_latlon(x, y)
+
+
+def bin_prices(
+    df: pd.DataFrame, by: List[str] = None, radius: float = RADIUS
+) -> pd.DataFrame:
+    """
+    Aggregates resale prices per cell. Transactions without coordinates are left
+    out.
+
+    Args:
+        df (pd.DataFrame): Transactions with latitude, longitude and resale_price.
+        by (List[str], optional): Columns to bin separately, e.g. ["year"].
+        radius (float): Cell radius in metres.
+
+    Returns:
+        pd.DataFrame: One row per cell (and ``by`` group) with its count, median
+            price and centre.
+    """
+    by = list(by or [])
+    df = located(df)
+    q, r = hex_index(df["latitude"].to_numpy(), df["longitude"].to_numpy(), radius)
+    cells = (
+        df[by + ["resale_price"]]
+        .assign(q=q, r=r)
+        .groupby(by + CELL_COLS, observed=True)["resale_price"]
+        .agg(["count", "median"])
+        .reset_index()
+    )
+    latitude, longitude = hex_center(cells["q"], cells["r"], radius)
+    return cells.assign(latitude=latitude, longitude=longitude)
+
+
+class MapTiles(ResaleRollup):
+    """
+    Resale price statistics per month, flat type and hexagonal cell.
+
+    Methods:
+    --------
+    update(store=None):
+        Recomputes the tiles of the months whose store partitions changed.
+
+    map_cells(**filters):
+        Returns the count, quantiles and centre of every cell over the tiles
+        matching ``filters``, e.g. year=2017, month=3, flat_type="4 ROOM".
+
+    save():
+        Writes the tiles if they were modified.
+    """
+
+    DIMENSIONS = ["year", "month", "flat_type"] + CELL_COLS
+    SOURCE_COLS = [
+        "year",
+        "month",
+        "flat_type",
+        "latitude",
+        "longitude",
+        "resale_price",
+        "remaining_lease_year",
+    ]
+
+    def __init__(self, path: str = TILES_PATH, compression: float = COMPRESSION):
+        super().__init__(path, compression)
+
+    def summarize(self, rows: pd.DataFrame) -> pd.DataFrame:
+        rows = located(rows)
+        q, r = hex_index(rows["latitude"].to_numpy(), rows["longitude"].to_numpy())
+        return super().summarize(rows.assign(q=q, r=r))
+
+    def map_cells(self, **filters) -> pd.DataFrame:
+        cells = self.slice(CELL_COLS, **filters)
+        latitude, longitude = hex_center(cells["q"], cells["r"])
+        return cells.assign(latitude=latitude, longitude=longitude)
+
+
+if __name__ == "__main__":
+    tiles = MapTiles()
+    print(f"Recomputed {tiles.update()} months, {len(tiles)} tiles")
+    tiles.save()
@@ -0,0 +1,192 @@
+"""
+Shared HTTP client for the data.gov.sg and OneMap APIs.
+
+Every updater and the apps go through one ``HttpClient`` so that connections are
+kept alive between calls instead of paying a TCP and TLS handshake per request.
+Throttled (429) and transient server errors are retried with jittered exponential
+backoff, honouring ``Retry-After`` when the server sends one, and a per-host cap
+limits how many requests are in flight to the same host at once.
+"""
+import time
+import random
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Dict, Optional
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+TIMEOUT = 30
+MAX_RETRIES = 5
+BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+MAX_PER_HOST = 8
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def retry_after(response: Optional[requests.Response]) -> Optional[float]:
+    """
+    Returns the delay in seconds requested by a ``Retry-After`` header, if any.
+    """
+    if response is None or "Retry-After" not in response.headers:
+        return None
+    value = response.headers["Retry-After"]
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestMetrics:
+    """
+    Thread-safe request counters per host.
+
+    Methods:
+    --------
+    record(host, seconds, num_bytes, error=False, retried=False):
+        Adds one request attempt.
+
+    snapshot():
+        Returns the counters per host as a dict.
+    """
+
+    FIELDS = ("requests", "errors", "retries", "seconds", "bytes")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = defaultdict(lambda: dict.fromkeys(self.FIELDS, 0))
+
+    def record(
+        self,
+        host: str,
+        seconds: float,
+        num_bytes: int,
+        error: bool = False,
+        retried: bool = False,
+    ):
+        with self._lock:
+            counters = self._hosts[host]
+            counters["requests"] += 1
+            counters["errors"] += int(error)
+            counters["retries"] += int(retried)
+            counters["seconds"] += seconds
+            counters["bytes"] += num_bytes
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {host: dict(counters) for host, counters in self._hosts.items()}
+
+    def summary(self) -> str:
+        lines = []
+        for host, counters in sorted(self.snapshot().items()):
+            mean_ms = counters["seconds"] / max(counters["requests"], 1) * 1000
+            lines.append(
+                f"{host}: {counters['requests']} requests, "
+                f"{counters['retries']} retried, {counters['errors']} failed attempts, "
+                f"{mean_ms:.0f} ms mean, {counters['bytes'] / 1e6:.2f} MB"
+            )
+        return "\n".join(lines)
+
+
+class HttpClient:
+    """
+    A pooled ``requests.Session`` with retries and a per-host concurrency cap.
+
+    Methods:
+    --------
+    request(method, url, **kwargs):
+        Sends a request, retrying throttled and transient failures. Returns the
+        last response, or raises the last connection error.
+
+    get(url, **kwargs), post(url, **kwargs):
+        Shorthands for ``request``.
+    """
+
+    def __init__(
+        self,
+        timeout: float = TIMEOUT,
+        max_retries: int = MAX_RETRIES,
+        backoff: float = BACKOFF,
+        max_backoff: float = MAX_BACKOFF,
+        max_per_host: int = MAX_PER_HOST,
+    ):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_per_host = max_per_host
+        self.metrics = RequestMetrics()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_per_host)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._slots = {}
+        self._slots_lock = threading.Lock()
+
+    @contextmanager
+    def _slot(self, host: str):
+        with self._slots_lock:
+            slot = self._slots.setdefault(
+                host, threading.BoundedSemaphore(self.max_per_host)
+            )
+        with slot:
+            yield
+
+    def delay(self, attempt: int, response: requests.Response = None) -> float:
+        """
+        Returns how long to wait before retrying, the server's ``Retry-After`` if it
+        sent one, otherwise exponential backoff with full jitter.
+        """
+        requested = retry_after(response)
+        if requested is not None:
+            return min(requested, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlparse(url).netloc
+        for attempt in range(self.max_retries + 1):
+            response, error = None, None
+            with self._slot(host):
+                start = time.perf_counter()
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as err:
+                    error = err
+                elapsed = time.perf_counter() - start
+            retry = error is not None or response.status_code in RETRY_STATUSES
+            self.metrics.record(
+                host,
+                elapsed,
+                len(response.content) if response is not None else 0,
+                error=retry,
+                retried=retry and attempt < self.max_retries,
+            )
+            if not retry:
+                return response
+            if attempt < self.max_retries:
+                time.sleep(self.delay(attempt, response))
+        if error is not None:
+            raise error
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+
+@lru_cache(maxsize=None)
+def default_client() -> HttpClient:
+    """
+    Returns the client shared within a process.
+    """
+    return HttpClient()
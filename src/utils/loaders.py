@@ -0,0 +1,72 @@
+"""
+Datasets shared by the Streamlit pages.
+
+Every dataset has its own loader cached with ``st.cache_resource``, so every page and
+every browser session gets the same object instead of its own copy, and a page only
+pays for the datasets it renders. The modules behind a loader are imported when it
+is first called, so the home page does not import scikit-learn or xgboost, which
+matters when a sleeping dyno cold-starts on a visit.
+
+The frames use the compact dtypes of ``storage.RESALE_SCHEMA``. They are shared and
+must not be modified in place; pages filter them into new frames before adding
+columns.
+"""
+from datetime import datetime
+import streamlit as st
+
+
+def resale_last_modified() -> datetime:
+    """
+    Returns when the resale store was last written, without loading it.
+    """
+    from src.utils.storage import resale_last_modified
+
+    return resale_last_modified()
+
+
+@st.cache_resource
+def resale_frame():
+    from src.utils.storage import load_compact_resale
+
+    return load_compact_resale()
+
+
+@st.cache_resource
+def rental_frame():
+    from src.utils.storage import load_compact_rental
+
+    return load_compact_rental()
+
+
+def built(rollup):
+    """
+    Computes a rollup or the map tiles from the store and saves them when there is no
+    saved table yet, as on a fresh deploy before ``update_csv.py`` has run.
+    """
+    if len(rollup) == 0:
+        from src.utils.storage import PartitionedStore
+
+        rollup.update(PartitionedStore())
+        rollup.save()
+    return rollup
+
+
+@st.cache_resource
+def resale_rollup():
+    from src.utils.rollup import ResaleRollup
+
+    return built(ResaleRollup())
+
+
+@st.cache_resource
+def map_tiles():
+    from src.utils.hexbin import MapTiles
+
+    return built(MapTiles())
+
+
+@st.cache_resource
+def hdb_blocks():
+    from src.utils.blocks import default_registry
+
+    return default_registry()
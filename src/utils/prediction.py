@@ -0,0 +1,223 @@
+"""
+Batch prediction for the serving app.
+
+Everything a prediction needs is loaded once per worker: the current model of the
+model registry, the per-address amenity features and the registry of HDB blocks. A
+batch of flats is then turned into model features with a few vectorized lookups and
+scored with a single ``predict`` call. Addresses missing from the feature table are
+geocoded on the fly. A model published by a retrain is picked up between requests
+without a restart.
+"""
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+from src.train import PredictProcessor
+from src.utils.blocks import BlockRegistry, default_registry
+from src.utils.common_func import avg_area
+from src.utils.features import AMENITY_COLS, MODEL_FEATURES, AddressFeatureTable
+from src.utils.geocode import GeocodeResolver, default_resolver
+from src.utils.registry import LiveModel
+from src.utils.streets import normalize_street
+
+
+class BatchPredictor:
+    """
+    Predicts resale prices for batches of flats.
+
+    Each flat is a dict with ``blk_no``, ``street`` (either as written in the HDB
+    property information or in full as OneMap returns it), ``storey_range`` and either
+    ``flat_type`` or ``flat_cat``.
+    ``floor_area_sqm`` and ``lease_commence_date`` are optional and default to the
+    average area of the flat type and the completion year of the block.
+
+    Methods:
+    --------
+    validate(flats):
+        Raises a ValueError describing the first invalid flat.
+
+    resolve(addresses):
+        Geocodes the addresses missing from the feature table.
+
+    build_features(flats):
+        Returns the model features of a list of flats.
+
+    predict(flats):
+        Returns the predicted prices and the time spent in each stage in ms.
+    """
+
+    def __init__(
+        self,
+        model: LiveModel = None,
+        address_features: AddressFeatureTable = None,
+        resolver: GeocodeResolver = None,
+        blocks: BlockRegistry = None,
+    ):
+        self.model = model if model is not None else LiveModel()
+        self.address_features = (
+            address_features if address_features is not None else AddressFeatureTable()
+        )
+        self.resolver = resolver
+        self.blocks = blocks if blocks is not None else default_registry()
+        self.index_features()
+
+    def index_features(self):
+        """
+        Snapshots the feature table into an array and a dict of row positions, which
+        are much cheaper than pandas indexing for small batches.
+        """
+        table = self.address_features.table
+        self.amenities = table[AMENITY_COLS].to_numpy(dtype=np.float64)
+        self.positions = dict(zip(table.index, range(len(table))))
+
+    @staticmethod
+    def validate(flats: List[Dict]):
+        """
+        Checks that every flat has the fields ``build_features`` reads, with values
+        it can convert.
+
+        Raises:
+            ValueError: Describes the first invalid flat and field.
+        """
+        if not isinstance(flats, list) or not flats:
+            raise ValueError("Expected a non-empty list of flats")
+        for i, flat in enumerate(flats):
+            if not isinstance(flat, dict):
+                raise ValueError(f"Flat {i} is not an object")
+            for field in ["blk_no", "street", "storey_range"]:
+                if flat.get(field) in (None, ""):
+                    raise ValueError(f"Flat {i}: missing field '{field}'")
+            if not isinstance(flat["street"], str):
+                raise ValueError(f"Flat {i}: 'street' must be a string")
+            if "flat_cat" in flat:
+                try:
+                    flat_cat = int(flat["flat_cat"])
+                except (TypeError, ValueError):
+                    flat_cat = None
+                if flat_cat not in avg_area:
+                    raise ValueError(
+                        f"Flat {i}: 'flat_cat' must be one of {sorted(avg_area)}"
+                    )
+            elif "flat_type" not in flat:
+                raise ValueError(f"Flat {i}: missing field 'flat_type' or 'flat_cat'")
+            elif (
+                not isinstance(flat["flat_type"], str)
+                or flat["flat_type"].upper() not in PredictProcessor.FLAT_CATEGORIES
+            ):
+                raise ValueError(
+                    f"Flat {i}: unknown flat_type {flat['flat_type']!r}, expected one "
+                    f"of {list(PredictProcessor.FLAT_CATEGORIES)}"
+                )
+            for field in ["storey_range", "floor_area_sqm", "lease_commence_date"]:
+                if flat.get(field) in (None, ""):
+                    continue
+                try:
+                    float(flat[field])
+                except (TypeError, ValueError):
+                    raise ValueError(
+                        f"Flat {i}: '{field}' must be a number, got {flat[field]!r}"
+                    ) from None
+
+    def resolve(self, addresses: List[str]) -> int:
+        """
+        Geocodes the addresses missing from the feature table.
+
+        Returns:
+            int: The number of addresses that had to be geocoded.
+        """
+        missing = {address for address in addresses if address not in self.positions}
+        if not missing:
+            return 0
+        if self.resolver is None:
+            self.resolver = default_resolver()
+        coords = {
+            address: lat_lon
+            for address, lat_lon in self.resolver.resolve_many(missing).items()
+            if lat_lon is not None
+        }
+        if coords:
+            located = pd.DataFrame.from_dict(
+                coords, orient="index", columns=["latitude", "longitude"]
+            )
+            self.address_features.update(located.rename_axis("address").reset_index())
+            self.index_features()
+        return len(missing)
+
+    def parse(self, flat: Dict) -> Dict:
+        """
+        Adds the matching HDB block and its address to a flat.
+        """
+        block = self.blocks.get(flat["blk_no"], flat["street"])
+        if block is not None:
+            address = f"{block.blk_no} {block.street}"
+        else:
+            address = f"{str(flat['blk_no']).strip().upper()} "
+            address += normalize_street(flat["street"])
+        return {**flat, "block": block, "address": address}
+
+    def build_features(self, flats: List[Dict]) -> np.ndarray:
+        """
+        Builds an (n, len(MODEL_FEATURES)) array. Unknown addresses get NaN amenity
+        features, which the model treats as missing values.
+        """
+        year = datetime.now().year
+        columns = {name: np.full(len(flats), np.nan) for name in MODEL_FEATURES}
+        rows = np.full(len(flats), -1)
+        for i, flat in enumerate(flats):
+            if "flat_cat" in flat:
+                flat_cat = int(flat["flat_cat"])
+            else:
+                flat_cat = PredictProcessor.FLAT_CATEGORIES[flat["flat_type"].upper()]
+            lease_start = flat.get("lease_commence_date")
+            if not lease_start:
+                block = flat["block"]
+                lease_start = block.year_completed if block is not None else np.nan
+            columns["storey_range"][i] = float(flat["storey_range"])
+            columns["flat_cat"][i] = flat_cat
+            columns["floor_area_sqm"][i] = float(
+                flat.get("floor_area_sqm") or avg_area[flat_cat]
+            )
+            columns["remaining_lease_year"][i] = 99 - (year - float(lease_start))
+            rows[i] = self.positions.get(flat["address"], -1)
+        columns["year"][:] = year
+
+        found = rows >= 0
+        for j, name in enumerate(AMENITY_COLS):
+            columns[name][found] = self.amenities[rows[found], j]
+        return np.column_stack([columns[name] for name in MODEL_FEATURES])
+
+    def predict(self, flats: List[Dict]) -> Tuple[np.ndarray, Dict[str, float]]:
+        """
+        Predicts the resale price of every flat.
+
+        Args:
+            flats (List[Dict]): The flats to score.
+
+        Returns:
+            Tuple[np.ndarray, Dict[str, float]]: Predicted prices, and the time spent
+                parsing, resolving addresses, building features and predicting in ms.
+
+        Raises:
+            ValueError: A flat is invalid, see ``validate``.
+        """
+        self.validate(flats)
+        timings = {}
+        start = stage = time.perf_counter()
+
+        def lap(name):
+            nonlocal stage
+            now = time.perf_counter()
+            timings[name] = (now - stage) * 1000
+            stage = now
+
+        flats = [self.parse(flat) for flat in flats]
+        lap("parse")
+        self.resolve([flat["address"] for flat in flats])
+        lap("resolve")
+        features = self.build_features(flats)
+        lap("features")
+        predictions = self.model.predict(features)
+        lap("predict")
+        timings["total"] = (stage - start) * 1000
+        return predictions, timings
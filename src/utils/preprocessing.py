@@ -1,19 +1,8 @@
 import pandas as pd
 import numpy as np
-import json
-import requests
-import difflib as dl
-from datetime import datetime
-from tqdm import tqdm
 from src.train import PredictProcessor
-
-
-def load_mrt_malls():
-    mrt = pd.read_csv("assets/amenities/mrt.csv")
-    malls = pd.read_csv("assets/amenities/malls.csv")
-    convert_mrt_array = mrt[["LAT", "LONG"]].to_numpy()
-    convert_malls_array = malls[["LAT", "LONG"]].to_numpy()
-    return convert_mrt_array, convert_malls_array
+from src.utils.geocode import GeocodeResolver, default_resolver
+from src.utils.features import AMENITY_COLS, AddressFeatureTable
 
 
 class Preprocessor:
@@ -27,7 +16,8 @@ class Preprocessor:
         'street_name' columns and drops the original columns.
 
     getcoordinates(address):
-        Returns the latitude and longitude of the given address using OneMap API.
+        Returns the latitude and longitude of the given address using the shared
+        geocode cache, falling back to the OneMap API.
 
     get_storey_range(df):
         Splits the 'storey_range' column into two columns and takes the mean of the
@@ -38,8 +28,9 @@ class Preprocessor:
         'lease_commence_date' columns.
 
     get_lat_lon(old_df:pd.DataFrame, new_df):
-        Adds latitude and longitude columns to the new dataframe by using the existing
-          values from the old dataframe or by calling the getcoordinates method.
+        Adds latitude and longitude columns to the new dataframe. Addresses already
+          in the old dataframe are mapped in one pass, the remaining unique addresses
+          are resolved in one batch through the geocode cache.
 
     set_dtypes(df):
         Converts the 'lease_commence_date' column to datetime and 'resale_price' and
@@ -56,27 +47,16 @@ class Preprocessor:
         Calls all the above methods to preprocess the dataframe.
     """
 
+    def __init__(self, resolver: GeocodeResolver = None):
+        self.resolver = resolver if resolver is not None else default_resolver()
+
     @staticmethod
     def get_address(df):
         df["address"] = df["block"] + " " + df["street_name"]
         df.drop(["block", "street_name"], axis=1, inplace=True)
 
-    @staticmethod
-    def getcoordinates(address):
-        req = requests.get(
-            "https://www.onemap.gov.sg/api/common/elastic/search?searchVal="
-            + address
-            + "&returnGeom=Y&getAddrDetails=Y&pageNum=1",
-            timeout=30,
-        )
-        resultsdict = json.loads(req.text)
-        if len(resultsdict["results"]) > 0:
-            return [
-                resultsdict["results"][0]["LATITUDE"],
-                resultsdict["results"][0]["LONGITUDE"],
-            ]
-        else:
-            pass
+    def getcoordinates(self, address):
+        return self.resolver.resolve(address)
 
     @staticmethod
     def get_storey_range(df):
@@ -102,43 +82,54 @@ class Preprocessor:
         )
 
     def get_lat_lon(self, old_df: pd.DataFrame, new_df: pd.DataFrame = None):
-        dict_lat_lon = (
+        coords = (
             old_df[["address", "latitude", "longitude"]]
+            .dropna()
             .drop_duplicates(subset=["address"])
             .set_index("address")
-            .to_dict()
+            .astype(np.float64)
         )
-        for idx, row in tqdm(new_df.iterrows()):
-            value = dict_lat_lon["latitude"].get(row["address"], np.nan)
-            if isinstance(value, (float, np.float64, np.float32)) and np.isnan(value):
-                lat, lon = self.getcoordinates(row["address"])
-                new_df.loc[idx, ["latitude", "longitude"]] = lat, lon
-                dict_lat_lon["latitude"][row["address"]] = lat
-                dict_lat_lon["longitude"][row["address"]] = lon
-            else:
-                new_df.loc[idx, ["latitude", "longitude"]] = (
-                    dict_lat_lon["latitude"][row["address"]],
-                    dict_lat_lon["longitude"][row["address"]],
-                )
-
-    def get_nearest_amenities(self, df: pd.DataFrame) -> pd.DataFrame:
+        # only addresses missing from old_df reach the resolver, so the geocode cache
+        # is not seeded with the ones it already has
+        unknown = new_df.loc[~new_df["address"].isin(coords.index), "address"].unique()
+        resolved = {
+            address: lat_lon
+            for address, lat_lon in self.resolver.resolve_many(unknown).items()
+            if lat_lon is not None
+        }
+        if resolved:
+            resolved = pd.DataFrame.from_dict(
+                resolved, orient="index", columns=["latitude", "longitude"]
+            )
+            coords = pd.concat([coords, resolved.astype(np.float64)])
+
+        # addresses that could not be resolved are left as NaN
+        new_df["latitude"] = new_df["address"].map(coords["latitude"])
+        new_df["longitude"] = new_df["address"].map(coords["longitude"])
+
+    def get_nearest_amenities(
+        self, df: pd.DataFrame, features: AddressFeatureTable = None
+    ) -> pd.DataFrame:
         """
-        Temporary function to get the nearest amenities
+        Adds the amenity features of each address from the shared feature table.
+        Only addresses missing from the table are computed, the caller saves the table
+        once it is done with it.
 
         Args:
             df (pd.DataFrame): The HDB resale price dataset.
+            features (AddressFeatureTable, optional): Per-address feature table, loaded
+                from disk by default.
 
         Returns:
             pd.DataFrame: The HDB resale price dataset with the nearest amenities.
         """
-        predict = PredictProcessor()
-        dist = predict(df)
-        # This is pretty bad
-        df[
-            ["mrt", "malls", "dist_malls", "dist_mrt", "distance_to_town", "flat_cat"]
-        ] = dist[
-            ["mrt", "malls", "dist_malls", "dist_mrt", "distance_to_town", "flat_cat"]
-        ]
+        if features is None:
+            features = AddressFeatureTable()
+        features.update(df)
+        df[AMENITY_COLS] = features.lookup(df)
+        # flat_type may be a category, map the strings to get integers
+        flat_type = df["flat_type"].astype(str)
+        df["flat_cat"] = flat_type.map(PredictProcessor.FLAT_CATEGORIES)
         return df
 
     @staticmethod
@@ -151,10 +142,22 @@ class Preprocessor:
         df["year"] = df.month.dt.year
         df["month"] = df.month.dt.month
 
-    def add_new_to_old(self, old_df: pd.DataFrame, new_df: pd.DataFrame):
-        self.get_lat_lon(old_df, new_df)
+    def add_new_to_old(
+        self, old_df: pd.DataFrame, new_df: pd.DataFrame, known: pd.DataFrame = None
+    ):
+        """
+        Geocodes ``new_df`` and appends it to ``old_df`` with matching dtypes.
+        Coordinates are looked up in ``known`` if given, otherwise in ``old_df``.
+        """
+        self.get_lat_lon(old_df if known is None else known, new_df)
         for col in old_df.columns:
             try:
+                if isinstance(old_df[col].dtype, pd.CategoricalDtype):
+                    # widen the categories first so unseen values are not lost
+                    categories = old_df[col].cat.categories.union(
+                        new_df[col].dropna().unique()
+                    )
+                    old_df[col] = old_df[col].cat.set_categories(categories)
                 new_df[col] = new_df[col].astype(old_df[col].dtype)
             except KeyError:
                 pass
@@ -174,86 +177,3 @@ class Preprocessor:
         self.set_dtypes(df)
         self.create_year_month(df)
         return df
-
-
-def info_parser(features: dict, mrt_array, malls_array, hdb_details_df: pd.DataFrame):
-    CONVERSION = 111
-    CENTRAL = np.array([1.300556, 103.821667])
-    RADIUS = 3
-    AVG_AREA = {
-        1: 31.0,
-        2: 45.82892057026476,
-        3: 68.18060710335504,
-        4: 95.47028447439294,
-        5: 118.0717443108435,
-        6: 144.3410299943407,
-        7: 160.15217391304347,
-    }
-
-    REORDER_LIST = [
-        "storey_range",
-        "floor_area_sqm",
-        "remaining_lease_year",
-        "distance_to_town",
-        "distance_to_mrt",
-        "distance_to_mall",
-        "number_of_malls",
-        "year",
-        "flat_cat",
-    ]
-
-    postal = features["Postal"]
-    req = requests.get(
-        "https://developers.onemap.sg/commonapi/search?searchVal="
-        + str(postal)
-        + "&returnGeom=Y&getAddrDetails=Y&pageNum=1"
-    )
-    resultsdict = eval(req.text)
-    if len(resultsdict["results"]) > 0:
-        blk, street = (
-            resultsdict["results"][0]["BLK_NO"],
-            resultsdict["results"][0]["ROAD_NAME"],
-        )
-
-        ignore_short_forms = dl.get_close_matches(
-            street, hdb_details_df["street"].values
-        )[0]
-
-        row = hdb_details_df[
-            (hdb_details_df["blk_no"] == blk)
-            & (hdb_details_df["street"] == ignore_short_forms)
-        ]
-
-        # build dict of features
-        features["year"] = datetime.now().year
-        if features["Lease"] == "":
-            features["remaining_lease_year"] = features["year"] - row.iloc[0, -1]
-        else:
-            features["remaining_lease_year"] = features["year"] - int(features["Lease"])
-
-        if features["floor_area_sqm"] == "":
-            features["floor_area_sqm"] = AVG_AREA[int(features["flat_cat"])]
-
-        coords = np.array(
-            [
-                float(resultsdict["results"][0]["LATITUDE"]),
-                float(resultsdict["results"][0]["LONGITUDE"]),
-            ]
-        )
-        features["distance_to_town"] = (
-            np.linalg.norm(coords - np.array([1.300556, 103.821667])) * CONVERSION
-        )
-        features["distance_to_mrt"] = (
-            min(np.linalg.norm(coords - mrt_array, axis=1)) * CONVERSION
-        )
-        features["distance_to_mall"] = (
-            min(np.linalg.norm(coords - malls_array, axis=1)) * CONVERSION
-        )
-        features["number_of_malls"] = (
-            np.linalg.norm(coords - malls_array, axis=1) < RADIUS / CONVERSION
-        ).sum()
-
-        final_features = np.array(
-            [features[i] for i in REORDER_LIST], dtype=object
-        ).reshape(1, len(REORDER_LIST))
-        return final_features
@@ -0,0 +1,326 @@
+"""
+Versioned models for training and serving.
+
+Every trained model is published as its own version next to a metadata file with
+the features it was trained on, a hash of that feature list, how far the training
+data went and its evaluation report::
+
+    assets/models/registry/v0003/model.ubj
+    assets/models/registry/v0003/metadata.json
+    assets/models/registry/CURRENT
+
+Models are saved in xgboost's binary UBJSON format, which is a third smaller than
+JSON and loads in a fraction of the time since no text has to be parsed. Versions
+saved as JSON still load, the metadata names the model file.
+
+A version directory is written under a temporary name and renamed into place, and
+``CURRENT`` is replaced atomically afterwards, so a reader never sees a half
+written model. Serving processes hold a ``LiveModel``, which checks ``CURRENT`` at
+most every ``CHECK_INTERVAL`` seconds and swaps to a new version without a restart.
+A model trained on a different feature list than ``MODEL_FEATURES`` is refused:
+at startup with an error, and on reload by keeping the version being served.
+
+Before the registry, ``train.py`` overwrote ``assets/models/xgb_model.json``. An
+empty registry imports that file once as its first version, so a deploy that has
+not retrained since still starts.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import xgboost as xgb
+from src.utils.features import MODEL_FEATURES
+
+REGISTRY_DIR = "assets/models/registry"
+CURRENT_NAME = "CURRENT"
+MODEL_FILE = "model.ubj"
+# versions published before models were saved as UBJSON
+LEGACY_MODEL_FILE = "model.json"
+METADATA_FILE = "metadata.json"
+# the single model train.py wrote before models were versioned
+LEGACY_MODEL_PATH = "assets/models/xgb_model.json"
+KEEP_VERSIONS = 3
+CHECK_INTERVAL = 30  # seconds
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaMismatch(ValueError):
+    """
+    Raised when a model was trained on other features than serving builds.
+    """
+
+
+def feature_hash(features: Sequence[str] = MODEL_FEATURES) -> str:
+    """
+    Returns a hash of the feature names in order.
+    """
+    return hashlib.sha256(json.dumps(list(features)).encode()).hexdigest()[:16]
+
+
+class ModelRegistry:
+    """
+    Versioned models under ``root`` with a pointer to the one being served.
+
+    Methods:
+    --------
+    versions():
+        Returns the published versions, oldest first.
+
+    current():
+        Returns the version ``CURRENT`` points to, or None.
+
+    publish(booster, metrics, watermark, features, promote):
+        Saves a model as a new version and points ``CURRENT`` to it.
+
+    promote(version):
+        Points ``CURRENT`` to a version.
+
+    metadata(version):
+        Returns the metadata of a version.
+
+    load(version, features):
+        Returns the model and metadata of a version, checking its features.
+
+    prune(keep):
+        Deletes all but the latest versions and the current one.
+
+    import_legacy(path, features):
+        Publishes the model saved before the registry when there is no version yet.
+    """
+
+    def __init__(self, root: str = REGISTRY_DIR):
+        self.root = root
+        self.current_path = os.path.join(root, CURRENT_NAME)
+
+    def version_dir(self, version: str) -> str:
+        return os.path.join(self.root, version)
+
+    def versions(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name
+            for name in os.listdir(self.root)
+            if name.startswith("v") and os.path.isdir(self.version_dir(name))
+        )
+
+    def current(self) -> Optional[str]:
+        try:
+            with open(self.current_path, "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def publish(
+        self,
+        booster: xgb.Booster,
+        metrics: Dict = None,
+        watermark: Dict = None,
+        features: Sequence[str] = MODEL_FEATURES,
+        promote: bool = True,
+    ) -> str:
+        """
+        Saves a model as a new version.
+
+        Args:
+            booster (xgb.Booster): The trained model, with only the rounds to keep.
+            metrics (dict, optional): Its evaluation report.
+            watermark (dict, optional): How far the training data went.
+            features (Sequence[str]): The features in the order it was trained on.
+            promote (bool): Point ``CURRENT`` to the new version.
+
+        Returns:
+            str: The new version.
+        """
+        if booster.num_features() != len(features):
+            raise SchemaMismatch(
+                f"Model has {booster.num_features()} features, expected {len(features)}"
+            )
+        os.makedirs(self.root, exist_ok=True)
+        versions = self.versions()
+        version = f"v{int(versions[-1][1:]) + 1 if versions else 1:04d}"
+        metadata = {
+            "version": version,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "features": list(features),
+            "feature_hash": feature_hash(features),
+            "model_file": MODEL_FILE,
+            "watermark": watermark or {},
+            "metrics": metrics or {},
+            "xgboost": xgb.__version__,
+        }
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self.root)
+        try:
+            booster.save_model(os.path.join(tmp_dir, MODEL_FILE))
+            with open(os.path.join(tmp_dir, METADATA_FILE), "w", encoding="utf-8") as f:
+                json.dump(metadata, f, indent=2)
+            os.rename(tmp_dir, self.version_dir(version))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        if promote:
+            self.promote(version)
+        return version
+
+    def promote(self, version: str):
+        if not os.path.isdir(self.version_dir(version)):
+            raise KeyError(f"No model version {version}")
+        tmp_path = self.current_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(version + "\n")
+        os.replace(tmp_path, self.current_path)
+
+    def metadata(self, version: str) -> Dict:
+        path = os.path.join(self.version_dir(version), METADATA_FILE)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def load(
+        self, version: str = None, features: Sequence[str] = MODEL_FEATURES
+    ) -> Tuple[xgb.Booster, Dict]:
+        """
+        Loads a version, the current one by default.
+
+        Raises:
+            KeyError: There is no such version, or no current one.
+            SchemaMismatch: The version was trained on other features.
+        """
+        version = version or self.current()
+        if version is None or not os.path.isdir(self.version_dir(version)):
+            raise KeyError(f"No model version {version} in {self.root}")
+        metadata = self.metadata(version)
+        if metadata["feature_hash"] != feature_hash(features):
+            raise SchemaMismatch(
+                f"Model {version} was trained on {metadata['features']}, "
+                f"serving builds {list(features)}"
+            )
+        model_file = metadata.get("model_file", LEGACY_MODEL_FILE)
+        booster = xgb.Booster()
+        booster.load_model(os.path.join(self.version_dir(version), model_file))
+        return booster, metadata
+
+    def prune(self, keep: int = KEEP_VERSIONS) -> List[str]:
+        """
+        Deletes all but the latest ``keep`` versions, never the current one.
+
+        Returns:
+            list: The deleted versions.
+        """
+        current = self.current()
+        stale = [v for v in self.versions()[:-keep] if v != current]
+        for version in stale:
+            shutil.rmtree(self.version_dir(version))
+        return stale
+
+    def import_legacy(
+        self, path: str = None, features: Sequence[str] = MODEL_FEATURES
+    ) -> Optional[str]:
+        """
+        Publishes the model at ``path``, ``LEGACY_MODEL_PATH`` by default, as the
+        first version, unless the registry already has a version or there is no such
+        file.
+
+        Raises:
+            SchemaMismatch: The model has a different number of features.
+
+        Returns:
+            str: The new version, or None if nothing was imported.
+        """
+        path = path if path is not None else LEGACY_MODEL_PATH
+        if self.versions() or not os.path.exists(path):
+            return None
+        booster = xgb.Booster()
+        booster.load_model(path)
+        version = self.publish(booster, {"imported_from": path}, features=features)
+        logger.info("Imported %s as model %s", path, version)
+        return version
+
+
+class LiveModel:
+    """
+    The current model of a registry, swapped for a new version while serving.
+
+    The version, model and metadata are replaced together as one tuple, so a request
+    that already holds the model keeps predicting with it during a swap.
+
+    Methods:
+    --------
+    refresh(force):
+        Loads the current version if it changed since the last check.
+
+    predict(features):
+        Returns the predictions of the latest model for an array of features.
+    """
+
+    def __init__(
+        self,
+        registry: ModelRegistry = None,
+        features: Sequence[str] = MODEL_FEATURES,
+        check_interval: float = CHECK_INTERVAL,
+    ):
+        self.registry = registry if registry is not None else ModelRegistry()
+        self.features = list(features)
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.rejected = set()
+        if self.registry.current() is None:
+            self.registry.import_legacy(features=self.features)
+        # refuses to start without a model trained on these features
+        booster, metadata = self.registry.load(features=self.features)
+        self.state = (metadata["version"], booster, metadata)
+        self.next_check = time.monotonic() + check_interval
+
+    @property
+    def version(self) -> str:
+        return self.state[0]
+
+    @property
+    def booster(self) -> xgb.Booster:
+        return self.state[1]
+
+    @property
+    def metadata(self) -> Dict:
+        return self.state[2]
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Swaps to the current version of the registry if it changed. A version trained
+        on other features is logged and skipped.
+
+        Returns:
+            bool: Whether a new version is now served.
+        """
+        now = time.monotonic()
+        if not force and now < self.next_check:
+            return False
+        # another thread is already checking
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            self.next_check = now + self.check_interval
+            version = self.registry.current()
+            if version in (None, self.version) or version in self.rejected:
+                return False
+            try:
+                booster, metadata = self.registry.load(version, self.features)
+            except (KeyError, SchemaMismatch) as err:
+                logger.error("Keeping model %s: %s", self.version, err)
+                self.rejected.add(version)
+                return False
+            self.state = (version, booster, metadata)
+            logger.info("Serving model %s", version)
+            return True
+        finally:
+            self.lock.release()
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        self.refresh()
+        return self.booster.inplace_predict(features)
@@ -0,0 +1,237 @@
+"""
+Pre-aggregated resale price statistics for the plots.
+
+``assets/data/resale_rollup.parquet`` holds one row per year, month, town and flat
+type with the count and mean of ``resale_price``, a t-digest of its distribution and
+the number of flats sold within two years of their minimum occupation period. The
+plots only read this table, a few thousand rows, instead of grouping the whole
+history on every rerun.
+
+The table records the row count and checksum of every store partition it was
+computed from. An update compares them with the store manifest and only recomputes
+the months that changed, which after a normal update is the latest month or two::
+
+    python -m src.utils.rollup
+
+Coarser slices (by year, by town) are derived from the cells: counts are exact and
+quantiles come from merging the digests of the cells in the slice, with a rank error
+of about ``1 / compression``. Changing the compression rebuilds the table on the next
+update.
+"""
+import os
+import json
+from typing import List
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.utils.sketch import COMPRESSION, TDigest, compress_groups, group_quantiles
+from src.utils.storage import DATA_DIR, PartitionedStore
+
+ROLLUP_PATH = os.path.join(DATA_DIR, "resale_rollup.parquet")
+DIMENSIONS = ["year", "month", "town", "flat_type"]
+QUANTILES = {"p10": 0.1, "p25": 0.25, "median": 0.5, "p75": 0.75, "p90": 0.9}
+# remaining lease of a flat sold less than 2 years after its 5 year MOP
+MOP_LEASE_YEARS = 93
+SOURCES_KEY = b"partitions"
+COMPRESSION_KEY = b"compression"
+SOURCE_COLS = DIMENSIONS + ["resale_price", "remaining_lease_year"]
+
+
+def summarize(
+    df: pd.DataFrame,
+    compression: float = COMPRESSION,
+    dimensions: List[str] = DIMENSIONS,
+) -> pd.DataFrame:
+    """
+    Aggregates resale transactions into one row per cell.
+    """
+    df = df.assign(mop=df["remaining_lease_year"] > MOP_LEASE_YEARS)
+    grouped = df.groupby(dimensions, observed=True)
+    cells = grouped["resale_price"].agg(["count", "mean", "min", "max"])
+    cells["mop_count"] = grouped["mop"].sum()
+    prices = df["resale_price"].to_numpy(dtype=np.float64)
+    groups, means, weights = compress_groups(
+        grouped.ngroup().to_numpy(), prices, np.ones(len(prices)), compression
+    )
+    splits = np.flatnonzero(np.diff(groups)) + 1
+    cells["centroids"] = np.split(means, splits)
+    cells["weights"] = np.split(weights, splits)
+    cells = cells.reset_index()
+    for dim in dimensions:
+        if isinstance(cells[dim].dtype, pd.CategoricalDtype):
+            cells[dim] = cells[dim].astype(str)
+    return cells
+
+
+def empty_rollup(dimensions: List[str] = DIMENSIONS) -> pd.DataFrame:
+    columns = dimensions + ["count", "mean", "min", "max", "mop_count"]
+    return pd.DataFrame(columns=columns + ["centroids", "weights"])
+
+
+class ResaleRollup:
+    """
+    Resale price statistics per year, month, town and flat type.
+
+    Subclasses can keep other cells by overriding ``DIMENSIONS``, ``SOURCE_COLS``
+    and ``summarize``. The first two dimensions must be the year and month the store
+    is partitioned by.
+
+    Methods:
+    --------
+    update(store=None):
+        Recomputes the months whose store partitions changed. Returns the number of
+        months recomputed.
+
+    cells(**filters):
+        Returns the cells matching ``filters``, e.g. year=2017, town="BEDOK".
+
+    digest(**filters):
+        Returns the merged digest of the cells matching ``filters``.
+
+    slice(by, **filters):
+        Aggregates the cells matching ``filters`` by the ``by`` dimensions.
+
+    save():
+        Writes the table if it was modified.
+    """
+
+    DIMENSIONS = DIMENSIONS
+    SOURCE_COLS = SOURCE_COLS
+
+    def __init__(self, path: str = ROLLUP_PATH, compression: float = COMPRESSION):
+        """
+        Args:
+            path (str): The rollup parquet file.
+            compression (float): Compression of the cell digests, see
+                ``sketch.TDigest``.
+        """
+        self.path = path
+        self.compression = compression
+        self.modified = False
+        self.sources = {}
+        self.table = empty_rollup(self.DIMENSIONS)
+        if os.path.exists(path):
+            table = pq.read_table(path)
+            metadata = table.schema.metadata or {}
+            if float(metadata.get(COMPRESSION_KEY, b"nan")) == compression:
+                self.sources = {
+                    tuple(key): value
+                    for key, value in json.loads(metadata.get(SOURCES_KEY, b"[]"))
+                }
+                self.table = table.to_pandas()
+
+    def __len__(self):
+        return len(self.table)
+
+    def summarize(self, rows: pd.DataFrame) -> pd.DataFrame:
+        return summarize(rows, self.compression, self.DIMENSIONS)
+
+    def update(self, store: PartitionedStore = None) -> int:
+        store = store if store is not None else PartitionedStore()
+        summary = {
+            key: [totals["rows"], totals["checksum"]]
+            for key, totals in store.summary().items()
+        }
+        changed = [
+            key for key, value in summary.items() if self.sources.get(key) != value
+        ]
+        removed = [key for key in self.sources if key not in summary]
+        if not changed and not removed:
+            return 0
+
+        months = pd.MultiIndex.from_frame(self.table[["year", "month"]].astype(int))
+        parts = [self.table[~months.isin(changed + removed)]]
+        # a store read of no partitions has no columns to summarize
+        if changed:
+            rows = store.read(columns=self.SOURCE_COLS, partitions=changed)
+            parts.append(self.summarize(rows))
+        parts = [part for part in parts if not part.empty]
+        if parts:
+            self.table = pd.concat(parts, ignore_index=True)
+        else:
+            self.table = empty_rollup(self.DIMENSIONS)
+        self.table = self.table.sort_values(self.DIMENSIONS)
+        self.table = self.table.reset_index(drop=True)
+        self.sources = summary
+        self.modified = True
+        return len(changed) + len(removed)
+
+    def cells(self, **filters) -> pd.DataFrame:
+        cells = self.table
+        for dim, value in filters.items():
+            cells = cells[cells[dim] == value]
+        return cells
+
+    def merge(self, cells: pd.DataFrame, compress: bool = True) -> TDigest:
+        return TDigest.merge(
+            [
+                TDigest(means, weights, minimum, maximum, self.compression)
+                for means, weights, minimum, maximum in zip(
+                    cells["centroids"], cells["weights"], cells["min"], cells["max"]
+                )
+            ],
+            compress=compress,
+        )
+
+    def digest(self, **filters) -> TDigest:
+        return self.merge(self.cells(**filters))
+
+    def slice(self, by: List[str], **filters) -> pd.DataFrame:
+        """
+        Aggregates cells into coarser groups.
+
+        Args:
+            by (List[str]): Dimensions to group by, e.g. ["year"] or ["town"].
+            filters: Dimension values to keep, e.g. flat_type="4 ROOM".
+
+        Returns:
+            pd.DataFrame: count, mop_count and the quantiles of ``QUANTILES`` per
+                group.
+        """
+        cells = self.cells(**filters)
+        if cells.empty:
+            return pd.DataFrame(columns=by + ["count", "mop_count"] + list(QUANTILES))
+        grouped = cells.groupby(by)
+        result = grouped.agg(
+            count=("count", "sum"),
+            mop_count=("mop_count", "sum"),
+            minimum=("min", "min"),
+            maximum=("max", "max"),
+        )
+        # the merged digests are queried once, so their centroids are not compressed
+        lengths = cells["centroids"].map(len).to_numpy()
+        quantiles = group_quantiles(
+            np.repeat(grouped.ngroup().to_numpy(), lengths),
+            np.concatenate(cells["centroids"].to_list()),
+            np.concatenate(cells["weights"].to_list()),
+            result["minimum"],
+            result["maximum"],
+            list(QUANTILES.values()),
+        )
+        result[list(QUANTILES)] = quantiles
+        result = result.drop(columns=["minimum", "maximum"]).reset_index()
+        return result.astype({"count": int, "mop_count": int})
+
+    def save(self):
+        if not self.modified:
+            return
+        table = pa.Table.from_pandas(self.table, preserve_index=False)
+        sources = json.dumps(
+            [[list(key), value] for key, value in self.sources.items()]
+        )
+        metadata = {
+            **(table.schema.metadata or {}),
+            SOURCES_KEY: sources.encode(),
+            COMPRESSION_KEY: str(float(self.compression)).encode(),
+        }
+        tmp_path = self.path + ".tmp"
+        pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+        os.replace(tmp_path, self.path)
+        self.modified = False
+
+
+if __name__ == "__main__":
+    rollup = ResaleRollup()
+    print(f"Recomputed {rollup.update()} months, {len(rollup)} cells")
+    rollup.save()
@@ -0,0 +1,256 @@
+"""
+Mergeable quantile sketches.
+
+A ``TDigest`` summarizes a distribution with a bounded number of weighted centroids.
+Centroids are small near the tails and larger around the median, so quantiles keep a
+rank error of roughly ``1 / compression`` while the digest holds at most about
+``compression`` centroids however many values it summarizes. Digests of disjoint
+sets of values merge into the digest of their union, which lets the rollup keep one
+digest per cell and answer the median of any slice by merging the cells in it.
+
+Compression is done in one vectorized pass: the values are sorted, every value is
+mapped to its quantile on the arcsine scale of the t-digest paper, and the values
+falling in the same unit of that scale are merged into one centroid. The rollups
+hold thousands of small digests, so ``compress_groups`` and ``group_quantiles`` work
+on the centroids of many digests at once, labelled by an integer group code.
+"""
+from typing import Iterable, Sequence, Tuple, Union
+import numpy as np
+
+COMPRESSION = 100
+
+
+def scale(q: np.ndarray, compression: float) -> np.ndarray:
+    # k1 scale function, spans [0, compression] for q in [0, 1]
+    return compression * (np.arcsin(2 * q - 1) / np.pi + 0.5)
+
+
+def sort_groups(
+    groups: np.ndarray, means: np.ndarray, weights: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sorts centroids by group and mean.
+
+    Returns:
+        tuple: The sorted groups, means and weights, the cumulative weight of every
+            centroid within its group and the total weight of its group.
+    """
+    order = np.lexsort((means, groups))
+    groups, means, weights = groups[order], means[order], weights[order]
+    cumulative = np.cumsum(weights)
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    lengths = np.diff(np.r_[starts, len(groups)])
+    before = np.repeat(cumulative[starts] - weights[starts], lengths)
+    totals = np.repeat(np.add.reduceat(weights, starts), lengths)
+    return groups, means, weights, cumulative - before, totals
+
+
+def compress_groups(
+    groups: np.ndarray, means: np.ndarray, weights: np.ndarray, compression: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compresses the centroids of many digests at once.
+
+    Args:
+        groups (np.ndarray): Integer code of the digest of every centroid.
+        means (np.ndarray): Centroid means, or values with weights of 1.
+        weights (np.ndarray): Centroid weights.
+        compression (float): Compression of the digests.
+
+    Returns:
+        tuple: The groups, means and weights of the compressed centroids, sorted by
+            group and mean.
+    """
+    if not len(means):
+        return groups, means, weights
+    groups, means, weights, cumulative, totals = sort_groups(groups, means, weights)
+    # merge the centroids whose left edge falls in the same unit of the scale
+    units = np.floor(scale((cumulative - weights) / totals, compression))
+    starts = np.flatnonzero(
+        np.r_[True, (groups[1:] != groups[:-1]) | (units[1:] != units[:-1])]
+    )
+    merged_weights = np.add.reduceat(weights, starts)
+    merged_means = np.add.reduceat(means * weights, starts) / merged_weights
+    return groups[starts], merged_means, merged_weights
+
+
+def group_quantiles(
+    groups: np.ndarray,
+    means: np.ndarray,
+    weights: np.ndarray,
+    minimum: np.ndarray,
+    maximum: np.ndarray,
+    q: Sequence[float],
+) -> np.ndarray:
+    """
+    Estimates quantiles of many digests at once.
+
+    Args:
+        groups (np.ndarray): Integer code, from 0, of the digest of every centroid.
+        means (np.ndarray): Centroid means.
+        weights (np.ndarray): Centroid weights.
+        minimum (np.ndarray): Smallest value of every digest, indexed by code.
+        maximum (np.ndarray): Largest value of every digest, indexed by code.
+        q (Sequence[float]): Quantiles in [0, 1].
+
+    Returns:
+        np.ndarray: The quantiles of every digest, shape (len(minimum), len(q)).
+    """
+    minimum = np.asarray(minimum, dtype=np.float64)
+    maximum = np.asarray(maximum, dtype=np.float64)
+    result = np.full((len(minimum), len(q)), np.nan)
+    if not len(means):
+        return result
+    groups, means, weights, cumulative, totals = sort_groups(groups, means, weights)
+    centres = cumulative - weights / 2
+    # centres lie strictly inside (0, total), so group + centre / total increases
+    # along the sorted centroids and is searched in one pass per quantile
+    keys = groups + centres / totals
+    codes = np.unique(groups)
+    group_totals = np.zeros(len(minimum))
+    group_totals[codes] = np.add.reduceat(
+        weights, np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    )
+    for j, level in enumerate(q):
+        right = np.searchsorted(keys, codes + level, side="left")
+        left = right - 1
+        has_right = right < len(keys)
+        has_right[has_right] = groups[right[has_right]] == codes[has_right]
+        has_left = left >= 0
+        has_left[has_left] = groups[left[has_left]] == codes[has_left]
+        right, left = np.minimum(right, len(keys) - 1), np.maximum(left, 0)
+        target = level * group_totals[codes]
+        left_rank = np.where(has_left, centres[left], 0.0)
+        left_value = np.where(has_left, means[left], minimum[codes])
+        right_rank = np.where(has_right, centres[right], group_totals[codes])
+        right_value = np.where(has_right, means[right], maximum[codes])
+        span = np.where(right_rank > left_rank, right_rank - left_rank, 1.0)
+        fraction = np.clip((target - left_rank) / span, 0, 1)
+        result[codes, j] = left_value + (right_value - left_value) * fraction
+    return result
+
+
+class TDigest:
+    """
+    A merging t-digest.
+
+    Methods:
+    --------
+    from_values(values, compression=COMPRESSION):
+        Builds the digest of an array of values.
+
+    merge(digests, compression=None):
+        Returns the digest of the union of the values of several digests.
+
+    quantile(q):
+        Returns the estimated quantile(s) of the values.
+    """
+
+    def __init__(
+        self,
+        means: Sequence[float] = (),
+        weights: Sequence[float] = (),
+        minimum: float = np.nan,
+        maximum: float = np.nan,
+        compression: float = COMPRESSION,
+    ):
+        """
+        Args:
+            means (Sequence[float]): Centroid means, sorted.
+            weights (Sequence[float]): Number of values in every centroid.
+            minimum (float): Smallest value summarized.
+            maximum (float): Largest value summarized.
+            compression (float): Upper bound on the number of centroids, the rank
+                error of the quantiles is about its inverse.
+        """
+        self.means = np.asarray(means, dtype=np.float64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.compression = compression
+
+    def __len__(self):
+        return len(self.means)
+
+    @property
+    def count(self) -> int:
+        return int(self.weights.sum())
+
+    @classmethod
+    def from_values(
+        cls, values: Iterable[float], compression: float = COMPRESSION
+    ) -> "TDigest":
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return cls(compression=compression)
+        return cls._compress(
+            values,
+            np.ones(len(values)),
+            values.min(),
+            values.max(),
+            compression,
+        )
+
+    @classmethod
+    def merge(
+        cls,
+        digests: Sequence["TDigest"],
+        compression: float = None,
+        compress: bool = True,
+    ) -> "TDigest":
+        """
+        Args:
+            digests (Sequence[TDigest]): Digests of disjoint sets of values.
+            compression (float, optional): Defaults to the smallest compression of
+                the digests.
+            compress (bool): Merge the centroids down to the compression. A digest
+                only queried once is more accurate without, at the cost of holding
+                every centroid of the inputs.
+        """
+        digests = [digest for digest in digests if len(digest)]
+        if compression is None:
+            compression = min(
+                (digest.compression for digest in digests), default=COMPRESSION
+            )
+        if not digests:
+            return cls(compression=compression)
+        means = np.concatenate([digest.means for digest in digests])
+        weights = np.concatenate([digest.weights for digest in digests])
+        minimum = min(digest.minimum for digest in digests)
+        maximum = max(digest.maximum for digest in digests)
+        if not compress:
+            order = np.argsort(means, kind="stable")
+            return cls(means[order], weights[order], minimum, maximum, compression)
+        return cls._compress(means, weights, minimum, maximum, compression)
+
+    @classmethod
+    def _compress(
+        cls,
+        means: np.ndarray,
+        weights: np.ndarray,
+        minimum: float,
+        maximum: float,
+        compression: float,
+    ) -> "TDigest":
+        groups = np.zeros(len(means), dtype=np.int64)
+        _, means, weights = compress_groups(groups, means, weights, compression)
+        return cls(means, weights, minimum, maximum, compression)
+
+    def quantile(self, q: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """
+        Estimates quantiles by interpolating between the centroid centres.
+
+        Args:
+            q (float | np.ndarray): Quantile(s) in [0, 1].
+
+        Returns:
+            float | np.ndarray: NaN if the digest is empty.
+        """
+        if not len(self):
+            return np.full_like(np.asarray(q, dtype=np.float64), np.nan)[()]
+        total = self.weights.sum()
+        centres = np.cumsum(self.weights) - self.weights / 2
+        ranks = np.r_[0.0, centres, total]
+        values = np.r_[self.minimum, self.means, self.maximum]
+        return np.interp(np.asarray(q) * total, ranks, values)[()]
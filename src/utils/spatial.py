@@ -0,0 +1,102 @@
+"""
+Spatial index over the unique addresses of a transaction table.
+
+Searching nearby flats used to compute the distance from every row of the table to
+the query point. Many transactions share one address, so the index is built over
+unique addresses instead and each address maps to the positions of its rows. A
+radius query only touches the addresses that fall inside the radius.
+"""
+from typing import Tuple
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+class AddressIndex:
+    """
+    A haversine BallTree over unique addresses.
+
+    Methods:
+    --------
+    query_radius(lat, lon, radius_km):
+        Returns the row positions within ``radius_km`` of the point and their
+        distances in km.
+
+    nearby(df, lat, lon, radius_km, col_name="distance"):
+        Returns the matching rows of ``df`` with a distance column, without
+        modifying ``df``.
+    """
+
+    def __init__(self, df: pd.DataFrame, address_col: str = "address"):
+        """
+        Builds the index.
+
+        Args:
+            df (pd.DataFrame): Table with address, latitude and longitude columns. Row
+                positions returned by queries refer to this table.
+            address_col (str): Column used to group rows.
+        """
+        valid = (
+            df[address_col].notna() & df["latitude"].notna() & df["longitude"].notna()
+        ).to_numpy()
+        positions = np.flatnonzero(valid)
+        codes, uniques = pd.factorize(df[address_col].to_numpy()[valid])
+
+        # rows grouped by address, address i owns rows[offsets[i]:offsets[i + 1]]
+        order = np.argsort(codes, kind="stable")
+        self.rows = positions[order]
+        counts = np.bincount(codes, minlength=len(uniques))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.addresses = np.asarray(uniques)
+
+        coords = df[["latitude", "longitude"]].to_numpy(dtype=np.float64)
+        self.coords = coords[self.rows[self.offsets[:-1]]]
+        self.tree = BallTree(np.radians(self.coords), metric="haversine")
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def query_radius(
+        self, lat: float, lon: float, radius_km: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds all rows within a radius of a point.
+
+        Args:
+            lat (float): Latitude of the query point.
+            lon (float): Longitude of the query point.
+            radius_km (float): Search radius in km.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Row positions and their distances in km.
+        """
+        point = np.radians([[float(lat), float(lon)]])
+        indices, distances = self.tree.query_radius(
+            point, r=radius_km / EARTH_RADIUS_KM, return_distance=True
+        )
+        indices, distances = indices[0], distances[0] * EARTH_RADIUS_KM
+
+        # expand each address into its row range without a python loop
+        starts = self.offsets[indices]
+        lengths = self.offsets[indices + 1] - starts
+        shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        row_positions = self.rows[shifts + np.arange(lengths.sum())]
+        return row_positions, np.repeat(distances, lengths)
+
+    def nearby(
+        self,
+        df: pd.DataFrame,
+        lat: float,
+        lon: float,
+        radius_km: float,
+        col_name: str = "distance",
+    ) -> pd.DataFrame:
+        """
+        Returns the rows of ``df`` within a radius of a point as a new dataframe.
+        """
+        row_positions, distances = self.query_radius(lat, lon, radius_km)
+        results = df.iloc[row_positions].copy()
+        results[col_name] = distances
+        return results
@@ -0,0 +1,659 @@
+"""
+Columnar storage for the resale and rental datasets.
+
+The resale history lives under ``assets/data/resale`` as parquet files partitioned
+by year and month, the rental history under ``assets/data/rental`` partitioned by
+approval month::
+
+    assets/data/resale/year=2017/month=01/part-000001.parquet
+    assets/data/resale/_manifest.json
+
+Categorical columns are stored as dictionaries so readers get compact frames
+without re-parsing a large CSV. An update appends each new batch as new part files
+instead of rewriting the history, so it costs time proportional to the batch.
+
+The manifest lists the committed part files with their row counts and max ``_id``,
+and is replaced atomically after the files it references have been written. Readers
+load the manifest once and only read the files it lists, so they see a consistent
+snapshot even while an update is running. ``geo_coords_2017.csv`` can still be
+exported for compatibility.
+
+Rows ingested from the datastore carry a ``_hash`` of their upstream content. The
+manifest keeps the sum of the hashes of each file as a checksum, so per-partition
+row counts and checksums are known without reading the data, and ``upsert`` only
+rewrites the partitions holding rows whose content changed.
+"""
+import os
+import sys
+import glob
+import json
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+DATA_DIR = "assets/data"
+RESALE_DIR = os.path.join(DATA_DIR, "resale")
+RESALE_CSV = os.path.join(DATA_DIR, "geo_coords_2017.csv")
+RENTAL_DIR = os.path.join(DATA_DIR, "rental")
+RENTAL_CSV = os.path.join(DATA_DIR, "rental_flats.csv")
+
+INDEX_COL = "_id"
+HASH_COL = "_hash"
+PARTITION_COLS = ("year", "month")
+CATEGORICAL_COLS = ["town", "flat_type", "flat_model"]
+RENTAL_PARTITION_COLS = ("rent_approval_date",)
+RENTAL_CATEGORICAL_COLS = ["town", "flat_type"]
+# compact dtypes for the frames held in memory by the apps, columns that are not
+# listed keep their stored dtype
+RESALE_SCHEMA = {
+    "town": "category",
+    "flat_type": "category",
+    "flat_model": "category",
+    "block": "category",
+    "street_name": "category",
+    "address": "category",
+    "storey_range": "float32",
+    "floor_area_sqm": "float32",
+    "lease_commence_date": "int16",
+    "remaining_lease_year": "float32",
+    "resale_price": "float32",
+    "year": "int16",
+    "month": "int8",
+    "latitude": "float32",
+    "longitude": "float32",
+    "mrt": "int16",
+    "malls": "int16",
+    "dist_mrt": "float32",
+    "dist_malls": "float32",
+    "distance_to_town": "float32",
+    "flat_cat": "int8",
+}
+RENTAL_SCHEMA = {
+    "town": "category",
+    "flat_type": "category",
+    "block": "category",
+    "street_name": "category",
+    "address": "category",
+    "monthly_rent": "float32",
+    "latitude": "float32",
+    "longitude": "float32",
+}
+MANIFEST_NAME = "_manifest.json"
+LEGACY_FILE_NAME = "data.parquet"
+# partitions with more part files than this are merged by compact()
+MAX_PART_FILES = 8
+READ_RETRIES = 3
+
+
+class PartitionedStore:
+    """
+    An append-only parquet store partitioned by one or more columns.
+
+    Methods:
+    --------
+    manifest():
+        Returns the current manifest, the snapshot that readers see.
+
+    exists():
+        Returns True if at least one partition has been written.
+
+    partitions():
+        Returns the sorted keys of all written partitions.
+
+    max_id():
+        Returns the largest index value stored, or None if the store is empty.
+
+    summary():
+        Returns the row count and checksum of every partition from the manifest.
+
+    key_index(partitions=None):
+        Returns the ``_hash`` and partition of every stored row.
+
+    read(columns=None, partitions=None):
+        Reads the given partitions (all by default) into a single dataframe indexed
+        by ``_id``.
+
+    tail(n, columns=None):
+        Reads only the newest partitions needed to return the last ``n`` rows.
+
+    append(df):
+        Adds the rows of ``df`` as new part files.
+
+    upsert(df):
+        Inserts new rows and replaces rows whose ``_hash`` changed.
+
+    delete(ids):
+        Removes rows by ``_id``.
+
+    write(df, partitions=None):
+        Overwrites the partitions present in ``df`` (or only the given ones).
+
+    compact(max_files=MAX_PART_FILES):
+        Merges the part files of partitions with more than ``max_files`` files.
+
+    import_csv(path=None):
+        Builds the store from the legacy CSV file.
+
+    export_csv(path=None):
+        Writes the whole store back out as a CSV file.
+    """
+
+    def __init__(
+        self,
+        root: str = RESALE_DIR,
+        csv_path: str = RESALE_CSV,
+        partition_cols: Tuple[str, ...] = PARTITION_COLS,
+        categorical_cols: List[str] = None,
+        watermark_col: str = None,
+    ):
+        """
+        Args:
+            root (str): Directory of the store.
+            csv_path (str): Legacy CSV file used by import_csv and export_csv.
+            partition_cols (tuple): Columns the rows are partitioned by.
+            categorical_cols (list, optional): Columns stored as dictionaries.
+            watermark_col (str, optional): Column whose max value is recorded in the
+                manifest next to the max ``_id``.
+        """
+        self.root = root
+        self.csv_path = csv_path
+        self.partition_cols = tuple(partition_cols)
+        self.categorical_cols = (
+            CATEGORICAL_COLS if categorical_cols is None else categorical_cols
+        )
+        self.watermark_col = watermark_col
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+
+    def partition_dir(self, key: Tuple) -> str:
+        parts = [
+            f"{col}={value:02d}" if isinstance(value, int) else f"{col}={value}"
+            for col, value in zip(self.partition_cols, key)
+        ]
+        return os.path.join(*parts)
+
+    def manifest(self) -> Dict:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return self.scan_legacy()
+
+    def scan_legacy(self) -> Dict:
+        """
+        Builds a manifest for partitions written before the store had one.
+        """
+        pattern = os.path.join(self.root, "**", LEGACY_FILE_NAME)
+        files = []
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            relpath = os.path.relpath(path, self.root)
+            values = [part.split("=", 1)[1] for part in relpath.split(os.sep)[:-1]]
+            key = tuple(int(value) if value.isdigit() else value for value in values)
+            index = pq.read_table(path, columns=[INDEX_COL]).column(INDEX_COL)
+            files.append(
+                {
+                    "path": relpath,
+                    "partition": list(key),
+                    "rows": len(index),
+                    "max_id": pc.max(index).as_py(),
+                    "watermark": None,
+                    "checksum": 0,
+                    "hashed": 0,
+                }
+            )
+        return self.summarize({"version": 0, "files": files})
+
+    def summarize(self, manifest: Dict) -> Dict:
+        files = manifest["files"]
+        ids = [entry["max_id"] for entry in files if entry["max_id"] is not None]
+        watermarks = [
+            entry["watermark"] for entry in files if entry["watermark"] is not None
+        ]
+        manifest["rows"] = sum(entry["rows"] for entry in files)
+        manifest["max_id"] = max(ids) if ids else None
+        manifest["watermark"] = max(watermarks) if watermarks else None
+        return manifest
+
+    def partitions(self, manifest: Dict = None) -> List[Tuple]:
+        manifest = manifest if manifest is not None else self.manifest()
+        return sorted({tuple(entry["partition"]) for entry in manifest["files"]})
+
+    def exists(self) -> bool:
+        return len(self.manifest()["files"]) > 0
+
+    def max_id(self) -> Optional[int]:
+        return self.manifest()["max_id"]
+
+    def summary(self, manifest: Dict = None) -> Dict[Tuple, Dict[str, int]]:
+        """
+        Returns the rows, hashed rows and checksum of each partition. The checksum is
+        the sum of the row hashes modulo 2**64, so it does not depend on how the
+        rows are split into files.
+        """
+        manifest = manifest if manifest is not None else self.manifest()
+        partitions = {}
+        for entry in manifest["files"]:
+            totals = partitions.setdefault(
+                tuple(entry["partition"]), {"rows": 0, "hashed": 0, "checksum": 0}
+            )
+            totals["rows"] += entry["rows"]
+            totals["hashed"] += entry.get("hashed", 0)
+            totals["checksum"] = (
+                totals["checksum"] + entry.get("checksum", 0)
+            ) % 2**64
+        return partitions
+
+    def last_modified(self) -> float:
+        """
+        Returns when the store was last committed to, falling back to the legacy CSV
+        if the store has not been built yet.
+        """
+        if os.path.exists(self.manifest_path):
+            return os.path.getmtime(self.manifest_path)
+        return os.path.getmtime(self.csv_path)
+
+    def read(
+        self,
+        columns: Optional[List[str]] = None,
+        partitions: Optional[Iterable[Tuple]] = None,
+    ) -> pd.DataFrame:
+        """
+        Reads partitions into a dataframe.
+
+        Args:
+            columns (list, optional): Columns to load, all by default.
+            partitions (iterable, optional): Partition keys to load, all by default.
+
+        Returns:
+            pd.DataFrame: The requested rows indexed by ``_id``.
+        """
+        if columns is not None and INDEX_COL not in columns:
+            columns = [INDEX_COL] + list(columns)
+        if partitions is not None:
+            partitions = {tuple(key) for key in partitions}
+        for attempt in range(READ_RETRIES):
+            manifest = self.manifest()
+            paths = [
+                os.path.join(self.root, entry["path"])
+                for entry in manifest["files"]
+                if partitions is None or tuple(entry["partition"]) in partitions
+            ]
+            try:
+                tables = [read_file(path, columns) for path in paths]
+                break
+            except FileNotFoundError:
+                # a compaction removed a file after we loaded the manifest
+                if attempt == READ_RETRIES - 1:
+                    raise
+        if not tables:
+            return pd.DataFrame()
+        # part files written at different times may disagree on int/float columns,
+        # and files written before hashing have no _hash column
+        table = pa.concat_tables(tables, promote_options="permissive")
+        table = table.unify_dictionaries()
+        df = table.to_pandas(types_mapper=NULLABLE_TYPES.get).set_index(INDEX_COL)
+        return df.sort_index()
+
+    def key_index(self, partitions: Optional[Iterable[Tuple]] = None) -> pd.DataFrame:
+        """
+        Reads only the ``_hash`` and partition columns, indexed by ``_id``.
+        """
+        columns = [HASH_COL] + list(self.partition_cols)
+        df = self.read(columns=columns, partitions=partitions)
+        if df.empty:
+            df = pd.DataFrame(columns=columns, index=pd.Index([], name=INDEX_COL))
+        if HASH_COL not in df.columns:
+            df[HASH_COL] = pd.Series(pd.NA, index=df.index, dtype="UInt64")
+        return df
+
+    def tail(self, n: int, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Reads the last ``n`` rows without loading older partitions.
+        """
+        manifest = self.manifest()
+        rows = {}
+        for entry in manifest["files"]:
+            key = tuple(entry["partition"])
+            rows[key] = rows.get(key, 0) + entry["rows"]
+        selected, total = [], 0
+        for key in reversed(self.partitions(manifest)):
+            selected.append(key)
+            total += rows[key]
+            if total >= n:
+                break
+        return self.read(columns=columns, partitions=selected).tail(n)
+
+    def to_table(self, df: pd.DataFrame, schema: pa.Schema = None) -> pa.Table:
+        table = pa.Table.from_pandas(
+            df.reset_index(names=INDEX_COL), preserve_index=False
+        )
+        if schema is not None and set(schema.names) == set(table.column_names):
+            # keep the stored schema so that readers need not promote types
+            try:
+                table = table.select(schema.names).cast(schema)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                pass
+        return table
+
+    def write_parts(self, df: pd.DataFrame, version: int, schema: pa.Schema = None):
+        """
+        Writes one part file per partition of ``df`` and returns their manifest
+        entries. Nothing is visible to readers until the manifest is committed.
+        """
+        df = self.apply_schema(df)
+        entries = []
+        for key, part in df.groupby(list(self.partition_cols), observed=True):
+            key = key if isinstance(key, tuple) else (key,)
+            key = tuple(
+                value.item() if hasattr(value, "item") else value for value in key
+            )
+            relpath = os.path.join(
+                self.partition_dir(key), f"part-{version:06d}.parquet"
+            )
+            path = os.path.join(self.root, relpath)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            pq.write_table(self.to_table(part, schema), tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+            watermark = None
+            if self.watermark_col is not None:
+                watermark = part[self.watermark_col].max()
+                watermark = (
+                    watermark.item() if hasattr(watermark, "item") else watermark
+                )
+            hashes = (
+                part[HASH_COL].dropna().to_numpy(dtype=np.uint64)
+                if HASH_COL in part.columns
+                else np.array([], dtype=np.uint64)
+            )
+            entries.append(
+                {
+                    "path": relpath,
+                    "partition": list(key),
+                    "rows": len(part),
+                    "max_id": int(part.index.max()),
+                    "watermark": watermark,
+                    "checksum": checksum(hashes),
+                    "hashed": len(hashes),
+                }
+            )
+        return entries
+
+    def commit(self, manifest: Dict, entries: List[Dict], replaced: set = frozenset()):
+        """
+        Atomically publishes a new manifest with ``entries`` added and the files of
+        the ``replaced`` partitions removed, then deletes the replaced files.
+        """
+        kept, removed = [], []
+        for entry in manifest["files"]:
+            if tuple(entry["partition"]) in replaced:
+                removed.append(entry["path"])
+            else:
+                kept.append(entry)
+        new_manifest = self.summarize(
+            {"version": manifest["version"] + 1, "files": kept + entries}
+        )
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(new_manifest, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+        for relpath in removed:
+            path = os.path.join(self.root, relpath)
+            if os.path.exists(path):
+                os.remove(path)
+        return new_manifest
+
+    def schema(self, manifest: Dict) -> Optional[pa.Schema]:
+        if not manifest["files"]:
+            return None
+        return pq.read_schema(os.path.join(self.root, manifest["files"][-1]["path"]))
+
+    def append(self, df: pd.DataFrame) -> Dict:
+        """
+        Adds the rows of ``df`` to the store without touching the stored files.
+
+        Args:
+            df (pd.DataFrame): Rows indexed by ``_id`` with the partition columns.
+
+        Returns:
+            dict: The committed manifest.
+        """
+        manifest = self.manifest()
+        if df.empty:
+            return manifest
+        version = manifest["version"] + 1
+        entries = self.write_parts(df, version, self.schema(manifest))
+        return self.commit(manifest, entries)
+
+    def write(self, df: pd.DataFrame, partitions: Optional[Iterable[Tuple]] = None):
+        """
+        Overwrites partitions with the matching rows of ``df``.
+
+        Args:
+            df (pd.DataFrame): Rows indexed by ``_id`` with the partition columns.
+            partitions (iterable, optional): Only these partition keys are written,
+                and those without rows in ``df`` are emptied. By default every
+                partition present in ``df`` is written.
+        """
+        df = self.apply_schema(df)
+        if partitions is not None:
+            partitions = {tuple(key) for key in partitions}
+            df = df[self.partition_keys(df).isin(list(partitions))]
+        manifest = self.manifest()
+        version = manifest["version"] + 1
+        entries = self.write_parts(df, version, self.schema(manifest))
+        if partitions is None:
+            partitions = {tuple(entry["partition"]) for entry in entries}
+        return self.commit(manifest, entries, partitions)
+
+    def partition_keys(self, df: pd.DataFrame) -> pd.MultiIndex:
+        return pd.MultiIndex.from_frame(df[list(self.partition_cols)])
+
+    def upsert(self, df: pd.DataFrame) -> Dict[str, int]:
+        """
+        Inserts the new rows of ``df`` and replaces the stored rows whose ``_hash``
+        differs. Partitions that only gain new rows are appended to, the others are
+        rewritten, all in a single commit.
+
+        Args:
+            df (pd.DataFrame): Rows indexed by ``_id`` with a ``_hash`` column.
+
+        Returns:
+            dict: The number of rows inserted, updated and unchanged.
+        """
+        manifest = self.manifest()
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+        if df.empty:
+            return counts
+        max_id = manifest["max_id"]
+        if max_id is None or df.index.min() > max_id:
+            # only new rows, the common case for an incremental update
+            self.append(df)
+            counts["inserted"] = len(df)
+            return counts
+
+        stored = self.key_index()
+        stored = stored[~stored.index.duplicated(keep="last")]
+        known = stored.reindex(df.index)
+        present = df.index.isin(stored.index)
+        same_hash = known[HASH_COL].astype("UInt64") == df[HASH_COL].astype("UInt64")
+        unchanged = present & same_hash.fillna(False).to_numpy(dtype=bool)
+        df = df[~unchanged]
+        updated = df.index.isin(stored.index)
+        counts.update(
+            inserted=int((~updated).sum()),
+            updated=int(updated.sum()),
+            unchanged=int(unchanged.sum()),
+        )
+        if df.empty:
+            return counts
+
+        # partitions holding the old rows, and those receiving the updated rows, are
+        # rewritten; new rows in other partitions are appended
+        touched = set(self.partition_keys(stored.loc[df.index[updated]]))
+        touched |= set(self.partition_keys(df[updated]))
+        incoming = self.partition_keys(df).isin(list(touched))
+        rewritten = self.read(partitions=touched) if touched else df.iloc[:0]
+        rewritten = rewritten.drop(index=df.index, errors="ignore")
+        rows = pd.concat([rewritten, df[incoming], df[~incoming]])
+
+        version = manifest["version"] + 1
+        entries = self.write_parts(rows, version, self.schema(manifest))
+        self.commit(manifest, entries, touched)
+        return counts
+
+    def delete(self, ids: Iterable[int]) -> int:
+        """
+        Removes the rows with the given ``_id`` by rewriting their partitions.
+
+        Returns:
+            int: The number of rows removed.
+        """
+        stored = self.key_index()
+        ids = stored.index.intersection(pd.Index(ids))
+        if ids.empty:
+            return 0
+        touched = set(self.partition_keys(stored.loc[ids]))
+        rows = self.read(partitions=touched).drop(index=ids)
+        self.write(rows, partitions=touched)
+        return len(ids)
+
+    def compact(self, max_files: int = MAX_PART_FILES):
+        manifest = self.manifest()
+        counts = {}
+        for entry in manifest["files"]:
+            key = tuple(entry["partition"])
+            counts[key] = counts.get(key, 0) + 1
+        fragmented = [key for key, count in counts.items() if count > max_files]
+        for key in fragmented:
+            self.write(self.read(partitions=[key]))
+        return len(fragmented)
+
+    def apply_schema(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Casts the partition and categorical columns to their stored dtypes.
+        """
+        df = df.copy()
+        df.index.name = INDEX_COL
+        for col in self.partition_cols:
+            if pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = df[col].astype("int16")
+        for col in self.categorical_cols:
+            if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype("category")
+        return df
+
+    def import_csv(self, path: Optional[str] = None):
+        path = path or self.csv_path
+        df = pd.read_csv(path)
+        if INDEX_COL not in df.columns:
+            df = df.rename(columns={df.columns[0]: INDEX_COL})
+        self.write(df.set_index(INDEX_COL))
+
+    def export_csv(self, path: Optional[str] = None):
+        path = path or self.csv_path
+        df = self.read()
+        for col in self.categorical_cols:
+            if col in df.columns:
+                df[col] = df[col].astype(object)
+        df.to_csv(path)
+
+
+NULLABLE_TYPES = {pa.uint64(): pd.UInt64Dtype()}
+
+
+def checksum(hashes: np.ndarray) -> int:
+    """
+    Returns the sum of uint64 row hashes modulo 2**64.
+    """
+    return int(np.sum(hashes, dtype=np.uint64))
+
+
+def read_file(path: str, columns: Optional[List[str]] = None) -> pa.Table:
+    """
+    Reads a part file, skipping requested columns that it does not have.
+    """
+    if columns is not None:
+        names = pq.read_schema(path).names
+        columns = [col for col in columns if col in names]
+    return pq.read_table(path, columns=columns)
+
+
+def rental_store() -> PartitionedStore:
+    return PartitionedStore(
+        root=RENTAL_DIR,
+        csv_path=RENTAL_CSV,
+        partition_cols=RENTAL_PARTITION_COLS,
+        categorical_cols=RENTAL_CATEGORICAL_COLS,
+        watermark_col="rent_approval_date",
+    )
+
+
+def load_resale(columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Loads the resale dataset, preferring the parquet store over the legacy CSV.
+    """
+    store = PartitionedStore()
+    if store.exists():
+        return store.read(columns=columns).drop(columns=HASH_COL, errors="ignore")
+    df = pd.read_csv(RESALE_CSV, index_col=0)
+    return df if columns is None else df[columns]
+
+
+def load_rental() -> pd.DataFrame:
+    """
+    Loads the rental dataset indexed by ``rent_approval_date`` like the legacy CSV.
+    """
+    store = rental_store()
+    if store.exists():
+        df = store.read().drop(columns=HASH_COL, errors="ignore")
+        return df.reset_index().set_index("rent_approval_date")
+    return pd.read_csv(RENTAL_CSV, index_col=0)
+
+
+def apply_compact_dtypes(df: pd.DataFrame, schema: Dict[str, str]) -> pd.DataFrame:
+    """
+    Casts the columns of ``df`` in place to the dtypes of ``schema``. Integer
+    columns with missing values become float32 instead.
+    """
+    for col, dtype in schema.items():
+        if col not in df.columns:
+            continue
+        if pd.api.types.is_integer_dtype(dtype) and df[col].isna().any():
+            dtype = "float32"
+        df[col] = df[col].astype(dtype)
+    return df
+
+
+def load_compact_resale(columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Loads the resale dataset with the compact dtypes of ``RESALE_SCHEMA``.
+    """
+    return apply_compact_dtypes(load_resale(columns=columns), RESALE_SCHEMA)
+
+
+def load_compact_rental() -> pd.DataFrame:
+    """
+    Loads the rental dataset with the compact dtypes of ``RENTAL_SCHEMA``.
+    """
+    return apply_compact_dtypes(load_rental(), RENTAL_SCHEMA)
+
+
+def resale_last_modified() -> datetime:
+    return datetime.fromtimestamp(PartitionedStore().last_modified())
+
+
+if __name__ == "__main__":
+    # python -m src.utils.storage import|export [resale|rental]
+    if len(sys.argv) < 2 or sys.argv[1] not in ("import", "export"):
+        print("Usage: python -m src.utils.storage import|export [resale|rental]")
+        sys.exit(1)
+    dataset = sys.argv[2] if len(sys.argv) > 2 else "resale"
+    store = rental_store() if dataset == "rental" else PartitionedStore()
+    if sys.argv[1] == "import":
+        store.import_csv()
+    else:
+        store.export_csv()
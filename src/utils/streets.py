@@ -0,0 +1,99 @@
+"""
+Street name matching between OneMap and the HDB property information.
+
+OneMap returns street names in full ("ANG MO KIO AVENUE 10") while HDB abbreviates
+them ("ANG MO KIO AVE 10"). Both sides are normalized to the HDB abbreviations so
+most lookups are exact dict hits. The rest fall back to a trigram index that
+shortlists candidates before scoring them with difflib.
+"""
+import difflib as dl
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Iterable, Optional
+
+# full word -> abbreviation used by hdb-property-information.csv
+ABBREVIATIONS = {
+    "AVENUE": "AVE",
+    "BUKIT": "BT",
+    "CENTRAL": "CTRL",
+    "CLOSE": "CL",
+    "COMMONWEALTH": "C'WEALTH",
+    "CRESCENT": "CRES",
+    "DRIVE": "DR",
+    "ESTATE": "EST",
+    "GARDENS": "GDNS",
+    "HEIGHTS": "HTS",
+    "INDUSTRIAL": "IND",
+    "JALAN": "JLN",
+    "KAMPONG": "KG",
+    "LORONG": "LOR",
+    "MARKET": "MKT",
+    "NORTH": "NTH",
+    "PARK": "PK",
+    "PLACE": "PL",
+    "ROAD": "RD",
+    "SAINT": "ST.",
+    "SOUTH": "STH",
+    "STREET": "ST",
+    "TANJONG": "TG",
+    "TERRACE": "TER",
+    "UPPER": "UPP",
+}
+CUTOFF = 0.6  # same as difflib.get_close_matches
+CANDIDATES = 10
+
+
+def normalize_street(street: str) -> str:
+    """
+    Upper cases the street, collapses whitespace and abbreviates full words.
+    """
+    words = str(street).upper().split()
+    return " ".join(ABBREVIATIONS.get(word, word) for word in words)
+
+
+def trigrams(text: str) -> Counter:
+    text = f"  {text} "
+    return Counter(text[i : i + 3] for i in range(len(text) - 2))
+
+
+class StreetIndex:
+    """
+    Maps street names to the closest street in a fixed vocabulary.
+
+    Methods:
+    --------
+    match(street):
+        Returns the vocabulary street matching ``street``, or None. Results are kept
+        in an LRU cache.
+    """
+
+    def __init__(self, streets: Iterable[str], cache_size: int = 4096):
+        self.vocabulary = sorted(set(streets))
+        self.normalized = [normalize_street(street) for street in self.vocabulary]
+        self.exact = {}
+        for street, normalized in zip(self.vocabulary, self.normalized):
+            self.exact.setdefault(normalized, street)
+        self.postings = defaultdict(list)
+        for i, normalized in enumerate(self.normalized):
+            for gram in trigrams(normalized):
+                self.postings[gram].append(i)
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, street: str) -> Optional[str]:
+        normalized = normalize_street(street)
+        if normalized in self.exact:
+            return self.exact[normalized]
+
+        # shortlist by shared trigrams, then score the shortlist like difflib does
+        shared = Counter()
+        for gram in trigrams(normalized):
+            shared.update(self.postings.get(gram, ()))
+        matcher = dl.SequenceMatcher()
+        matcher.set_seq2(normalized)
+        best, best_score = None, 0.0
+        for i, _ in shared.most_common(CANDIDATES):
+            matcher.set_seq1(self.normalized[i])
+            score = matcher.ratio()
+            if score >= CUTOFF and score > best_score:
+                best, best_score = self.vocabulary[i], score
+        return best
@@ -0,0 +1,206 @@
+"""
+Keeps a store in sync with a datastore resource.
+
+Every record is stored with a hash of its upstream content in ``_hash``. Pages
+fetched after the last stored ``_id`` are upserted, so re-running an update or
+re-fetching a page never duplicates rows, and corrected rows replace the stored
+ones.
+
+Corrections and deletions of older rows do not move the last ``_id``, so they are
+found with ``diff``. It compares the row count of every stored month with the count
+upstream, one cheap request per month, and with ``checksum=True`` also fetches the
+months whose counts agree to compare their content hashes. The local counts and
+checksums come from the store manifest without reading any data. Only the months
+that differ are refetched by ``refresh``.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Tuple
+import numpy as np
+import pandas as pd
+from src.utils.datastore import DATASTORE_URL, Datastore
+from src.utils.storage import HASH_COL, INDEX_COL, PartitionedStore, checksum
+
+# fields of a datastore record that are not part of its content
+IGNORED_FIELDS = {INDEX_COL, HASH_COL, "_full_count", "rank"}
+
+
+def record_hashes(df: pd.DataFrame) -> np.ndarray:
+    """
+    Returns a uint64 hash of the upstream fields of every record.
+    """
+    columns = sorted(col for col in df.columns if col not in IGNORED_FIELDS)
+    return pd.util.hash_pandas_object(df[columns].astype(str), index=False).to_numpy(
+        dtype=np.uint64
+    )
+
+
+def month_of(key: Tuple) -> str:
+    """
+    Returns the upstream month of a partition key, (2017, 1) or ("2017-01",).
+    """
+    if len(key) == 2:
+        return f"{int(key[0])}-{int(key[1]):02d}"
+    return str(key[0])
+
+
+class DatastoreSync:
+    """
+    Upserts datastore records into a partitioned store.
+
+    Methods:
+    --------
+    run(batch_size=5000):
+        Upserts the records after the last stored ``_id``.
+
+    diff(checksum=False):
+        Returns the partitions whose rows differ from upstream.
+
+    refresh(partitions):
+        Refetches the given partitions and upserts or deletes the rows that changed.
+    """
+
+    def __init__(
+        self,
+        dataset: Datastore,
+        store: PartitionedStore,
+        prepare: Callable[[pd.DataFrame], pd.DataFrame],
+        month_field: str = "month",
+        id_offset: int = 0,
+        max_workers: int = 8,
+    ):
+        """
+        Args:
+            dataset (Datastore): The upstream resource.
+            store (PartitionedStore): The store to keep in sync.
+            prepare (Callable): Turns raw records indexed by the store ``_id`` into
+                stored rows, keeping the index and the ``_hash`` column.
+            month_field (str): Upstream field the store is partitioned by.
+            id_offset (int): Upstream ``_id`` minus the stored ``_id``.
+            max_workers (int): Concurrent requests when comparing months.
+        """
+        self.dataset = dataset
+        self.store = store
+        self.prepare = prepare
+        self.month_field = month_field
+        self.id_offset = id_offset
+        self.max_workers = max_workers
+
+    def frame(self, records: List[Dict]) -> pd.DataFrame:
+        df = pd.DataFrame(records)
+        df[HASH_COL] = record_hashes(df)
+        df[INDEX_COL] = df[INDEX_COL].astype(int) - self.id_offset
+        return df.set_index(INDEX_COL)
+
+    def ingest(self, records: List[Dict]) -> Dict[str, int]:
+        return self.store.upsert(self.prepare(self.frame(records)))
+
+    def run(self, batch_size: int = 5000) -> Dict[str, int]:
+        """
+        Fetches and upserts the records after the last stored ``_id``.
+
+        Returns:
+            dict: The number of rows inserted, updated and unchanged.
+        """
+        max_id = self.store.max_id()
+        last_id = max_id + self.id_offset if max_id is not None else 0
+        totals = {"inserted": 0, "updated": 0, "unchanged": 0}
+        for records in self.dataset.iter_batches(
+            last_id=last_id, batch_size=batch_size
+        ):
+            counts = self.ingest(records)
+            totals = {name: totals[name] + counts[name] for name in totals}
+            print(f"Stored {totals['inserted']} new records")
+        return totals
+
+    def upstream_checksum(self, month: str) -> Tuple[int, int]:
+        records = list(self.dataset.iter_records({self.month_field: month}))
+        if not records:
+            return 0, 0
+        return len(records), checksum(record_hashes(pd.DataFrame(records)))
+
+    def diff(self, checksum: bool = False) -> List[Tuple]:
+        """
+        Compares every stored partition with upstream.
+
+        Args:
+            checksum (bool): Also compare the content of the partitions whose row
+                counts agree. This fetches them, but skips preprocessing and writing.
+
+        Returns:
+            list: The partition keys that differ from upstream.
+        """
+        local = self.store.summary()
+        keys = sorted(local)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            counts = list(
+                pool.map(
+                    lambda key: self.dataset.count(**{self.month_field: month_of(key)}),
+                    keys,
+                )
+            )
+        changed = [
+            key for key, count in zip(keys, counts) if count != local[key]["rows"]
+        ]
+        if checksum:
+            same_count = [key for key in keys if key not in changed]
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                upstream = list(
+                    pool.map(
+                        lambda key: self.upstream_checksum(month_of(key)), same_count
+                    )
+                )
+            for key, (rows, digest) in zip(same_count, upstream):
+                # partitions stored before hashing never match and are backfilled
+                if local[key]["hashed"] != rows or local[key]["checksum"] != digest:
+                    changed.append(key)
+        return sorted(changed)
+
+    def refresh(self, partitions: Iterable[Tuple]) -> Dict[str, int]:
+        """
+        Refetches partitions, upserting changed rows and deleting the rows that no
+        longer exist upstream.
+
+        Returns:
+            dict: The number of rows inserted, updated, unchanged and deleted.
+        """
+        totals = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+        for key in partitions:
+            records = list(self.dataset.iter_records({self.month_field: month_of(key)}))
+            upstream = self.frame(records) if records else pd.DataFrame()
+            stored = self.store.key_index(partitions=[key])
+            removed = stored.index.difference(upstream.index)
+            totals["deleted"] += self.store.delete(removed)
+            if upstream.empty:
+                continue
+            # rows with an unchanged hash are skipped before the costly preprocessing
+            known = stored[HASH_COL].reindex(upstream.index).astype("UInt64")
+            same = (known == upstream[HASH_COL].astype("UInt64")).fillna(False)
+            changed = upstream[~same.to_numpy(dtype=bool)].copy()
+            totals["unchanged"] += len(upstream) - len(changed)
+            if not changed.empty:
+                counts = self.store.upsert(self.prepare(changed))
+                totals["inserted"] += counts["inserted"]
+                totals["updated"] += counts["updated"]
+            print(f"Refreshed {month_of(key)}: {totals}")
+        return totals
+
+
+def parse_args(description: str) -> argparse.Namespace:
+    """
+    Parses the command line shared by the updaters.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--base-url", default=DATASTORE_URL)
+    parser.add_argument("--resource-id", default=None)
+    parser.add_argument(
+        "--diff",
+        action="store_true",
+        help="refetch the months whose row counts differ from upstream",
+    )
+    parser.add_argument(
+        "--checksum",
+        action="store_true",
+        help="with --diff, also compare the content of every month",
+    )
+    return parser.parse_args()
@@ -0,0 +1,327 @@
+"""
+Streams the resale history into xgboost.
+
+Training on ``store.tail(10000)`` kept memory low but threw away most of the history.
+Here the 2012-2016 CSVs and every stored month are fed to xgboost one chunk at a
+time through a ``DataIter``. A ``QuantileDMatrix`` only keeps the quantized features
+(one byte per value with the default 256 bins), so memory grows with the number of
+rows by a small constant rather than holding every chunk as floats. With
+``external_memory=True`` the quantized pages are cached on disk instead, so memory
+stays flat as the history grows; on a few hundred thousand rows the paging costs
+more than it saves.
+
+The 2012-2016 CSVs have no coordinates; their amenity features are looked up from the
+address feature table and are missing for addresses it does not know, which the
+``hist`` tree method handles natively.
+"""
+import os
+import json
+import resource
+import tempfile
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from src.train import PredictProcessor
+from src.utils.features import MODEL_FEATURES, AddressFeatureTable
+from src.utils.preprocessing import Preprocessor
+from src.utils.storage import PartitionedStore
+
+LEGACY_CSVS = [
+    "assets/resale-flat-prices/resale-flat-prices-based-on-registration-date-from-mar-2012-to-dec-2014.csv",
+    "assets/resale-flat-prices/resale-flat-prices-based-on-registration-date-from-jan-2015-to-dec-2016.csv",
+]
+CHUNK_ROWS = 50_000
+VALIDATION_MONTHS = 3
+HOLDOUT_MONTHS = 3
+TARGET = "resale_price"
+
+Chunk = Tuple[pd.DataFrame, pd.Series]
+
+
+def to_features(df: pd.DataFrame) -> Chunk:
+    """
+    Returns the model features and the target of preprocessed rows with amenities.
+    """
+    flat_type = df["flat_type"].astype(str).str.upper()
+    flat_cat = flat_type.map(PredictProcessor.FLAT_CATEGORIES)
+    features = df.assign(flat_cat=flat_cat)[MODEL_FEATURES]
+    return features.astype(np.float32), df[TARGET].astype(np.float32)
+
+
+def legacy_chunks(
+    address_features: AddressFeatureTable,
+    paths: Sequence[str] = LEGACY_CSVS,
+    chunk_rows: int = CHUNK_ROWS,
+) -> Iterator[Chunk]:
+    """
+    Yields the 2012-2016 transactions, preprocessed and looked up in the address
+    feature table without geocoding.
+    """
+    preprocessor = Preprocessor()
+    for path in paths:
+        for df in pd.read_csv(path, chunksize=chunk_rows):
+            df = preprocessor(df)
+            yield to_features(df.join(address_features.lookup(df)))
+
+
+def store_chunks(store: PartitionedStore, partitions: List[Tuple]) -> Iterator[Chunk]:
+    """
+    Yields the stored transactions one month at a time.
+    """
+    columns = MODEL_FEATURES + ["flat_type", TARGET]
+    columns.remove("flat_cat")
+    for key in partitions:
+        yield to_features(store.read(columns=columns, partitions=[key]))
+
+
+def split_partitions(
+    store: PartitionedStore,
+    validation_months: int = VALIDATION_MONTHS,
+    holdout_months: int = HOLDOUT_MONTHS,
+) -> Tuple[List[Tuple], List[Tuple], List[Tuple]]:
+    """
+    Splits the stored months into training months, the ``validation_months`` used
+    for early stopping and the latest ``holdout_months`` used for scoring.
+
+    Raises:
+        ValueError: The store has no months left to train on.
+    """
+    partitions = store.partitions()
+    if len(partitions) <= validation_months + holdout_months:
+        raise ValueError(
+            f"Need more than {validation_months + holdout_months} stored months to "
+            f"train, validate and score, the store has {len(partitions)}"
+        )
+    split = len(partitions) - holdout_months
+    return (
+        partitions[: split - validation_months],
+        partitions[split - validation_months : split],
+        partitions[split:],
+    )
+
+
+class ChunkIter(xgb.DataIter):
+    """
+    Feeds the chunks of a generator function to xgboost, which calls ``reset`` and
+    iterates again for every pass it makes over the data.
+    """
+
+    def __init__(self, chunks: Callable[[], Iterator[Chunk]], cache_prefix=None):
+        self.chunks = chunks
+        self.iterator = None
+        self.rows = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data: Callable) -> bool:
+        if self.iterator is None:
+            self.iterator = self.chunks()
+            self.rows = 0
+        chunk = next(self.iterator, None)
+        if chunk is None:
+            return False
+        features, label = chunk
+        self.rows += len(features)
+        input_data(data=features, label=label)
+        return True
+
+    def reset(self):
+        self.iterator = None
+
+
+def history_matrix(
+    chunks: Callable[[], Iterator[Chunk]],
+    nthread: int = -1,
+    max_bin: int = 256,
+    ref: xgb.DMatrix = None,
+    cache_dir: str = None,
+) -> xgb.DMatrix:
+    """
+    Builds a quantized matrix from a generator function of chunks.
+
+    Args:
+        chunks (Callable): Returns a fresh iterator over (features, label) chunks.
+        nthread (int): Threads used to build the matrix, -1 for every core.
+        max_bin (int): Histogram bins per feature.
+        ref (xgb.DMatrix, optional): The training matrix, whose quantiles are
+            reused for a validation matrix.
+        cache_dir (str, optional): Cache the quantized pages in this directory,
+            which must outlive the matrix.
+
+    Returns:
+        xgb.DMatrix: A QuantileDMatrix, or an ExtMemQuantileDMatrix with a cache.
+    """
+    if cache_dir is not None:
+        return xgb.ExtMemQuantileDMatrix(
+            ChunkIter(chunks, cache_prefix=os.path.join(cache_dir, "cache")),
+            max_bin=max_bin,
+            nthread=nthread,
+            ref=ref,
+        )
+    return xgb.QuantileDMatrix(
+        ChunkIter(chunks), max_bin=max_bin, nthread=nthread, ref=ref
+    )
+
+
+def peak_rss_mb() -> float:
+    """
+    Returns the peak resident memory of this process in MB.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+BEST_PARAMS_PATH = "assets/models/best_params.json"
+EVALUATION_PATH = "assets/models/evaluation.json"
+# the error of the model is reported for every value of these columns
+GROUP_COLS = ["flat_type", "town"]
+# the parameters train.py has always used, with the hist tree method
+PARAMS = {
+    "objective": "reg:squarederror",
+    "tree_method": "hist",
+    "colsample_bytree": 0.8,
+    "learning_rate": 0.1,
+    "max_depth": 12,
+    "subsample": 0.6,
+    "eval_metric": "rmse",
+}
+NUM_ROUNDS = 200
+EARLY_STOPPING_ROUNDS = 10
+
+
+def tuned_params(path: str = BEST_PARAMS_PATH) -> Tuple[Dict, int]:
+    """
+    Returns the parameters and number of rounds to train with: the configuration
+    found by tune.py if there is one, ``PARAMS`` and ``NUM_ROUNDS`` otherwise.
+    Training still stops early, so the rounds are an upper bound.
+    """
+    if not os.path.exists(path):
+        return dict(PARAMS), NUM_ROUNDS
+    with open(path, "r", encoding="utf-8") as f:
+        best = json.load(f)
+    return {**PARAMS, **best["params"]}, max(NUM_ROUNDS, best["num_rounds"])
+
+
+def r2(y_true: np.ndarray, y_pred: np.ndarray) -> float:
+    residual = np.sum((y_true - y_pred) ** 2)
+    return float(1 - residual / np.sum((y_true - y_true.mean()) ** 2))
+
+
+def evaluation_report(
+    y_true: np.ndarray, y_pred: np.ndarray, groups: pd.DataFrame
+) -> Dict:
+    """
+    Scores the predictions of a trained model in one vectorized pass.
+
+    Training stops early on the built-in RMSE; R² and the business metrics are only
+    computed here, once.
+
+    Args:
+        y_true (np.ndarray): Actual resale prices.
+        y_pred (np.ndarray): Predicted resale prices.
+        groups (pd.DataFrame): The ``GROUP_COLS`` of every row.
+
+    Returns:
+        dict: Overall R², RMSE, MAE and MAPE, and the MAPE and row count of every
+            flat type and town.
+    """
+    y_true = np.asarray(y_true, dtype=np.float64)
+    errors = np.asarray(y_pred, dtype=np.float64) - y_true
+    pct_errors = np.abs(errors) / y_true
+    report = {
+        "rows": len(y_true),
+        "r2": r2(y_true, y_true + errors),
+        "rmse": float(np.sqrt(np.mean(errors**2))),
+        "mae": float(np.mean(np.abs(errors))),
+        "mape": float(np.mean(pct_errors)),
+    }
+    for col in groups.columns:
+        keys = groups[col].astype(str).to_numpy()
+        by_group = pd.Series(pct_errors).groupby(keys).agg(["mean", "count"])
+        report[f"mape_by_{col}"] = {
+            key: {"mape": float(row["mean"]), "rows": int(row["count"])}
+            for key, row in by_group.iterrows()
+        }
+    return report
+
+
+def save_report(report: Dict, path: str = EVALUATION_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def data_watermark(store: PartitionedStore) -> Dict:
+    """
+    Returns how far the data a model is trained on goes: the latest stored month and
+    the highest ``_id`` in the store.
+    """
+    year, month = store.partitions()[-1]
+    return {"latest_month": f"{int(year)}-{int(month):02d}", "max_id": store.max_id()}
+
+
+def train_full_history(
+    store: PartitionedStore = None,
+    address_features: AddressFeatureTable = None,
+    nthread: int = -1,
+    external_memory: bool = False,
+    legacy_paths: Sequence[str] = LEGACY_CSVS,
+) -> Tuple[xgb.Booster, Dict]:
+    """
+    Trains on every month but the latest ones. The ``VALIDATION_MONTHS`` before the
+    latest ``HOLDOUT_MONTHS`` are used for early stopping, and the holdout months only
+    for scoring, so the number of rounds is not picked on the months it is scored on.
+
+    Args:
+        store (PartitionedStore, optional): The resale store.
+        address_features (AddressFeatureTable, optional): Amenity features of the
+            2012-2016 addresses.
+        nthread (int): Threads for building the matrices and training.
+        external_memory (bool): Cache the training matrix on disk.
+        legacy_paths (Sequence[str]): The 2012-2016 CSVs, empty to skip them.
+
+    Returns:
+        Tuple[xgb.Booster, Dict]: The model and its ``evaluation_report`` on the
+            holdout months, with the number of training rows.
+    """
+    store = store if store is not None else PartitionedStore()
+    if address_features is None:
+        address_features = AddressFeatureTable()
+    train_partitions, validation, holdout = split_partitions(store)
+
+    def training_chunks():
+        yield from legacy_chunks(address_features, legacy_paths)
+        yield from store_chunks(store, train_partitions)
+
+    with tempfile.TemporaryDirectory(prefix="xgb-history-") as tmp_dir:
+        dtrain = history_matrix(
+            training_chunks, nthread, cache_dir=tmp_dir if external_memory else None
+        )
+        dvalid = history_matrix(
+            lambda: store_chunks(store, validation), nthread, ref=dtrain
+        )
+        dholdout = history_matrix(
+            lambda: store_chunks(store, holdout), nthread, ref=dtrain
+        )
+        params, num_rounds = tuned_params()
+        booster = xgb.train(
+            {**params, "nthread": nthread},
+            dtrain,
+            num_boost_round=num_rounds,
+            evals=[(dvalid, "validation")],
+            early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+            verbose_eval=False,
+        )
+        # keep the rounds up to the best one so the saved model predicts with them
+        booster = booster[: booster.best_iteration + 1]
+        y_true, y_pred = dholdout.get_label(), booster.predict(dholdout)
+        training_rows = dtrain.num_row()
+        del dtrain, dvalid, dholdout
+    # rows in the order store_chunks fed them
+    groups = pd.concat(
+        [store.read(columns=GROUP_COLS, partitions=[key]) for key in holdout],
+        ignore_index=True,
+    )
+    report = evaluation_report(y_true, y_pred, groups)
+    return booster, {**report, "training_rows": training_rows}
@@ -0,0 +1,125 @@
+import json
+import pandas as pd
+import pytest
+from src.utils.datastore import Datastore
+from src.utils.http_client import HttpClient
+from src.utils.sync import DatastoreSync
+
+
+class FakeDataset(Datastore):
+    COLLECTION_ID = 7
+
+    def __init__(self, *args, **kwargs):
+        self.selected = 0
+        super().__init__(*args, **kwargs)
+
+    def select_dataset(self, child_datasets):
+        self.selected += 1
+        return child_datasets[-1]
+
+
+def fake_datastore(records, child_datasets=("d_old", "d_new")):
+    """
+    Answers datastore_search like data.gov.sg over ``records``, sorted by _id.
+    """
+
+    def respond(path, params):
+        if path.startswith("/metadata/"):
+            body = {"collectionMetadata": {"childDatasets": list(child_datasets)}}
+            return 200, {"data": body}
+        rows = sorted(records, key=lambda record: record["_id"])
+        for field, value in json.loads(params.get("filters", "{}")).items():
+            rows = [row for row in rows if row[field] == value]
+        offset, limit = int(params.get("offset", 0)), int(params.get("limit", 100))
+        page = rows[offset : offset + limit]
+        return 200, {"success": True, "result": {"records": page, "total": len(rows)}}
+
+    return respond
+
+
+def make_records(ids):
+    return [{"_id": i, "month": f"2017-{i % 3 + 1:02d}", "price": i * 10} for i in ids]
+
+
+@pytest.fixture
+def dataset(stub_server, tmp_path):
+    def start(records, **kwargs):
+        stub = stub_server(fake_datastore(records))
+        return stub, FakeDataset(
+            base_url=stub.url + "/datastore_search",
+            client=HttpClient(max_retries=0),
+            metadata_url=stub.url + "/metadata/{}",
+            resources_path=str(tmp_path / "resources.json"),
+            **kwargs,
+        )
+
+    return start
+
+
+def ids_of(batches):
+    return [record["_id"] for batch in batches for record in batch]
+
+
+def test_base_class_requires_select_dataset():
+    with pytest.raises(TypeError):
+        Datastore(resource_id="d_any")
+
+
+def test_pages_through_every_record(dataset):
+    stub, ds = dataset(make_records(range(1, 24)), resource_id="d_new")
+    batches = list(ds.iter_batches(batch_size=5))
+    assert ids_of(batches) == list(range(1, 24))
+    assert [len(batch) for batch in batches] == [5, 5, 5, 5, 3]
+    assert {params["sort"] for _, params in stub.requests} == {"_id asc"}
+
+
+def test_resumes_after_last_id(dataset):
+    _, ds = dataset(make_records(range(1, 24)), resource_id="d_new")
+    assert ids_of(ds.iter_batches(last_id=17, batch_size=5)) == list(range(18, 24))
+    assert ids_of(ds.iter_batches(last_id=23, batch_size=5)) == []
+
+
+def test_resumes_after_upstream_deletions(dataset):
+    # ids 5-9 were deleted, so offset 15 would skip ids 16-20
+    ids = [i for i in range(1, 31) if not 5 <= i <= 9]
+    _, ds = dataset(make_records(ids), resource_id="d_new")
+    assert ids_of(ds.iter_batches(last_id=15, batch_size=4)) == list(range(16, 31))
+
+
+def test_counts_and_filters(dataset):
+    _, ds = dataset(make_records(range(1, 24)), resource_id="d_new")
+    assert ds.count(month="2017-02") == 8
+    records = list(ds.iter_records({"month": "2017-02"}, batch_size=3))
+    assert [record["_id"] for record in records] == list(range(1, 24, 3))
+
+
+def test_discovered_resource_is_cached(dataset):
+    _, ds = dataset(make_records(range(1, 4)))
+    assert ds._resource_id == "d_new" and ds.selected == 1
+    _, again = dataset(make_records(range(1, 4)))
+    assert again._resource_id == "d_new" and again.selected == 0
+
+
+class FakeStore:
+    def __init__(self, max_id):
+        self._max_id = max_id
+        self.frames = []
+
+    def max_id(self):
+        return self._max_id
+
+    def upsert(self, df):
+        self.frames.append(df)
+        return {"inserted": len(df), "updated": 0, "unchanged": 0}
+
+
+@pytest.mark.parametrize("max_id, expected", [(None, range(1, 24)), (9, range(11, 24))])
+def test_sync_resumes_from_the_stored_max_id(dataset, max_id, expected):
+    _, ds = dataset(make_records(range(1, 24)), resource_id="d_new")
+    store = FakeStore(max_id)
+    # stored _id is upstream _id - 1, like the resale store
+    sync = DatastoreSync(ds, store, prepare=lambda df: df, id_offset=1)
+    counts = sync.run(batch_size=5)
+    stored = pd.concat(store.frames)
+    assert list(stored.index) == [i - 1 for i in expected]
+    assert counts["inserted"] == len(expected)
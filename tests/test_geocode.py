@@ -0,0 +1,62 @@
+from src.utils.geocode import GeocodeCache, GeocodeResolver
+from src.utils.http_client import HttpClient
+
+KNOWN = {"1 BEACH RD": ("1.3001", "103.8601"), "2 BEACH RD": ("1.3002", "103.8602")}
+
+
+def onemap(path, params):
+    address = params["searchVal"]
+    if address == "BROKEN":
+        return 500, {"error": "down"}
+    if address in KNOWN:
+        lat, lon = KNOWN[address]
+        return 200, {"results": [{"LATITUDE": lat, "LONGITUDE": lon}]}
+    return 200, {"results": []}
+
+
+def make_resolver(stub, tmp_path):
+    return GeocodeResolver(
+        cache=GeocodeCache(str(tmp_path / "geocode.sqlite")),
+        base_url=stub.url + "/search",
+        client=HttpClient(max_retries=0),
+        max_workers=2,
+    )
+
+
+def test_resolves_through_the_stub_and_caches(stub_server, tmp_path):
+    stub = stub_server(onemap)
+    resolver = make_resolver(stub, tmp_path)
+
+    results = resolver.resolve_many(
+        ["1 beach rd", "1  BEACH RD", "2 BEACH RD", "NOWHERE", "BROKEN"]
+    )
+
+    assert results["1 beach rd"] == (1.3001, 103.8601)
+    assert results["1  BEACH RD"] == (1.3001, 103.8601)
+    assert results["2 BEACH RD"] == (1.3002, 103.8602)
+    assert results["NOWHERE"] is None
+    assert results["BROKEN"] is None
+    # duplicates are normalized away before fetching
+    searched = sorted(params["searchVal"] for _, params in stub.requests)
+    assert searched == ["1 BEACH RD", "2 BEACH RD", "BROKEN", "NOWHERE"]
+
+    stub.requests.clear()
+    assert resolver.resolve("2 beach rd") == (1.3002, 103.8602)
+    assert resolver.resolve("NOWHERE") is None
+    assert stub.requests == []
+
+
+def test_errors_are_retried_on_the_next_run(stub_server, tmp_path):
+    stub = stub_server(onemap)
+    resolver = make_resolver(stub, tmp_path)
+    resolver.resolve("BROKEN")
+    resolver.resolve("BROKEN")
+    assert [params["searchVal"] for _, params in stub.requests] == ["BROKEN"] * 2
+
+
+def test_cache_persists_across_resolvers(stub_server, tmp_path):
+    stub = stub_server(onemap)
+    make_resolver(stub, tmp_path).resolve("1 BEACH RD")
+    stub.requests.clear()
+    assert make_resolver(stub, tmp_path).resolve("1 BEACH RD") == (1.3001, 103.8601)
+    assert stub.requests == []
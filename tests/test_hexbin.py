@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+from src.utils.hexbin import ORIGIN, MapTiles, bin_prices, hex_index
+
+
+def transactions() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "latitude": [ORIGIN[0], ORIGIN[0] + 0.0001, np.nan, ORIGIN[0]],
+            "longitude": [ORIGIN[1], ORIGIN[1], ORIGIN[1], np.inf],
+            "resale_price": [400_000.0, 500_000.0, 1.0, 2.0],
+        }
+    )
+
+
+def test_hex_index_origin_cell():
+    q, r = hex_index(np.array([ORIGIN[0]]), np.array([ORIGIN[1]]))
+    assert (q[0], r[0]) == (0, 0)
+
+
+def test_bin_prices_drops_rows_without_coordinates():
+    cells = bin_prices(transactions())
+    assert cells[["q", "r", "count", "median"]].values.tolist() == [
+        [0, 0, 2, 450_000.0]
+    ]
+
+
+def test_map_tiles_drop_rows_without_coordinates(tmp_path):
+    rows = transactions().assign(
+        year=2024, month=1, flat_type="4 ROOM", remaining_lease_year=90
+    )
+    tiles = MapTiles(str(tmp_path / "map_tiles.parquet"))
+    summary = tiles.summarize(rows)
+    assert summary[["q", "r", "count"]].values.tolist() == [[0, 0, 2]]
@@ -0,0 +1,48 @@
+import pytest
+from src.utils.prediction import BatchPredictor
+
+FLAT = {"blk_no": "1", "street": "BEACH RD", "storey_range": 8, "flat_type": "4 room"}
+
+
+@pytest.mark.parametrize(
+    "flats",
+    [
+        [FLAT],
+        [
+            {
+                **FLAT,
+                "storey_range": "8",
+                "floor_area_sqm": "",
+                "lease_commence_date": 1990,
+            }
+        ],
+        [{k: v for k, v in FLAT.items() if k != "flat_type"} | {"flat_cat": "4"}],
+    ],
+)
+def test_valid_flats(flats):
+    BatchPredictor.validate(flats)
+
+
+@pytest.mark.parametrize(
+    "flats, message",
+    [
+        (None, "non-empty list"),
+        ({"flats": [FLAT]}, "non-empty list"),
+        ([], "non-empty list"),
+        (["1 BEACH RD"], "Flat 0 is not an object"),
+        ([FLAT, {**FLAT, "street": ""}], "Flat 1: missing field 'street'"),
+        ([{**FLAT, "street": 5}], "'street' must be a string"),
+        ([{**FLAT, "storey_range": "high"}], "'storey_range' must be a number"),
+        ([{**FLAT, "floor_area_sqm": [90]}], "'floor_area_sqm' must be a number"),
+        ([{**FLAT, "flat_type": "PENTHOUSE"}], "unknown flat_type 'PENTHOUSE'"),
+        ([{**FLAT, "flat_type": 4}], "unknown flat_type 4"),
+        ([{**FLAT, "flat_cat": 9}], "'flat_cat' must be one of"),
+        (
+            [{k: v for k, v in FLAT.items() if k != "flat_type"}],
+            "missing field 'flat_type' or 'flat_cat'",
+        ),
+    ],
+)
+def test_invalid_flats(flats, message):
+    with pytest.raises(ValueError, match=message):
+        BatchPredictor.validate(flats)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+import xgboost as xgb
+from src.utils.features import MODEL_FEATURES
+from src.utils.registry import LiveModel, ModelRegistry, SchemaMismatch
+import src.utils.registry as registry_module
+
+
+def train(num_features: int = len(MODEL_FEATURES)) -> xgb.Booster:
+    rng = np.random.default_rng(0)
+    X, y = rng.random((50, num_features)), rng.random(50)
+    return xgb.train({"max_depth": 2}, xgb.DMatrix(X, y), num_boost_round=2)
+
+
+def test_live_model_imports_legacy_model(tmp_path, monkeypatch):
+    legacy = tmp_path / "xgb_model.json"
+    train().save_model(str(legacy))
+    monkeypatch.setattr(registry_module, "LEGACY_MODEL_PATH", str(legacy))
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    model = LiveModel(registry)
+    assert model.version == "v0001"
+    assert model.metadata["metrics"] == {"imported_from": str(legacy)}
+    # imported once, later starts load the published version
+    assert registry.import_legacy(str(legacy)) is None
+    assert LiveModel(registry).version == "v0001"
+
+
+def test_import_legacy_keeps_existing_versions(tmp_path):
+    legacy = tmp_path / "xgb_model.json"
+    train().save_model(str(legacy))
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    registry.publish(train())
+    assert registry.import_legacy(str(legacy)) is None
+    assert registry.versions() == ["v0001"]
+
+
+def test_live_model_without_any_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry_module, "LEGACY_MODEL_PATH", str(tmp_path / "none"))
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    assert registry.import_legacy(str(tmp_path / "missing.json")) is None
+    with pytest.raises(KeyError):
+        LiveModel(registry)
+
+
+def test_import_legacy_refuses_other_features(tmp_path):
+    legacy = tmp_path / "xgb_model.json"
+    train(num_features=3).save_model(str(legacy))
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    with pytest.raises(SchemaMismatch):
+        registry.import_legacy(str(legacy))
+    assert registry.versions() == []
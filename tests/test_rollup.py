@@ -0,0 +1,42 @@
+import pandas as pd
+from src.utils.hexbin import ORIGIN, MapTiles
+from src.utils.rollup import ResaleRollup
+from src.utils.storage import INDEX_COL, PartitionedStore
+
+
+def transactions(ids, months) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "year": 2024,
+            "month": months,
+            "town": "BEDOK",
+            "flat_type": "4 ROOM",
+            "resale_price": 500_000.0,
+            "remaining_lease_year": 90.0,
+            "latitude": ORIGIN[0],
+            "longitude": ORIGIN[1],
+        },
+        index=pd.Index(ids, name=INDEX_COL),
+    )
+
+
+def test_update_after_a_month_is_deleted(tmp_path):
+    store = PartitionedStore(root=str(tmp_path / "resale"))
+    store.append(transactions([1, 2, 3], [1, 1, 2]))
+    for rollup in (
+        ResaleRollup(str(tmp_path / "rollup.parquet")),
+        MapTiles(str(tmp_path / "tiles.parquet")),
+    ):
+        assert rollup.update(store) == 2
+        assert sorted(rollup.table["month"].unique()) == [1, 2]
+        rollup.save()
+
+    store.delete([3])
+    for rollup in (
+        ResaleRollup(str(tmp_path / "rollup.parquet")),
+        MapTiles(str(tmp_path / "tiles.parquet")),
+    ):
+        # only the deleted month is dropped, no month changed
+        assert rollup.update(store) == 1
+        assert rollup.table["month"].tolist() == [1]
+        assert rollup.table["count"].tolist() == [2]
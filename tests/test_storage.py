@@ -0,0 +1,88 @@
+import pandas as pd
+import pytest
+from src.utils.storage import HASH_COL, INDEX_COL, PartitionedStore
+
+
+def rows(ids, months, prices, hashes=None) -> pd.DataFrame:
+    df = pd.DataFrame(
+        {
+            "year": 2024,
+            "month": months,
+            "town": "BEDOK",
+            "resale_price": prices,
+        },
+        index=pd.Index(ids, name=INDEX_COL),
+    )
+    if hashes is not None:
+        df[HASH_COL] = pd.array(hashes, dtype="UInt64")
+    return df
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PartitionedStore(root=str(tmp_path / "resale"))
+
+
+def test_upsert_replaces_rows_by_id(store):
+    store.upsert(rows([1, 2, 3], [1, 1, 2], [400.0, 500.0, 600.0], [11, 12, 13]))
+    # row 2 is corrected and moves to month 2, row 3 is unchanged
+    counts = store.upsert(rows([2, 3], [2, 2], [550.0, 600.0], [22, 13]))
+    assert counts == {"inserted": 0, "updated": 1, "unchanged": 1}
+
+    df = store.read()
+    assert df.index.tolist() == [1, 2, 3]
+    assert df.loc[2, "resale_price"] == 550.0
+    assert df.loc[2, "month"] == 2
+    assert store.read(partitions=[(2024, 1)]).index.tolist() == [1]
+    assert store.summary()[(2024, 1)] == {"rows": 1, "hashed": 1, "checksum": 11}
+    assert store.summary()[(2024, 2)] == {"rows": 2, "hashed": 2, "checksum": 35}
+
+
+def test_delete_removes_empty_partition_from_manifest(store):
+    store.upsert(rows([1, 2, 3], [1, 1, 2], [400.0, 500.0, 600.0], [11, 12, 13]))
+    assert store.delete([3, 99]) == 1
+    manifest = store.manifest()
+    assert store.partitions(manifest) == [(2024, 1)]
+    assert {tuple(entry["partition"]) for entry in manifest["files"]} == {(2024, 1)}
+    assert manifest["rows"] == 2
+    assert store.read().index.tolist() == [1, 2]
+
+
+def test_compact_keeps_rows_and_checksums(store):
+    for i in range(4):
+        store.append(rows([i + 1], [1], [100.0 * (i + 1)], [i + 1]))
+    before, summary = store.read(), store.summary()
+    assert len(store.manifest()["files"]) == 4
+
+    assert store.compact(max_files=2) == 1
+    assert len(store.manifest()["files"]) == 1
+    assert store.summary() == summary
+    pd.testing.assert_frame_equal(store.read(), before)
+
+
+def test_read_retries_after_compaction_removed_a_file(store, monkeypatch):
+    for i in range(3):
+        store.append(rows([i + 1], [1], [100.0], [i + 1]))
+    stale = store.manifest()
+    store.compact(max_files=1)
+
+    # the first manifest a reader loads lists the part files compact() deleted
+    manifests = iter([stale])
+    current = PartitionedStore.manifest
+    monkeypatch.setattr(
+        store, "manifest", lambda: next(manifests, None) or current(store)
+    )
+    assert store.read().index.tolist() == [1, 2, 3]
+
+
+def test_import_csv_without_id_column(store, tmp_path):
+    path = tmp_path / "resale.csv"
+    # the legacy CSV was written with an unnamed index holding the ids
+    rows([5, 6], [1, 2], [400.0, 500.0]).rename_axis(None).to_csv(path)
+    store.import_csv(str(path))
+
+    df = store.read()
+    assert df.index.name == INDEX_COL
+    assert df.index.tolist() == [5, 6]
+    assert list(df.columns) == ["year", "month", "town", "resale_price"]
+    assert store.partitions() == [(2024, 1), (2024, 2)]
@@ -0,0 +1,84 @@
+import difflib as dl
+import pandas as pd
+import pytest
+from src.utils.blocks import BlockRegistry
+from src.utils.features import HDB_INFO_PATH, AddressFeatureTable
+from src.utils.streets import ABBREVIATIONS, StreetIndex, normalize_street
+import src.utils.common_func as common_func
+
+EXPANSIONS = {abbreviation: word for word, abbreviation in ABBREVIATIONS.items()}
+# streets whose expanded name difflib matches to another street
+DIFFLIB_ERRORS = {
+    "MARSILING DR": "MARSILING RISE",
+    "TELOK BLANGAH DR": "TELOK BLANGAH RISE",
+}
+
+
+def expand(street: str) -> str:
+    # the long form OneMap returns, "AVE" -> "AVENUE"
+    return " ".join(EXPANSIONS.get(word, word) for word in street.split())
+
+
+@pytest.fixture(scope="module")
+def streets():
+    return pd.read_csv(HDB_INFO_PATH, usecols=["street"])["street"].values
+
+
+def test_index_matches_every_expanded_street(streets):
+    index = StreetIndex(streets)
+    unique = sorted(set(streets))
+    wrong = {street: index.match(expand(street)) for street in unique}
+    wrong = {street: match for street, match in wrong.items() if match != street}
+    assert wrong == {}
+
+
+def test_index_agrees_with_difflib(streets):
+    index = StreetIndex(streets)
+    unique = sorted(set(streets))
+    disagreements = {}
+    for street in unique:
+        query = expand(street)
+        # the duplicates in the HDB file do not change difflib's best match
+        close = dl.get_close_matches(query, unique)
+        if close and index.match(query) != close[0]:
+            disagreements[street] = (close[0], index.match(query))
+    # the only streets where the index differs are the ones difflib got wrong
+    assert disagreements == {
+        street: (wrong, street) for street, wrong in DIFFLIB_ERRORS.items()
+    }
+
+
+def test_unmatched_street_is_none(streets):
+    assert StreetIndex(streets).match("QQQQ XXXX ZZZZ") is None
+
+
+def test_info_parser_without_a_matching_street(stub_server, tmp_path, monkeypatch):
+    stub = stub_server(
+        lambda path, params: (
+            200,
+            {
+                "results": [
+                    {
+                        "BLK_NO": "5",
+                        "ROAD_NAME": "QQQQ AVENUE",
+                        "LATITUDE": "1.3",
+                        "LONGITUDE": "103.8",
+                    }
+                ]
+            },
+        )
+    )
+    monkeypatch.setattr(common_func, "ONEMAP_URL", stub.url)
+    address_features = AddressFeatureTable(path=str(tmp_path / "features.parquet"))
+    form = {
+        "Postal": "123456",
+        "Lease": "1990",
+        "floor_area_sqm": "90",
+        "flat_cat": "4",
+        "storey_range": "8",
+    }
+    row = common_func.info_parser(form, BlockRegistry(), address_features)
+    assert row is not None and row.notna().all(axis=None)
+    assert list(address_features.table.index) == [
+        f"5 {normalize_street('QQQQ AVENUE')}"
+    ]
@@ -0,0 +1,23 @@
+import pytest
+from src.utils.training import split_partitions
+
+
+class MonthStore:
+    def __init__(self, months: int):
+        self.months = [(2024, month) for month in range(1, months + 1)]
+
+    def partitions(self):
+        return self.months
+
+
+def test_split_partitions_keeps_splits_apart():
+    train, validation, holdout = split_partitions(MonthStore(8), 3, 3)
+    assert train == [(2024, 1), (2024, 2)]
+    assert validation == [(2024, 3), (2024, 4), (2024, 5)]
+    assert holdout == [(2024, 6), (2024, 7), (2024, 8)]
+
+
+@pytest.mark.parametrize("months", [0, 5, 6])
+def test_split_partitions_needs_training_months(months):
+    with pytest.raises(ValueError, match="stored months"):
+        split_partitions(MonthStore(months), 3, 3)